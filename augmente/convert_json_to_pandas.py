@@ -297,44 +297,51 @@ def prise_en_compte_modifications(df: pd.DataFrame, col_to_normalize: str = 'mod
     if col_to_normalize not in df.columns:
         raise ValueError("Il n'y a aucune colonne du nom de {} dans le dataframe entrée en paramètre".format(col_to_normalize))
     to_normalize = df[col_to_normalize]  # Récupération de la colonne à splitter
-    df["boolean"+col_suffix] = 0
-    for i in range(len(to_normalize)):  #pour chaque ligne de la colonne "modifications"
-        json_modification = to_normalize[i]
+    # Première modification de chaque ligne, clés renommées avec le suffixe
+    positions, records = [], []
+    for i, json_modification in enumerate(to_normalize.values):  #pour chaque ligne de la colonne "modifications"
         if type(json_modification)==dict:
             json_modification = [json_modification]
-        if type(json_modification) == list:
-            if json_modification != []:  # dans le cas où des modifications ont été apportées
-                if len(json_modification[0])>1:   # json_modification [0] est un dictionnaire. C'est le seul élément de la liste
-                    for col in json_modification[0].keys():
-                        col_init = col
-                        # Formatage du nom de la colonne
-                        if col_suffix not in col:
-                            col += col_suffix
-                        # Cas où on tombe sur le premier marche qui modifie un champ
-                        if col not in df.columns:  
-                            df[col] = "" # Initialisation dans le df initial
-                        #Cas particulier
-                        if (col == "objetModification") and (json_modification[0][col_init] != None) and (isinstance(json_modification[0][col_init], str)):
-                            df.at[i,col]= json_modification[0][col_init].replace("\n", "\\n").replace("\r", "\\r")
-                        else:
-                            df.at[i,col] = json_modification[0][col_init]    
-                        df.at[i,"boolean"+col_suffix] = 1  # Création d'une nouvelle colonne booléenne pour simplifier le subset pour la suite
-                       
-                else:
-                    if sub_element in json_modification[0] and isinstance(json_modification[0][sub_element],dict):
-                        for col in json_modification[0][sub_element].keys():
-                            col_init = col
-                            # Formatage du nom de la colonne
-                            if col_suffix not in col:
-                                col += col_suffix
-                            # Cas ou on tombe sur le premier marche qui modifie un champ
-                            if col not in df.columns:  
-                                df[col] = ""  # Initialisation dans le df initial
-                            if (col == "objetModification") and (json_modification[0][sub_element][col_init] != None) and (isinstance(json_modification[0][sub_element][col_init], str)):
-                                 df.at[i,col] = json_modification[0][sub_element][col_init].replace("\n", "\\n").replace("\r", "\\r")
-                            else:
-                                 df.at[i,col] = json_modification[0][sub_element][col_init]
-                            df.loc[i,"boolean"+col_suffix] = 1  # Création d'une booléenne pour simplifier le subset pour la suite
+        if type(json_modification) != list or json_modification == [] or not isinstance(json_modification[0], dict):
+            continue
+        if len(json_modification[0])>1:   # json_modification [0] est un dictionnaire. C'est le seul élément de la liste
+            modification = json_modification[0]
+        elif sub_element in json_modification[0] and isinstance(json_modification[0][sub_element],dict):
+            modification = json_modification[0][sub_element]
+        else:
+            continue
+        if modification:
+            positions.append(i)
+            # Formatage du nom de la colonne
+            records.append({(col if col_suffix in col else col + col_suffix): value for col, value in modification.items()})
+
+    df["boolean"+col_suffix] = 0
+    if not records:
+        return
+    labels = df.index[positions]
+    modifications = pd.DataFrame(records, index=labels, dtype=object)
+    # Clés présentes pour chaque ligne (une valeur None renseignée est conservée)
+    presentes = pd.DataFrame([dict.fromkeys(record, True) for record in records], index=labels, columns=modifications.columns).notna()
+
+    #Cas particulier
+    if "objetModification" in modifications.columns:
+        objet = modifications["objetModification"]
+        est_texte = objet.map(lambda x: isinstance(x, str))
+        modifications["objetModification"] = objet.where(~est_texte, objet[est_texte].str.replace("\n", "\\n", regex=False).str.replace("\r", "\\r", regex=False))
+
+    for col in modifications.columns:
+        valeurs = modifications.loc[presentes[col], col]
+        if col not in df.columns:
+            # Cas où la colonne n'existe pas : initialisation dans le df initial
+            colonne = np.full(len(df), "", dtype=object)
+            colonne[df.index.get_indexer(valeurs.index)] = valeurs.values
+            df[col] = colonne
+        else:
+            # Colonne existante : écriture cellule par cellule, pour que pandas convertisse les valeurs
+            # ou change le type de la colonne exactement comme auparavant
+            for label, valeur in valeurs.items():
+                df.at[label, col] = valeur
+    df.loc[labels, "boolean"+col_suffix] = 1  # Création d'une nouvelle colonne booléenne pour simplifier le subset pour la suite
 
 
 def regroupement_marche(df: pd.DataFrame, dict_modification: dict) -> pd.DataFrame:
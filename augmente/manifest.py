@@ -0,0 +1,69 @@
+"""
+Suivi des mois traités par decp-augmente.
+Pour chaque mois, le manifeste conserve l'empreinte du fichier results/global/decp-global-<mois>.json
+traité, celle de la configuration des règles (confs/var_glob.json), la version du code (CODE_VERSION)
+et la liste des fichiers csv produits. Un mois dont l'entrée n'a pas changé et dont les csv existent
+toujours n'est pas retraité : les csv de l'exécution précédente sont conservés.
+CODE_VERSION doit être incrémentée à chaque évolution des règles de decp-augmente.
+"""
+import json
+import logging
+import os
+from utils.UtilsFileCache import UtilsFileCache
+
+MANIFEST_PATH = os.path.join("old_metadata", "augmente", "manifest.json")
+CODE_VERSION = '1'
+CONF_PATH = os.path.join("confs", "var_glob.json")
+
+logger = logging.getLogger("main.manifest")
+
+
+def json_source(annee_mois:str) -> str:
+    return f"results/global/decp-global-{annee_mois}.json"
+
+
+def load() -> dict:
+    """Retourne le manifeste, vide s'il n'existe pas ou n'est pas lisible"""
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError) as err:
+        logger.warning(f"Manifeste {MANIFEST_PATH} illisible, tous les mois sont traités - {err}")
+        return {}
+
+
+def save(manifest:dict) -> None:
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def input_key(annee_mois:str, data_format:str) -> dict:
+    """Description des entrées du traitement d'un mois, None si le fichier du mois n'existe pas"""
+    path = json_source(annee_mois)
+    if not os.path.exists(path):
+        return None
+    return {'file': UtilsFileCache.file_hash(path),
+            'conf': UtilsFileCache.file_hash(CONF_PATH) if os.path.exists(CONF_PATH) else None,
+            'code': CODE_VERSION,
+            'data_format': data_format}
+
+
+def is_up_to_date(manifest:dict, annee_mois:str, key:dict) -> bool:
+    """Vrai si le mois a déjà été traité avec les mêmes entrées et que ses csv existent toujours"""
+    entry = manifest.get(annee_mois)
+    if key is None or entry is None or entry.get('input') != key:
+        return False
+    return all(os.path.exists(path) for path in entry.get('csv', []))
+
+
+def record(manifest:dict, annee_mois:str, key:dict, csv_files:list) -> None:
+    """Enregistre le traitement du mois (csv_files : fichiers csv du mois, seuls ceux produits sont conservés)"""
+    if key is None:
+        return
+    manifest[annee_mois] = {'input': key, 'csv': [path for path in csv_files if os.path.exists(path)]}
+    save(manifest)
@@ -10,20 +10,32 @@ import pandas as pd,csv
 import augmente.utils
 import time
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import augmente.convert_json_to_pandas
 from database.DbDecp import DbDecp
 from utils.StepMngmt import StepMngmt
 from utils.Step import Step
+from utils.UtilsJsonReader import UtilsJsonReader
+from utils.UtilsParties import UtilsParties
+from utils.UtilsCpv import UtilsCpv
+from utils.UtilsSiret import UtilsSiret
+from utils.UtilsWorker import UtilsWorker
 
 from stdnum import luhn
 from stdnum.exceptions import *
 from stdnum.fr import siren
 from stdnum.util import clean
+import psutil
 
 from reporting.Report import Report
 
 PATTERN_DATE = r'^20[1-3]{1}[0-9]{1}-[0-1]{1}[0-9]{1}-[0-3]{1}[0-9]{1}$'
 
+# Traitement parallèle des mois : mémoire utilisée par rapport à la taille du fichier json du mois
+# et part de la mémoire disponible réservée aux traitements en cours
+MEMORY_FACTOR = 10
+MEMORY_RATIO = 0.8
+
 
 logger = logging.getLogger("main.nettoyage2")
 logger.handlers.clear()
@@ -60,9 +72,12 @@ def main(session_id:str,annee_mois:str, data_format:str = '2022'):
         json_source = f"results/global/decp-global-{annee_mois}.json"
 
         logger.info(f"Chargement des données du fichier {json_source} au format {data_format}")
-        with open(json_source, 'rb') as f:
-            # c'est long de charger le json, je conseille de le faire une fois et de sauvegarder le df en pickle pour les tests
-            df = augmente.convert_json_to_pandas.manage_modifications(json.load(f),data_format)
+        # Lecture en flux du json : seuls les marchés sont décodés, sans charger le document entier.
+        # manage_modifications est appelée une seule fois sur l'ensemble des marchés : les identifiants
+        # techniques et les colonnes de modifications qu'elle crée doivent être communs à tout le mois
+        marches = [record for tag, record in UtilsJsonReader.iter_records(json_source, 'utf-8', ('marche',))]
+        df = augmente.convert_json_to_pandas.manage_modifications({'marches': {'marche': marches}},data_format)
+        del marches
         
         # load data from local
         args = augmente.utils.parse_args()
@@ -78,6 +93,73 @@ def main(session_id:str,annee_mois:str, data_format:str = '2022'):
 
         step.snapshot_dataframe(StepMngmt.SOURCE_ALL,Step.AUGMENTE_CLEAN,df)
 
+
+def main_months(session_id:str,months:list,data_format:str,workers:int,on_month_done=None):
+    """
+    Exécute main pour chaque mois de months dans un pool de workers processus.
+    Un mois n'est lancé que si la mémoire estimée des mois en cours (taille du fichier json
+    multipliée par MEMORY_FACTOR) reste inférieure à la mémoire disponible ; un mois est
+    toujours lancé si aucun autre n'est en cours. Les statistiques, messages et statuts d'étape
+    des processus sont fusionnés dans l'ordre des mois, puis le rapport est enregistré.
+    on_month_done(annee_mois) est appelé dans le processus principal à la fin de chaque mois.
+    Comme pour le traitement séquentiel, une erreur sur un mois interrompt le traitement : aucun
+    nouveau mois n'est lancé et la première erreur est levée une fois les mois en cours terminés.
+    """
+    budget = available_memory() * MEMORY_RATIO
+    estimates = {annee_mois: estimate_month_memory(annee_mois) for annee_mois in months}
+    logging.info(f"Traitement parallèle de {len(months)} mois avec {workers} processus (mémoire disponible estimée {budget/1048576:.0f} Mo)")
+    results = {}
+    errors = []
+    pending = list(months)
+    running = {}
+    # Les processus sont créés par fork : aucun point de reprise ne doit être en cours d'écriture
+    StepMngmt().flush()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            while pending and len(running) < workers and \
+                  (not running or sum(estimates[m] for m in running.values()) + estimates[pending[0]] <= budget):
+                annee_mois = pending.pop(0)
+                # Les compteurs du rapport sont affectés (et non cumulés) par main : pas de remise à zéro
+                running[executor.submit(UtilsWorker.run,None,main,session_id,annee_mois,data_format)] = annee_mois
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                annee_mois = running.pop(future)
+                try:
+                    results[annee_mois] = future.result()
+                    if on_month_done is not None:
+                        on_month_done(annee_mois)
+                except Exception as err:
+                    logging.error(f"Erreur du processus de traitement du mois {annee_mois} - {err}")
+                    errors.append(err)
+                    pending.clear()
+
+    # Rassemblement dans l'ordre des mois pour garder un résultat déterministe
+    for annee_mois in months:
+        if annee_mois in results:
+            _, statistics, messages, status = results[annee_mois]
+            UtilsWorker.merge(report,statistics,messages,status)
+    report.save()
+    if errors:
+        raise errors[0]
+
+
+def estimate_month_memory(annee_mois:str) -> int:
+    """Mémoire estimée (octets) du traitement d'un mois à partir de la taille de son fichier json"""
+    json_source = f"results/global/decp-global-{annee_mois}.json"
+    return os.path.getsize(json_source) * MEMORY_FACTOR if os.path.exists(json_source) else 0
+
+
+def available_memory() -> int:
+    """Mémoire disponible (octets)"""
+    return psutil.virtual_memory().available
+
+def csv_files(ref_date:str,data_format:str) -> list:
+    """Fichiers csv produits par manage_data_quality pour le mois ref_date"""
+    return [os.path.join(conf_data["path_to_data_dataeco"], f'marches-valides/marche-{data_format}-{ref_date}.csv'),
+            os.path.join(conf_data["path_to_data_dataeco"], f'concessions-valides/concession-{data_format}-{ref_date}.csv'),
+            os.path.join(conf_data["path_to_data_dataeco"], f'marches-invalides/marche-exclu-{data_format}-{ref_date}.csv'),
+            os.path.join(conf_data["path_to_data_dataeco"], f'concessions-invalides/concession-exclu-{data_format}-{ref_date}.csv')]
+
 def restore_nc(df,field):
     if 'backup__'+field in df.columns:
         df[field] = df.apply(lambda row: row['backup__'+field] if pd.isna(row[field]) or row['backup__'+field] == 'NC' else row[field], axis=1)
@@ -666,52 +748,13 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
         - Si même (id, idAcheteur, idTitulaire, dateNotification, Montant, datePublicationDonnees ) et même score, alors garder la dernière ligne du groupe par défaut
         """
 
-        def extract_values(row: list,data_format:str):
-            """
-            create 9 new columns with the values of the titulaires column
-
-            template for new col name : titulaires_ + col name + _ + value
-                - value is number from 1 to 3
-                - col name are : typeIdentifiant, id, denominationSociale
-
-            row contains a list of dict, each dict is a titulaires
-                - can be empty
-                - can contain 1, 2 or 3 titulaires or more keeping only 3 first
-                - if 1 value can be a dict and not a list of dict
-
-            :param row: the dataframe row to extract values from
-            :return: a new dataframe with the values of the titulaires column, new value are nan if not present
-            """
-            new_columns = {}
-            new_cols_names = ['denominationSociale', 'id', 'typeIdentifiant']
-            if data_format=='2022':
-                new_cols_names = ['id', 'typeIdentifiant']
-                
-            # create new columns all with nan value
-            for value in range(1, 4):
-                for col_name in new_cols_names:
-                    new_col_name = f'titulaire_{col_name}_{value}'
-                    new_columns[new_col_name] = np.nan
-
-            if isinstance(row, list):
-                row = row[:3]  # Keep only the first three concession
-            else:
-                # if row is not a list, then it is empty and for obscure reason script thinks it's a float so returning nan
-                return pd.Series(new_columns)
-
-            # fill new columns with values from concessionnaires column if exist
-            for value, concession in enumerate(row, start=1):
-                # replace value in new_columns by corresponding value in concession
-                for col_name in new_cols_names:
-                    col_to_fill = f'titulaire_{col_name}_{value}'
-                    # col_name is key in concession dict, col_to_fill is key in new_columns dict. get key value in col_name and put it in col_to_fill
-                    if concession:
-                        new_columns[col_to_fill] = concession.get('titulaire').get(col_name, np.nan)
-
-            return pd.Series(new_columns)
-
-
-        df = df["titulaires"].apply(extract_values,data_format=data_format).join(df)
+        # Colonnes titulaire_<champ>_<rang> des trois premiers titulaires
+        new_cols_names = ['denominationSociale', 'id', 'typeIdentifiant']
+        if data_format=='2022':
+            new_cols_names = ['id', 'typeIdentifiant']
+        titulaires = UtilsParties.explode(df["titulaires"], 'titulaire', new_cols_names, 3,
+                                          normalize=UtilsParties.normalize_titulaires)
+        df = titulaires.join(df)
 
         if "titulaires" in df.columns:
             df.drop(columns=["titulaires"], inplace=True)
@@ -829,7 +872,7 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
         return df
 
     @compute_execution_time
-    def marche_cpv(df: pd.DataFrame, cpv_2008_df: pd.DataFrame, data_format:str) -> pd.DataFrame:
+    def marche_cpv(df: pd.DataFrame, data_format:str) -> pd.DataFrame:
         """
         Le CPV comprend 10 caractères (8 pour la racine + 1 pour le séparateur « - » et +1 pour la clé) – format texte pour ne pas supprimer les « 0 » en début de CPV.
         Un code CPV est INEXPLOITABLE s’il n’appartient pas à la liste des codes CPV existants dans la nomenclature européenne 2008 des CPV
@@ -848,27 +891,10 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
         L'ordre de vérification est important. 
         Parameters :
             df (pd.DataFrame): dataframe to clean
-            cpv_2008_df: file cpv which is in the folder "data"
         Returns :
             df (pd.DataFrame): cleaned dataframe
         """
-        def get_cpv_key(cpv_root):
-            # check if CPV root exists in CPV 2008 database column "CODE" and only keep the first 8 characters
-            cpv_mask = cpv_2008_df["CODE"].str[:8] == cpv_root
-            cpv_key = cpv_2008_df.loc[cpv_mask, "CODE"].str[-1].values[0] if cpv_mask.any() else ""
-            return cpv_key
-
-        def get_cpv_key_with_dash(cpv_root):
-            # check if CPV root exists in CPV 2008 database column "CODE" and only keep the first 8 characters
-            cpv_mask = cpv_2008_df["CODE"].str[:8] == cpv_root
-            cpv_key = '-'+cpv_2008_df.loc[cpv_mask, "CODE"].str[-1].values[0] if cpv_mask.any() else ""
-            return cpv_key
-
-        def get_completed_key(cpv_root):
-            return '0'+cpv_root
-
-        #Dans le datafram cpv, on crée la colonne "CPV Root", contenant que les racines du code CPV
-        cpv_2008_df["CPV Root"] = cpv_2008_df["CODE"].str[:8]
+        # La nomenclature CPV 2008 (dossier "data") est indexée par UtilsCpv
 
         # Check if CPV is empty string
         not_empty_cpv_mask = df['codeCPV'] != ''
@@ -878,17 +904,17 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
         # First: zero in 1st position without  the key 
         complete_root_mask = df['codeCPV'].str.len() == 7
         cpv_roots = '0'+df.loc[complete_root_mask, 'codeCPV'].str[:7]
-        non_existing_roots_mask = ~cpv_roots.isin(cpv_2008_df["CPV Root"].values)
+        non_existing_roots_mask = ~UtilsCpv.is_root(cpv_roots)
         cpv_roots.loc[non_existing_roots_mask] = cpv_roots.loc[non_existing_roots_mask].str[1:8]
-        cpv_keys = cpv_roots.str[:8].apply(get_cpv_key_with_dash)
+        cpv_keys = UtilsCpv.keys(cpv_roots.str[:8], '-')
         df.loc[complete_root_mask, 'codeCPV'] = cpv_roots + cpv_keys
 
         # Secondly: zero in last position  without  the key 
         complete_root_mask = df['codeCPV'].str.len() == 7
         cpv_roots = df.loc[complete_root_mask, 'codeCPV'].str[:7]+'0'
-        non_existing_roots_mask = ~cpv_roots.isin(cpv_2008_df["CPV Root"].values)
+        non_existing_roots_mask = ~UtilsCpv.is_root(cpv_roots)
         cpv_roots.loc[non_existing_roots_mask] = cpv_roots.loc[non_existing_roots_mask].str[0:7]
-        cpv_keys = cpv_roots.str[:8].apply(get_cpv_key_with_dash)
+        cpv_keys = UtilsCpv.keys(cpv_roots.str[:8], '-')
         df.loc[complete_root_mask, 'codeCPV'] = cpv_roots + cpv_keys
 
         #Pattern and mask for the next check 
@@ -897,13 +923,13 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
         
         # First: zero in 1st position with  the key 
         cpv_roots = '0'+df.loc[complete_root_mask, 'codeCPV'].str[:9]
-        non_existing_roots_mask = ~cpv_roots.isin(cpv_2008_df["CODE"].values)
+        non_existing_roots_mask = ~UtilsCpv.is_code(cpv_roots)
         cpv_roots.loc[non_existing_roots_mask] = cpv_roots.loc[non_existing_roots_mask].str[1:10]
         df.loc[complete_root_mask, 'codeCPV'] = cpv_roots
 
         # Secondly: zero in last position  with  the key 
         cpv_roots = df.loc[complete_root_mask, 'codeCPV'].str[:7]+'0-'+  df.loc[complete_root_mask, 'codeCPV'].str[8]
-        non_existing_roots_mask = ~cpv_roots.isin(cpv_2008_df["CODE"].values)
+        non_existing_roots_mask = ~UtilsCpv.is_code(cpv_roots)
         cpv_roots.loc[non_existing_roots_mask] = cpv_roots.loc[non_existing_roots_mask].str[0:7]+'-'+cpv_roots.loc[non_existing_roots_mask].str[9]
         df.loc[complete_root_mask, 'codeCPV'] = cpv_roots
         
@@ -912,24 +938,22 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
         full_root = df['codeCPV'].str.len() == 10
         cpv_roots = df.loc[full_root, 'codeCPV'].str[:10]
         # Search for not existing record
-        non_existing_roots_mask = ~cpv_roots.isin(cpv_2008_df["CODE"].values)
+        non_existing_roots_mask = ~UtilsCpv.is_code(cpv_roots)
         cpv_roots.loc[non_existing_roots_mask] = cpv_roots.loc[non_existing_roots_mask].str[:8]
         df.loc[full_root, 'codeCPV'] = cpv_roots
 
         # Check if CPV root is complete
         complete_root_mask = df['codeCPV'].str.len() == 8
         cpv_roots = df.loc[complete_root_mask, 'codeCPV'].str[:8]
-        non_existing_roots_mask = ~cpv_roots.isin(cpv_2008_df["CPV Root"].values)
+        non_existing_roots_mask = ~UtilsCpv.is_root(cpv_roots)
         cpv_roots.loc[non_existing_roots_mask] = cpv_roots.loc[non_existing_roots_mask].str[:2] + '000000'
-        cpv_keys = cpv_roots.str[:8].apply(get_cpv_key)
+        cpv_keys = UtilsCpv.keys(cpv_roots.str[:8])
         df.loc[complete_root_mask, 'codeCPV'] = cpv_roots + '-' + cpv_keys
         
         if data_format=='2022':
             format_regex = r'^\d{8}-\d{1}$'
             complete_root_mask = ~df["codeCPV"].str.match(format_regex, na=False)
-            cpv_roots = df.loc[complete_root_mask, 'codeCPV'].str[:2]+'000000'
-            cpv_keys = cpv_roots.str[:8].apply(get_cpv_key_with_dash)
-            df.loc[complete_root_mask, 'codeCPV'] = cpv_roots + cpv_keys
+            df.loc[complete_root_mask, 'codeCPV'] = UtilsCpv.generic_codes(df.loc[complete_root_mask, 'codeCPV'])
 
         format_regex = r'^\d{8}-\d{1}$'
         erroned_root_mask = ~df["codeCPV"].str.match(format_regex, na=False)
@@ -1062,9 +1086,7 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
     df_marche_ = check_siret_ext(df_marche_, df_marche_badlines_, "titulaire",'IREP')
     df_marche_ = check_siret_ext(df_marche_, df_marche_badlines_, "titulaire",'HORS-UE')
 
-    df_cpv = pd.read_excel("data/cpv_2008_fr.xls", engine="xlrd")  #engine=openpyxl   xlrd
-
-    df_marche_ = marche_cpv(df_marche_, df_cpv, data_format)
+    df_marche_ = marche_cpv(df_marche_, data_format)
 
     #Champs ayant des listes
     df_marche_ = keep_more_recent(df_marche_,"modifications","Modification")
@@ -1074,9 +1096,6 @@ def regles_marche(df_marche_: pd.DataFrame,data_format:str) -> pd.DataFrame:
     replace_nc_colonne(df_marche_,'variationPrixActeSousTraitance')
     replace_nc_colonne(df_marche_,'dureeMoisActeSousTraitance',True)
 
-    # delete df_cpv to free memory
-    del df_cpv
-
     df_marche_ = check_duree_contrat(df_marche_, df_marche_badlines_, 180)
     if data_format=='2019':
         df_marche_ = marche_date_valid(df_marche_, df_marche_badlines_, data_format, "dateNotification")
@@ -1125,59 +1144,6 @@ def regles_concession(df_concession_: pd.DataFrame,data_format:str) -> pd.DataFr
         - Si même (id, idautoriteConcedante, idconcessionnaires, dateDebutExecution, valeurGlobale, datePublicationDonnees) et même score, alors garder la dernière ligne du groupe.
         """
 
-        def extract_values(row: list,data_format:str):
-            """
-            create 9 new columns with the values of the concessionnaires column
-
-            template for new col name : concessionnaire_ + col name + _ + value
-                - value is number from 1 to 3
-                - col name are : denominationSociale, id, typeIdentifiant
-
-            row contains a list of dict, each dict is a concessionnaire
-                - can be empty
-                - can contain 1, 2 or 3 concessionnaires or more keeping only 3 first
-                - if 1 value can be a dict and not a list of dict
-
-            :param row: the dataframe row to extract values from
-            :return: a new dataframe with the values of the concessionnaires column, new value are nan if not present
-            """
-            new_columns = {}
-            new_cols_names = ['denominationSociale', 'id', 'typeIdentifiant']
-            if data_format=='2022':
-                new_cols_names = ['id', 'typeIdentifiant']
-
-            # create new columns all with nan value
-            for value in range(1, 4):
-                for col_name in new_cols_names:
-                    new_col_name = f'concessionnaire_{col_name}_{value}'
-                    new_columns[new_col_name] = pd.NA
-
-            if isinstance(row, list):
-                # how is the list of concessionnaires
-                # if contain a dict where key is exactly : concessionnaire, then the list we want is the value of this dict key
-                if 'concessionnaire' in row[0].keys():
-                    row = [item['concessionnaire'] for item in row]
-                row = row[:3]  # Keep only the first three concession
-            else:
-                # if row is not a list, then it is empty and for obscure reason script thinks it's a float so returning nan
-                return pd.Series(new_columns)
-
-            # le traitement ici à lieux car comme on dit : "Garbage in, garbage out" mais on est gentil on corrige leurs formats -_-
-            # check if row is a list of list of dict, if so, keep only the first list
-            if isinstance(row[0], list):
-                row = row[0]
-
-            # fill new columns with values from concessionnaires column if exist
-            for value, concession in enumerate(row, start=1):
-                # replace value in new_columns by corresponding value in concession
-                for col_name in new_cols_names:
-                    col_to_fill = f'concessionnaire_{col_name}_{value}'
-                    # col_name is key in concession dict, col_to_fill is key in new_columns dict. get key value in col_name and put it in col_to_fill
-                    if concession:
-                        new_columns[col_to_fill] = concession.get(col_name, np.nan)
-
-            return pd.Series(new_columns)
-
         def extract_values_donnees_execution(row: list):
             """
             select the element the most recent in the donneesExecution column
@@ -1217,7 +1183,13 @@ def regles_concession(df_concession_: pd.DataFrame,data_format:str) -> pd.DataFr
         if data_format=='2022' and "concessionnaires.concessionnaire" in df.columns:
             df["concessionnaires"] = df["concessionnaires.concessionnaire"]
 
-        df = df["concessionnaires"].apply(extract_values,data_format=data_format).join(df)
+        # Colonnes concessionnaire_<champ>_<rang> des trois premiers concessionnaires
+        new_cols_names = ['denominationSociale', 'id', 'typeIdentifiant']
+        if data_format=='2022':
+            new_cols_names = ['id', 'typeIdentifiant']
+        concessionnaires = UtilsParties.explode(df["concessionnaires"], 'concessionnaire', new_cols_names, 3,
+                                                normalize=UtilsParties.normalize_concessionnaires, missing=pd.NA)
+        df = concessionnaires.join(df)
         df.drop(columns=["concessionnaires"], inplace=True)
 
         #Donnees execution
@@ -1376,32 +1348,51 @@ def regles_concession(df_concession_: pd.DataFrame,data_format:str) -> pd.DataFr
 
     return df_concession_, df_concession_badlines_
 
+# Colonnes renseignées à partir de l'élément le plus récent de chaque liste : colonne -> chemin dans l'élément
+COLUMNS_FROM_LIST = {
+    'actesSousTraitance': {
+        'idActeSousTraitance': ('id',),
+        'dureeMoisActeSousTraitance': ('dureeMois',),
+        'dateNotificationActeSousTraitance': ('dateNotification',),
+        'montantActeSousTraitance': ('montant',),
+        'variationPrixActeSousTraitance': ('variationPrix',),
+        'datePublicationDonneesActeSousTraitance': ('datePublicationDonnees',),
+        'idSousTraitant': ('sousTraitant', 'id'),
+        'typeIdentifiantSousTraitant': ('sousTraitant', 'typeIdentifiant')
+    },
+    'modifications': {
+        'idModification': ('id',),
+        'dureeMoisModification': ('dureeMoisActeSousTraitance',),
+        'montantModification': ('montant',),
+        'idTitulaireModification': ('titulaires', 0, 'id'),
+        'typeIdentifiantTitulaireModification': ('titulaires', 0, 'typeIdentifiant'),
+        'dateNotificationModificationModification': ('dateNotificationModification',),
+        'datePublicationDonneesModificationModification': ('datePublicationDonneesModification',)
+    },
+    'modificationsActesSousTraitance': {
+        'idModificationActeSousTraitance': ('id',),
+        'dureeMoisModificationActeSousTraitance': ('dureeMois',),
+        'dateNotificationModificationSousTraitanceModificationActeSousTraitance': ('dateNotificationModificationSousTraitance',),
+        'montantModificationActeSousTraitance': ('montant',),
+        'datePublicationDonneesModificationActeSousTraitance': ('datePublicationDonnees',)
+    }
+}
+
 def keep_more_recent(df:pd.DataFrame,field_name:str,suffix:str)-> pd.DataFrame:
     """
-    Cette fonction gère les champs qui ont une liste de dictionnaire. 
+    Cette fonction gère les champs qui ont une liste de dictionnaire.
+    Pour chaque ligne, seul l'élément le plus récent (datePublicationDonnees ou à défaut
+    datePublicationDonneesModification) est conservé et ses champs sont recopiés dans les
+    colonnes de COLUMNS_FROM_LIST. En cas d'égalité le dernier élément de la liste l'emporte ;
+    les éléments sans date ne sont retenus que si aucun élément de la liste n'est daté.
+    Les listes sont éclatées une seule fois (un élément par ligne) et l'élément retenu est
+    sélectionné par un groupby sur la ligne d'origine.
     """
-
-    #Sélectionner le dictionnaire ayant l'id le plus élevé
-    def comparer_dico(dico_un: dict, dico_deux:dict)->dict:
-        if dico_un is None:
-            return dico_deux
-        elif dico_deux is None:
-            return dico_un
-
-        date_une = dico_un.get("datePublicationDonnees", None) or dico_un.get("datePublicationDonneesModification", None)
-        date_deux = dico_deux.get("datePublicationDonnees", None) or dico_deux.get("datePublicationDonneesModification", None)
-
-        if date_une is None or (date_une <= date_deux):
-            return dico_deux
-        if date_deux is None or(date_une > date_deux):
-            return dico_un
-        
-    #Sélectionner le dictionnaire ayant la date la plus récente
-    
     if field_name in df.columns:
-        listes_non_vides = df[df[field_name].apply(lambda x: isinstance(x, list) and len(x) > 0)]
-        listes_vides = df[~df[field_name].apply(lambda x: isinstance(x, list) and len(x) > 0)]        
-        
+        non_vide = df[field_name].map(lambda x: isinstance(x, list) and len(x) > 0)
+        listes_non_vides = df[non_vide]
+        listes_vides = df[~non_vide]
+
         if not 'id'+suffix in listes_non_vides:
             listes_non_vides['id'+suffix] = ""
         else:
@@ -1414,61 +1405,90 @@ def keep_more_recent(df:pd.DataFrame,field_name:str,suffix:str)-> pd.DataFrame:
 
         if not 'datePublicationDonnees'+suffix in listes_non_vides:
             listes_non_vides['datePublicationDonnees'+suffix] = ""
-        else:
-            listes_non_vides['datePublicationDonnees'+suffix].astype(str)
 
-        #if not 'dureeMoisModificationActeSousTraitance' in listes_non_vides:
-        #    listes_non_vides['idModificationActeSousTraitance'] = ""
-        #else:
-        #    listes_non_vides['idModificationActeSousTraitance'].astype(str)
-            
-        #Parcourir chaque ligne du dataframe
-        for index, ligne in listes_non_vides.iterrows():
-            dico_plus_recent = {}
-            #Parcourir chaque liste 
-            for element in ligne[field_name]:
-                #Dictionnaire avec une seule clé dont la valeur est un dictionnaire
-                if isinstance(element,dict) and len(element.keys())==1:
-                    cle = list(element.keys())[0]
-                    dico_deux = element[cle]
-                    dico_plus_recent = comparer_dico(dico_plus_recent,dico_deux)
-                #Dictionaire avec plusieurs clés et valeurs
-                elif isinstance(element,dict):
-                    dico_plus_recent = comparer_dico(dico_plus_recent,element)
-            # Mettre à jour le DataFrame avec le dictionnaire le plus récent
-            listes_non_vides.at[index, field_name] = [dico_plus_recent] if dico_plus_recent else []
-            listes_non_vides = complete_columns_from_list(listes_non_vides,field_name,index,dico_plus_recent)
+        if listes_non_vides.empty:
+            return pd.concat([listes_non_vides, listes_vides], ignore_index=True)
+
+        # Eclatement des listes : un dictionnaire par élément, avec la position de sa ligne
+        lignes, elements, dates = [], [], []
+        for position, liste in enumerate(listes_non_vides[field_name].values):
+            for element in liste:
+                # Dictionnaire avec une seule clé dont la valeur est un dictionnaire
+                if isinstance(element, dict) and len(element.keys()) == 1:
+                    element = list(element.values())[0]
+                if isinstance(element, dict):
+                    lignes.append(position)
+                    elements.append(element)
+                    dates.append(element.get("datePublicationDonnees", None) or element.get("datePublicationDonneesModification", None))
+
+        # Rang de chaque élément : non daté < daté, puis date, puis position dans la liste
+        eclate = pd.DataFrame({'ligne': lignes,
+                               'date_renseignee': [date is not None for date in dates],
+                               'date': ['' if date is None else str(date) for date in dates]})
+        eclate['rang'] = 0
+        ordre = eclate.sort_values(['date_renseignee', 'date'], kind='stable').index
+        eclate.loc[ordre, 'rang'] = np.arange(len(eclate))
+        plus_recents = eclate.groupby('ligne')['rang'].idxmax()
+
+        dicos = np.empty(len(listes_non_vides), dtype=object)
+        for position in range(len(dicos)):
+            dicos[position] = {}
+        for position, element in zip(plus_recents.index, plus_recents.values):
+            dicos[position] = elements[element]
+
+        # Mettre à jour le DataFrame avec le dictionnaire le plus récent
+        listes = np.empty(len(dicos), dtype=object)
+        for position, dico in enumerate(dicos):
+            listes[position] = [dico] if dico else []
+        # Ecriture en place, comme write_column pour les colonnes texte existantes
+        listes_non_vides.loc[:, field_name] = pd.Series(listes, index=listes_non_vides.index, dtype=object)
+
+        for colonne, chemin in COLUMNS_FROM_LIST.get(field_name, {}).items():
+            listes_non_vides = write_column(listes_non_vides, colonne, [get_from_path(dico, chemin) for dico in dicos])
         df = pd.concat([listes_non_vides, listes_vides], ignore_index=True)
     return df
 
-def complete_columns_from_list(df:pd.DataFrame,field_name:str, ligne:int, dico: dict) -> pd.DataFrame:
-    if field_name=='actesSousTraitance':
-        df.loc[ligne, 'idActeSousTraitance'] = dico.get('id', None)
-        df.loc[ligne, 'dureeMoisActeSousTraitance'] = dico.get('dureeMois', None)
-        df.loc[ligne, 'dateNotificationActeSousTraitance'] = dico.get('dateNotification', None)
-        df.loc[ligne, 'montantActeSousTraitance'] = dico.get('montant', None)
-        df.loc[ligne, 'variationPrixActeSousTraitance'] = dico.get('variationPrix', None)
-        df.loc[ligne, 'datePublicationDonneesActeSousTraitance'] = dico.get('datePublicationDonnees', None)
-        df.loc[ligne, 'idSousTraitant'] = dico.get('sousTraitant', {}).get('id', None)
-        df.loc[ligne, 'typeIdentifiantSousTraitant'] = dico.get('sousTraitant', {}).get('typeIdentifiant', None)
-
-    if field_name=='modifications':
-        df.loc[ligne, 'idModification'] = dico.get('id', None)
-        df.loc[ligne, 'dureeMoisModification'] = dico.get('dureeMoisActeSousTraitance', None)
-        df.loc[ligne, 'montantModification'] = dico.get('montant', None) 
-        df.loc[ligne, 'idTitulaireModification'] = dico.get('titulaires', [{}])[0].get('id', None) 
-        df.loc[ligne, 'typeIdentifiantTitulaireModification'] = dico.get('titulaires', [{}])[0].get('typeIdentifiant', None)
-        df.loc[ligne, 'dateNotificationModificationModification'] = dico.get('dateNotificationModification', None)
-        df.loc[ligne, 'datePublicationDonneesModificationModification'] = dico.get('datePublicationDonneesModification', None)
-
-    if field_name=='modificationsActesSousTraitance':
-        df.loc[ligne, 'idModificationActeSousTraitance'] = dico.get('id', None)
-        df.loc[ligne, 'dureeMoisModificationActeSousTraitance'] = dico.get('dureeMois', None)
-        df.loc[ligne, 'dateNotificationModificationSousTraitanceModificationActeSousTraitance'] = dico.get('dateNotificationModificationSousTraitance', None)
-        df.loc[ligne, 'montantModificationActeSousTraitance'] = dico.get('montant', None)
-        df.loc[ligne, 'datePublicationDonneesModificationActeSousTraitance'] = dico.get('datePublicationDonnees', None)
+def write_column(df:pd.DataFrame, colonne:str, valeurs:list) -> pd.DataFrame:
+    """
+    Ecrit les valeurs (une par ligne, dans l'ordre des lignes) dans la colonne, avec le type
+    qu'aurait obtenu une écriture cellule par cellule (df.loc) :
+    - colonne texte, ou absente dont la première valeur n'est pas un nombre : valeurs telles quelles ;
+    - colonne float, ou absente dont la première valeur est un nombre : colonne float (None devient NaN)
+      jusqu'à la première valeur qui n'est ni un nombre ni None, la colonne devient alors texte ;
+    - autres colonnes (entiers, booléens...) : écriture cellule par cellule.
+    """
+    dtype = df[colonne].dtype if colonne in df.columns else None
+    nombres = (int, float, type(None))
+    if dtype == object:
+        # Ecriture en place, comme df.loc : la colonne reste dans le bloc des autres colonnes texte,
+        # sinon pd.concat remplace par NaN les None d'une colonne entièrement vide
+        df.loc[:, colonne] = pd.Series(valeurs, index=df.index, dtype=object)
+    elif dtype is None and type(valeurs[0]) not in (int, float):
+        df[colonne] = pd.Series(valeurs, index=df.index, dtype=object)
+    elif dtype is None or dtype == np.float64:
+        rang = next((rang for rang, valeur in enumerate(valeurs) if type(valeur) not in nombres), len(valeurs))
+        debut = [np.nan if valeur is None else float(valeur) for valeur in valeurs[:rang]]
+        if rang == len(valeurs):
+            df[colonne] = pd.Series(debut, index=df.index, dtype=np.float64)
+        else:
+            df[colonne] = pd.Series(debut + valeurs[rang:], index=df.index, dtype=object)
+    else:
+        for label, valeur in zip(df.index, valeurs):
+            df.loc[label, colonne] = valeur
     return df
 
+def get_from_path(dico:dict, chemin:tuple):
+    """Valeur de dico au chemin donné (clés de dictionnaire ou rangs de liste), None si absente"""
+    valeur = dico
+    for cle in chemin:
+        if isinstance(cle, int):
+            valeur = valeur[cle] if isinstance(valeur, list) and len(valeur) > cle else None
+        else:
+            valeur = valeur.get(cle, None) if isinstance(valeur, dict) else None
+        if valeur is None:
+            return None
+    return valeur
+
 def check_montant(df: pd.DataFrame, dfb: pd.DataFrame, col: str, montant : int = 15000000000) -> pd.DataFrame:
     """
     La valeur est jugée INEXPLOITABLE
@@ -1532,7 +1552,7 @@ def check_siret(df: pd.DataFrame, dfb: pd.DataFrame, col: str) -> pd.DataFrame:
     Si INEXPLOITABLE, le contrat est mis de côté.
     """
 
-    mask_bad_siret = ~df[col].apply(check_insee_field) #~df[col].astype(str).str.match("^[0-9]{14}$")
+    mask_bad_siret = ~UtilsSiret.is_valid(df[col]) #~df[col].astype(str).str.match("^[0-9]{14}$")
     df = df_add_error(df,mask_bad_siret,f"Numéro SIRET erroné pour le champ {col}")
 
     return df
@@ -1579,7 +1599,7 @@ def check_siret_ext_index(df: pd.DataFrame, dfb: pd.DataFrame, col: str, type:st
         mask_bad_col = (df[col_type]==type) & (~df[col_id].astype(str).str.match(expression))
         
         if type=='SIRET': # and (col_id=='titulaire_id_1' or col_id=='concessionnaire_id_1'):
-            mask_bad_col = (df[col_type]==type) & (~df[col_id].apply(check_insee_field))
+            mask_bad_col = (df[col_type]==type) & (~UtilsSiret.is_valid(df[col_id]))
             df = df_add_error(df,mask_bad_col,f"Numéro {type} erroné pour le champ {col} N°{index}")
 
         df = df_add_error(df,mask_bad_col,f"Numéro {type} erroné pour le champ {col} N°{index}")
@@ -1695,43 +1715,8 @@ def mark_mixed_field(df:pd.DataFrame, field_name:str) -> pd.DataFrame:
     et "orgineFrance". Selon la valeur du codeCPV, ces deux
     champs sont obligatoires. Donc ils doivent être tagués par "MQ".    
     """
-    # Transformation de la colonne CPV      
-    df_cpv = pd.read_excel("data/cpv_2008_fr.xls", engine="xlrd")
-    # Fix FutureWarning df_cpv['CODE'] = df_cpv['CODE'].replace("-", ".")
-    with pd.option_context("future.no_silent_downcasting", True):
-        df_cpv['CODE'] = df_cpv['CODE'].replace("-", ".").infer_objects(copy=False) #On souhaite  réaliser ue conversion numérique. Donc 
-                                                                                    #on remplace les "-" par les points.
-    df_cpv['CODE'] = pd.to_numeric(df_cpv['CODE'], errors='coerce')
-
-    #Liste des intervalles de codes 
-    codes_obligatoires = [
-    (15100000.9, 15982200.7),
-    (34100000.8, 34144910.0),
-    (34510000.5, 34522700.9),
-    (34600000.3, 34622500.8),
-    (34710000.7, 34722200.6),
-    (33100000.1, 33198200.6),
-    (33600000.6, 33698300.2),
-    (18100000.0, 18453000.9),
-    (18800000.7, 18843000.0)
-    ]
-
-    #Nous utiliserons cette variable pour le masque pour chacun des intervalles
-    masque_codes_obligatoires = pd.Series([False] * len(df_cpv))
-
-    #Mise à jour du masque
-    for debut, fin in codes_obligatoires:
-        masque_intervalle = (df_cpv['CODE'] >= debut) & (df_cpv['CODE'] <= fin)
-        masque_codes_obligatoires = masque_codes_obligatoires | masque_intervalle  #OU inclusif
-
-    #Obtention de du dataframe ayant les codes CPV où les champs "orgineFrance" et "origineUE" sont obligatoires
-    df_codes_obligatoires = df_cpv[masque_codes_obligatoires]
-    # Fix FutureWarning df_codes_obligatoires = df_codes_obligatoires['CODE'].replace(".", "-")
-    with pd.option_context("future.no_silent_downcasting", True):
-        df_codes_obligatoires = df_codes_obligatoires['CODE'].replace(".", "-").infer_objects(copy=False)
-    
-    #Selon la liste, nous allons marquer les colonnes "orgineFrance" et "origineUE" par le tag "MQ"
-    mandatory_code = df['codeCPV'].isin(df_codes_obligatoires.tolist())
+    #Selon la liste des codes CPV concernés (cf. UtilsCpv.ORIGIN_MANDATORY_RANGES), nous allons marquer les colonnes "orgineFrance" et "origineUE" par le tag "MQ"
+    mandatory_code = UtilsCpv.is_origin_mandatory(df['codeCPV'])
     empty_mixed  = (~pd.notna(df[field_name]) | pd.isnull(df[field_name]) | (df[field_name]=='') | \
                     (df[field_name]=='nan')) & mandatory_code
     if not empty_mixed.empty: 
@@ -1880,7 +1865,7 @@ def mark_bad_insee_field(df: pd.DataFrame,field_name:str,field_type:str = None)
         if field_type == None:
             empty_mandatory = pd.notna(df[field_name]) & ~pd.isnull(df[field_name]) &  \
                 ~df[field_name].astype(str).str.match(r'^(?:MQ|CDL|INX)', na=False, case=False) & \
-                (~df[field_name].str.match(pattern, na=False) | ~df[field_name].apply(check_insee_field))
+                (~df[field_name].str.match(pattern, na=False) | ~UtilsSiret.is_valid(df[field_name]))
             if not empty_mandatory.empty:
                 df.loc[empty_mandatory,field_name] = 'INX '+df.loc[empty_mandatory,field_name]
         else:
@@ -1888,7 +1873,7 @@ def mark_bad_insee_field(df: pd.DataFrame,field_name:str,field_type:str = None)
                 ~df[field_name].astype(str).str.match(r'^(?:MQ|CDL|INX)', na=False, case=False) & \
                 ((~df[field_type].astype(str).str.match('SIRET')) & (~df[field_type].astype(str).str.match('TVA')) \
                 & (~df[field_name].astype(str).str.match(pattern, na=False)) | \
-                ((df[field_type].astype(str).str.match('SIRET')) & (~df[field_name].apply(check_insee_field))) )
+                ((df[field_type].astype(str).str.match('SIRET')) & (~UtilsSiret.is_valid(df[field_name]))) )
             if not empty_mandatory.empty:
                 df.loc[empty_mandatory,field_name] = 'INX '+df.loc[empty_mandatory,field_name].astype(str)
     return df
@@ -47,6 +47,9 @@ def parse_args():
     parser.add_argument("-a", dest='augmente', action='store_true', help="Execute only decp-augmente")
     #parser.add_argument("-f", dest='format', type=str, help="run script for format 2019")
     parser.add_argument("-b", dest='rebuild', type=str, help="Rebuild a given year")
+    parser.add_argument("-w", dest='workers', type=int, default=1, help="Number of worker processes used to process sources in parallel")
+    parser.add_argument("-v", dest='validation_workers', type=int, default=1, help="Number of worker processes used to validate the records of a source file")
+    parser.add_argument("-M", dest='month_workers', type=int, default=1, help="Number of worker processes used to run decp-augmente months in parallel")
     return parser.parse_args()
 
 # Ne pas parser les arguments au niveau module pour éviter les conflits avec uvicorn
@@ -1,3 +1,6 @@
+import contextlib
+import csv
+import io
 import json
 import locale
 import logging
@@ -5,12 +8,13 @@ import os
 import psycopg2
 import pandas as pd
 from datetime import date
-from dotenv import load_dotenv
 from psycopg2 import sql
 from psycopg2.extras import execute_values, Json
 from os import environ as env
 
+from database.DbPool import DbPool
 from utils.UtilsJson import UtilsJson
+from utils.UtilsJsonWriter import UtilsJsonWriter
 
 logging.getLogger('db').propagate = False
 logger = logging.getLogger(__name__)
@@ -27,20 +31,46 @@ class DbDecp:
     ERROR_MESSAGE_SOURCE = "Une erreur s'est produite lors de la recherche ou de l'ajout de la source"
     ERROR_MESSAGE_FILE = "Une erreur s'est produite lors de la recherche ou de l'ajout du fichier :"
     ERROR_MESSAGE_SESSION_ERROR = "Une erreur s'est produite lors de la recherche ou de l'ajout d'un élément du rapport':"
+
+    # Tables extraites dans les fichiers json, dans l'ordre d'écriture
+    EXTRACT_TABLES = ('marche','concession')
+
+    # Description des tables pour l'ajout en masse (bulk_add_marche, bulk_add_concession)
+    BULK_MARCHE = {
+        'table': 'marche', 'doublon': 'marche_doublon', 'id': 'marche_id', 'doublon_id': 'marche_doublon_id',
+        'seq': 's_marche', 'seq_doublon': 's_marche_doublon',
+        'key': ['id', 'acheteur', 'titulaire', 'date_notification', 'montant'],
+        'key_types': ['text', 'text', 'text', 'date', 'numeric'],
+        'list': 'titulaires', 'len': 'titulaires',
+        'moved': ['marche_id', 'source_id', 'file_id', 'indx', 'id', 'acheteur', 'titulaire', 'titulaires', 'date_notification', 'montant', 'objet', 'max_date', 'date_creation', 'data_in', 'data_out', 'data_augmente', 'est_retenu'],
+        'error': ERROR_MESSAGE_MARCHE
+    }
+    BULK_CONCESSION = {
+        'table': 'concession', 'doublon': 'concession_doublon', 'id': 'concession_id', 'doublon_id': 'concession_doublon_id',
+        'seq': 's_concession', 'seq_doublon': 's_concession_doublon',
+        'key': ['id', 'autorite_concedante', 'concessionnaire', 'date_debut_execution', 'valeur_globale'],
+        'key_types': ['text', 'text', 'text', 'date', 'numeric'],
+        # add_concession compare la longueur de concessionnaire (et non concessionnaires) de l'enregistrement en entrée
+        'list': 'concessionnaires', 'len': 'concessionnaire',
+        'moved': ['concession_id', 'source_id', 'file_id', 'indx', 'id', 'autorite_concedante', 'concessionnaire', 'concessionnaires', 'date_debut_execution', 'valeur_globale', 'objet', 'max_date', 'date_creation', 'data_in', 'data_out', 'est_retenu'],
+        'error': ERROR_MESSAGE_CONCESSION
+    }
  
     # Constructeur
     def __init__(self):
-        # Chargement des variables d'environnement depuis le fichier .env
-        load_dotenv()
-
-        # Open database connection
-        self.connection = psycopg2.connect(
-            dbname=os.getenv('DECP.DB_NAME'),
-            user=os.getenv('DECP.DB_USER'),
-            password=os.getenv('DECP.DB_PASSWORD'),
-            host=os.getenv('DECP.DB_HOST', 'localhost'),
-            port=os.getenv('DECP.DB_PORT', '5432')
-        )
+        # Emprunt d'une connexion au pool du processus (cf. DbPool), rendue par close()
+        self.connection = DbPool.getconn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Filet de sécurité si close() n'a pas été appelé
+        if getattr(self, 'connection', None) is not None:
+            self.close()
 
     # Gestion des sessions
 
@@ -157,6 +187,57 @@ class DbDecp:
         return file_id
 
 
+    def find_file(self, file_name:str, file_date:str, source_id:int):
+        """
+        Recherche un fichier par son nom, sa date et sa source.
+        :param source_id: INT8, identifiant de la source
+        :return: file_id id de l'enregistrement trouvé, None sinon
+        """
+        file_id = None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT file_id FROM decp.file WHERE nom = %s and source_id = %s and file_date = %s", (file_name,source_id,file_date))
+            result = cursor.fetchone()
+            if result:
+                file_id = result[0]
+            self.connection.commit()
+
+        except Exception as e:
+            logging.error(self.ERROR_MESSAGE_FILE, e)
+        finally:
+            # Fermeture systématique du curseur après utilisation
+            cursor.close()
+
+        return file_id
+
+
+    def has_file_records(self, file_id:int, marche_ids:list, concession_ids:list) -> bool:
+        """
+        Vérifie que des marchés et concessions sont toujours présents en base et rattachés au fichier
+        (ils ont pu être purgés ou remplacés par l'enregistrement d'un fichier plus récent).
+        :param file_id: INT8, identifiant du fichier
+        :param marche_ids: identifiants des marchés (marche_id), les valeurs 0 (doublons) sont ignorées
+        :param concession_ids: identifiants des concessions (concession_id), les valeurs 0 sont ignorées
+        :return: True si tous les enregistrements sont présents, False sinon
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                for table, id_col, ids in (('marche', 'marche_id', marche_ids), ('concession', 'concession_id', concession_ids)):
+                    ids = list({id for id in ids if id})
+                    if not ids:
+                        continue
+                    cursor.execute(sql.SQL("SELECT count(*) FROM {table} WHERE file_id = %s AND {id_col} = ANY(%s)")
+                                   .format(table=sql.Identifier('decp', table), id_col=sql.Identifier(id_col)), (file_id, ids))
+                    if cursor.fetchone()[0] != len(ids):
+                        self.connection.commit()
+                        return False
+            self.connection.commit()
+            return True
+        except Exception as e:
+            logging.error(self.ERROR_MESSAGE_FILE, e)
+            return False
+
+
     def update_file(self, file_id:int, nb_marches_valides:int, nb_concessions_valides:int):
         """
         Recherche un fichier par son nom et sa source puis l'ajoute s'il n'existe pas.
@@ -293,6 +374,16 @@ class DbDecp:
 
         return marche_id
 
+    def bulk_add_marche(self, source_id, file_id, file_date, rows):
+        """
+        Ajout en masse des marchés d'un fichier, avec la même règle de dédoublonnage que add_marche
+        appliquée dans l'ordre des enregistrements du fichier.
+        :param rows: liste de tuples (index, id, acheteur, titulaire, titulaires, date_notification, montant, objet, max_date, json_data)
+                     où json_data est le marché déjà sérialisé en json
+        :return: liste des marche_id dans l'ordre de rows (0 pour un marché placé en doublon), None en cas d'erreur
+        """
+        return self._bulk_add(self.BULK_MARCHE, source_id, file_id, file_date, rows)
+
     def update_marche(self, marche_id, json_data):
         try:
             cursor = self.connection.cursor()
@@ -507,6 +598,147 @@ class DbDecp:
 
         return concession_id
 
+    def bulk_add_concession(self, source_id, file_id, file_date, rows):
+        """
+        Ajout en masse des concessions d'un fichier, avec la même règle de dédoublonnage que add_concession
+        appliquée dans l'ordre des enregistrements du fichier.
+        :param rows: liste de tuples (index, id, autorite_concedante, concessionnaire, concessionnaires, date_debut_execution, valeur_globale, objet, max_date, json_data)
+                     où json_data est la concession déjà sérialisée en json
+        :return: liste des concession_id dans l'ordre de rows (0 pour une concession placée en doublon), None en cas d'erreur
+        """
+        return self._bulk_add(self.BULK_CONCESSION, source_id, file_id, file_date, rows)
+
+    @staticmethod
+    def bulk_add_statuts(rows, file_date) -> dict:
+        """
+        Sort des enregistrements d'un fichier selon la règle de add_marche/add_concession, appliquée dans
+        l'ordre du fichier : un enregistrement est un doublon si l'enregistrement retenu pour sa clé (en base
+        ou plus tôt dans le fichier) a une date max_date postérieure à file_date ou une liste plus courte ;
+        sinon il est retenu et remplace l'enregistrement retenu précédent.
+        Comme dans add_concession, la longueur comparée (concessionnaire) peut différer de la longueur de la
+        liste enregistrée (concessionnaires), à laquelle sont comparés les enregistrements suivants.
+        :param rows: tuples (ord, clé, longueur comparée, max_date, présent en base, max_date en base,
+                     longueur de la liste en base, longueur de la liste), dans l'ordre du fichier
+        :return: dictionnaire ord -> (statut 'retenu', 'remplace' ou 'doublon', remplace un enregistrement en base)
+        """
+        current = {}
+        statuts = {}
+        for ord, grp, length, max_date, found, found_max_date, found_length, list_length in rows:
+            if grp not in current:
+                current[grp] = (None, found_max_date, found_length) if found else None
+            state = current[grp]
+            if state is not None and state[1] is not None and (file_date < state[1] or state[2] < length):
+                statuts[ord] = ('doublon', False)
+            else:
+                if state is not None and state[0] is not None:
+                    statuts[state[0]] = ('remplace', statuts[state[0]][1])
+                statuts[ord] = ('retenu', state is not None and state[0] is None)
+                current[grp] = (ord, max_date, list_length)
+        return statuts
+
+    def _bulk_add(self, conf:dict, source_id, file_id, file_date, rows):
+        """
+        Les enregistrements sont chargés par COPY dans une table temporaire. Les enregistrements déjà
+        présents en base pour les mêmes clés sont lus en une requête, le sort de chaque enregistrement
+        (retenu, remplacé par un enregistrement suivant du fichier, doublon) est calculé dans l'ordre du
+        fichier, puis les déplacements vers la table des doublons, suppressions et insertions sont faits
+        par des requêtes ensemblistes dans une seule transaction.
+        """
+        if len(rows) == 0:
+            return []
+        key = sql.SQL(' AND ').join(sql.SQL("e.{c} = t.{c}").format(c=sql.Identifier(c)) for c in conf['key'])
+        table = sql.Identifier('decp', conf['table'])
+        doublon = sql.Identifier('decp', conf['doublon'])
+        id_col = sql.Identifier(conf['id'])
+        columns = sql.SQL(', ').join(sql.Identifier(c) for c in conf['key'])
+        list_col = sql.Identifier(conf['list'])
+        try:
+            with self.connection:
+                with self.connection.cursor() as cur:
+                    cur.execute(sql.SQL("""
+                        CREATE TEMP TABLE tmp_bulk_add(
+                            ord int4 PRIMARY KEY,
+                            indx int4,
+                            {key_types},
+                            {list_col} text,
+                            objet text,
+                            max_date text,
+                            data_in jsonb,
+                            statut text,
+                            remplace bool DEFAULT FALSE,
+                            {id_col} int4
+                        ) ON COMMIT DROP;
+                    """).format(key_types=sql.SQL(', ').join(sql.SQL("{} {}").format(sql.Identifier(c), sql.SQL(t)) for c, t in zip(conf['key'], conf['key_types'])),
+                                list_col=list_col, id_col=id_col))
+
+                    # Chargement des enregistrements par COPY
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for ord, row in enumerate(rows):
+                        writer.writerow([ord] + ['\\N' if v is None else v for v in row])
+                    buffer.seek(0)
+                    cur.copy_expert(sql.SQL("COPY tmp_bulk_add (ord, indx, {columns}, {list_col}, objet, max_date, data_in) FROM STDIN WITH (FORMAT csv, NULL '\\N')")
+                                    .format(columns=columns, list_col=list_col), buffer)
+                    del buffer
+
+                    # Enregistrements du fichier regroupés par clé, avec l'éventuel enregistrement existant en base.
+                    # Comme la recherche par égalité de add_marche/add_concession, une clé contenant NULL ne correspond
+                    # à aucun autre enregistrement : chacun forme son propre groupe
+                    cur.execute(sql.SQL("""
+                        SELECT t.ord,
+                               CASE WHEN {t_nulls} THEN -1 - t.ord ELSE dense_rank() OVER (ORDER BY {t_columns}) END AS grp,
+                               LENGTH(t.{len_col}), t.max_date, e.{id_col} IS NOT NULL, e.max_date, LENGTH(e.{list_col}), LENGTH(t.{list_col})
+                        FROM tmp_bulk_add t
+                        LEFT JOIN {table} e ON {key}
+                        ORDER BY t.ord
+                    """).format(t_columns=sql.SQL(', ').join(sql.SQL("t.{}").format(sql.Identifier(c)) for c in conf['key']),
+                                t_nulls=sql.SQL(' OR ').join(sql.SQL("t.{} IS NULL").format(sql.Identifier(c)) for c in conf['key']),
+                                len_col=sql.Identifier(conf['len']), id_col=id_col, list_col=list_col, table=table, key=key))
+
+                    # Application de la règle de add_marche/add_concession dans l'ordre du fichier
+                    statuts = DbDecp.bulk_add_statuts(cur.fetchall(), file_date)
+                    execute_values(cur, "UPDATE tmp_bulk_add SET statut = v.statut, remplace = v.remplace FROM (VALUES %s) AS v(ord, statut, remplace) WHERE tmp_bulk_add.ord = v.ord",
+                                   [(ord, statut, remplace) for ord, (statut, remplace) in statuts.items()], page_size=10000)
+
+                    # Identifiants attribués dans l'ordre du fichier
+                    cur.execute(sql.SQL("""
+                        UPDATE tmp_bulk_add SET {id_col} = s.new_id
+                        FROM (SELECT ord, nextval({seq}) AS new_id FROM tmp_bulk_add WHERE statut <> 'doublon' ORDER BY ord) s
+                        WHERE tmp_bulk_add.ord = s.ord
+                    """).format(id_col=id_col, seq=sql.Literal('decp.'+conf['seq'])))
+
+                    # Déplacement en doublon puis suppression des enregistrements existants remplacés
+                    moved = sql.SQL(', ').join(sql.Identifier(c) for c in conf['moved'])
+                    moved_e = sql.SQL(', ').join(sql.SQL("e.{}").format(sql.Identifier(c)) for c in conf['moved'])
+                    cur.execute(sql.SQL("""
+                        INSERT INTO {doublon} ({doublon_id}, {moved})
+                        SELECT nextval({seq_doublon}), {moved_e}
+                        FROM {table} e JOIN tmp_bulk_add t ON {key}
+                        WHERE t.remplace
+                    """).format(doublon=doublon, doublon_id=sql.Identifier(conf['doublon_id']), moved=moved, moved_e=moved_e,
+                                seq_doublon=sql.Literal('decp.'+conf['seq_doublon']), table=table, key=key))
+                    cur.execute(sql.SQL("DELETE FROM {table} e USING tmp_bulk_add t WHERE {key} AND t.remplace").format(table=table, key=key))
+
+                    # Insertion des enregistrements retenus, puis des doublons du fichier
+                    cur.execute(sql.SQL("""
+                        INSERT INTO {table} ({id_col}, source_id, file_id, indx, {columns}, {list_col}, objet, max_date, date_creation, data_in)
+                        SELECT {id_col}, %s, %s, indx, {columns}, {list_col}, objet, max_date, %s, data_in
+                        FROM tmp_bulk_add WHERE statut = 'retenu' ORDER BY ord
+                    """).format(table=table, id_col=id_col, columns=columns, list_col=list_col), (source_id, file_id, file_date))
+                    cur.execute(sql.SQL("""
+                        INSERT INTO {doublon} ({doublon_id}, {id_col}, source_id, file_id, indx, {columns}, {list_col}, objet, max_date, date_creation, data_in)
+                        SELECT nextval({seq_doublon}), {id_col}, %s, %s, indx, {columns}, {list_col}, objet, max_date, %s, data_in
+                        FROM tmp_bulk_add WHERE statut <> 'retenu' ORDER BY ord
+                    """).format(doublon=doublon, doublon_id=sql.Identifier(conf['doublon_id']), id_col=id_col, columns=columns, list_col=list_col,
+                                seq_doublon=sql.Literal('decp.'+conf['seq_doublon'])), (source_id, file_id, file_date))
+
+                    cur.execute(sql.SQL("SELECT CASE WHEN statut = 'doublon' THEN 0 ELSE {id_col} END FROM tmp_bulk_add ORDER BY ord").format(id_col=id_col))
+                    return [r[0] for r in cur.fetchall()]
+
+        except Exception as e:
+            logging.error(f"{conf['error']} : {e}")
+            return None
+
     def update_concession(self, concession_id, json_data):
         try:
             cursor = self.connection.cursor()
@@ -716,54 +948,19 @@ class DbDecp:
         """
         Génère le fichier decp-global.json à partir des enregistrements 
         des tables marché et concession ayant un data_out non null (données valides et nettoyées dans decp-rama)
+        Si ref_date (YYYY-MM) est renseigné seul le fichier du mois est généré
         """
-        sub_query = ""
+        months = []
         if ref_date is not None:
-            file_path = file_path.replace('.','-'+ref_date+'.')
-            sub_query = f"AND substring(max_date,1,7)='{ref_date}'"
-        keep_db_id = ref_date is not None
-        logging.info (f"Launching generation for {file_path}")
-        try:
-            utilsJson = UtilsJson()
+            months = [ref_date]
+        self._extract_json_to_files(file_path,months,ref_date is None)
 
-            # Write incrementally to avoid loading hundreds of thousands of rows in RAM
-            with open(file_path, 'w') as outfile:
-                outfile.write('{\n  "marches": {\n    "marche": [')
-
-                # Stream marches
-                with self.connection.cursor(name="marche_cursor") as marche_cur:
-                    marche_cur.itersize = 10000  # fetch in chunks from server
-                    query = f"SELECT data_out FROM decp.marche WHERE data_out is not null {sub_query}"
-                    marche_cur.execute(query)
-
-                    first = True
-                    for row in marche_cur:
-                        outfile.write('\n' if first else ',\n')
-                        outfile.write(json.dumps(utilsJson.format_json(row[0], keep_db_id)))
-                        first = False
-
-                if ref_date is None:
-                    outfile.write('\n    ],\n "contrat-concession": [')
-                    first = True
-                    
-                # Stream concessions (same parent node as marches)
-                with self.connection.cursor(name="concession_cursor") as concession_cur:
-                    concession_cur.itersize = 10000
-                    query = f"SELECT data_out FROM decp.concession WHERE data_out is not null {sub_query}"
-                    concession_cur.execute(query)
-
-                    for row in concession_cur:
-                        outfile.write('\n' if first else ',\n')
-                        outfile.write(json.dumps(utilsJson.format_json(row[0], keep_db_id)))
-                        first = False
-
-                outfile.write('\n    ]\n  }\n}')
-
-        except Exception as e:
-            logging.error(f"Erreur lors de l'exttaction : {e} ")
-        logging.info (f"{file_path} created")
-        
     def extract_json_to_file(self,file_path:str,generate_month=True):
+        """
+        Génère le fichier global et, si generate_month, les fichiers mensuels depuis 2024-01
+        en une seule lecture des tables marché et concession
+        """
+        months = []
         if generate_month:
             start_year, start_month = 2024, 1
             today = date.today()  
@@ -772,15 +969,79 @@ class DbDecp:
             # Sauvegarde des marchés et concessions uniques regroupées par année et mois de date de 
             year, month = start_year, start_month
             while (year, month) <= (end_year, end_month):
-                ref_date = f"{year}-{month:02d}"
-                self.extract_json_to_file_for_month(file_path,ref_date)
+                months.append(f"{year}-{month:02d}")
                 if month == 12:
                     year += 1
                     month = 1
                 else:
                     month += 1
 
-        self.extract_json_to_file_for_month(file_path,None)
+        self._extract_json_to_files(file_path,months,True)
+
+    def _extract_json_to_files(self,file_path:str,months:list,generate_global:bool):
+        """
+        Parcourt une seule fois (curseur serveur) les marchés puis les concessions ayant un data_out non null
+        et répartit chaque enregistrement dans le fichier de son mois (avec db_id) et dans le fichier global.
+        Dans les fichiers mensuels les concessions sont ajoutées au tableau des marchés.
+        """
+        paths = {month: file_path.replace('.','-'+month+'.') for month in months}
+        for path in paths.values():
+            logging.info (f"Launching generation for {path}")
+        if generate_global:
+            logging.info (f"Launching generation for {file_path}")
+        try:
+            utilsJson = UtilsJson()
+            files = {}
+            # Write incrementally to avoid loading hundreds of thousands of rows in RAM
+            with contextlib.ExitStack() as stack:
+                for month, path in paths.items():
+                    files[month] = stack.enter_context(open(path, 'w', encoding='utf-8'))
+                    files[month].write('{\n  "marches": {\n    "marche": [')
+                outfile = stack.enter_context(open(file_path, 'w', encoding='utf-8')) if generate_global else None
+                if outfile:
+                    outfile.write('{\n  "marches": {\n    "marche": [')
+                first = dict.fromkeys(files, True)
+                first_global = True
+
+                query = "SELECT substring(max_date,1,7), data_out FROM decp.{table} WHERE data_out is not null"
+                params = None
+                if not generate_global:
+                    # Un seul mois
+                    query += " AND substring(max_date,1,7) = ANY(%s)"
+                    params = (months,)
+
+                for table in self.EXTRACT_TABLES:
+                    if outfile and table != self.EXTRACT_TABLES[0]:
+                        outfile.write('\n    ],\n "contrat-concession": [')
+                        first_global = True
+                    # Stream marches then concessions (same parent node as marches in monthly files)
+                    with self.connection.cursor(name=f"{table}_cursor") as cur:
+                        cur.itersize = 10000  # fetch in chunks from server
+                        cur.execute(query.format(table=table), params)
+                        for month, data_out in cur:
+                            record = utilsJson.format_json(data_out, True)
+                            if month in files:
+                                files[month].write('\n' if first[month] else ',\n')
+                                files[month].write(UtilsJsonWriter.dumps(record))
+                                first[month] = False
+                            if outfile:
+                                del record["db_id"]
+                                outfile.write('\n' if first_global else ',\n')
+                                outfile.write(UtilsJsonWriter.dumps(record))
+                                first_global = False
+
+                for f in files.values():
+                    f.write('\n    ]\n  }\n}')
+                if outfile:
+                    outfile.write('\n    ]\n  }\n}')
+
+        except Exception as e:
+            logging.error(f"Erreur lors de l'exttaction : {e} ")
+        for path in paths.values():
+            logging.info (f"{path} created")
+        if generate_global:
+            logging.info (f"{file_path} created")
 
     def close(self):
-        self.connection.close()
+        DbPool.putconn(self.connection)
+        self.connection = None
@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+# Pool de connexions à la base decp partagé par toutes les instances de DbDecp d'un processus.
+# Chaque processus (dont les processus du traitement parallèle des sources) crée son propre pool :
+# les connexions héritées d'un processus parent ne sont jamais utilisées ni fermées par le fils.
+class DbPool:
+    MIN_CONNECTIONS = 1
+    MAX_CONNECTIONS = 8
+
+    _pool = None
+    _pid = None
+    _inherited = []         # Pools hérités du processus parent, conservés pour ne pas fermer leurs connexions
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_pool() -> ThreadedConnectionPool:
+        with DbPool._lock:
+            if DbPool._pool is None or DbPool._pid != os.getpid():
+                if DbPool._pool is not None:
+                    DbPool._inherited.append(DbPool._pool)
+                # Chargement des variables d'environnement depuis le fichier .env
+                load_dotenv()
+                DbPool._pool = ThreadedConnectionPool(
+                    DbPool.MIN_CONNECTIONS,
+                    int(os.getenv('DECP.DB_POOL_MAX', DbPool.MAX_CONNECTIONS)),
+                    dbname=os.getenv('DECP.DB_NAME'),
+                    user=os.getenv('DECP.DB_USER'),
+                    password=os.getenv('DECP.DB_PASSWORD'),
+                    host=os.getenv('DECP.DB_HOST', 'localhost'),
+                    port=os.getenv('DECP.DB_PORT', '5432')
+                )
+                DbPool._pid = os.getpid()
+                logging.info(f"Pool de connexions à la base créé pour le processus {DbPool._pid}")
+            return DbPool._pool
+
+    @staticmethod
+    def getconn():
+        """Emprunte une connexion au pool du processus courant"""
+        return DbPool._get_pool().getconn()
+
+    @staticmethod
+    def putconn(connection) -> None:
+        """Rend une connexion au pool après avoir annulé une éventuelle transaction en cours"""
+        if connection is None or DbPool._pid != os.getpid():
+            return
+        close = bool(connection.closed)
+        if not close and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except Exception as e:
+                logging.warning(f"Connexion rendue au pool dans un état invalide : {e}")
+                close = True
+        DbPool._pool.putconn(connection, close=close)
+
+    @staticmethod
+    @contextmanager
+    def connection():
+        """Gestionnaire de contexte : with DbPool.connection() as conn: ..."""
+        connection = DbPool.getconn()
+        try:
+            yield connection
+        finally:
+            DbPool.putconn(connection)
+
+    @staticmethod
+    def closeall() -> None:
+        with DbPool._lock:
+            if DbPool._pool is not None and DbPool._pid == os.getpid():
+                DbPool._pool.closeall()
+            DbPool._pool = None
+            DbPool._pid = None
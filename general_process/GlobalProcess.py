@@ -12,6 +12,9 @@ import boto3
 import requests
 import math
 import csv
+import itertools
+import shutil
+import tempfile
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import time
@@ -22,6 +25,10 @@ from utils.NodeFormat import NodeFormat
 from utils.StepMngmt import StepMngmt
 from utils.Step import Step
 from utils.UtilsJson import UtilsJson
+from utils.UtilsPublicationDate import UtilsPublicationDate
+from utils.UtilsDedup import UtilsDedup
+from utils.ExportStore import ExportStore
+from utils.UtilsJsonWriter import UtilsJsonWriter, JsonListWriter
 
 with open(os.path.join("confs", "var_glob.json")) as f:
     conf_glob = json.load(f)
@@ -208,18 +215,19 @@ class GlobalProcess:
             inplace=True,
             kind='mergesort'  # tri stable
         )
-        
-        mask = df['_type'].eq('Marché')
-        to_drop = df.loc[mask, self.feature_doublons_marche].astype(str).duplicated(keep='last')
-        nb_duplicated_marches = df.loc[mask, self.feature_doublons_marche].astype(str).duplicated(keep='last').sum()
-        df.drop(index=to_drop[to_drop].index, inplace=True)
         df.reset_index(drop=True, inplace=True)
 
-        mask = df['_type'].ne('Marché')
-        columns_compare = [c for c in self.feature_doublons_concession if c in df.columns] #
-        to_drop = df.loc[mask, columns_compare].astype(str).duplicated(keep='last')
-        nb_duplicated_concessions = df.loc[mask, columns_compare].astype(str).duplicated(keep='last').sum()
-        df.drop(index=to_drop[to_drop].index, inplace=True)
+        # Clé hachée des marchés et des concessions, doublons résolus en un seul passage
+        mask = df['_type'].eq('Marché').values
+        keys = np.empty(len(df), dtype=np.uint64)
+        keys[mask] = UtilsDedup.hash_keys(df.loc[mask], [c for c in self.feature_doublons_marche if c in df.columns])
+        keys[~mask] = UtilsDedup.hash_keys(df.loc[~mask], [c for c in self.feature_doublons_concession if c in df.columns])
+        index_to_keep, nb_duplicated = UtilsDedup.keep_last(keys, mask)
+        nb_duplicated_marches = nb_duplicated.get(True, 0)
+        nb_duplicated_concessions = nb_duplicated.get(False, 0)
+        to_drop = np.ones(len(df), dtype=bool)
+        to_drop[index_to_keep] = False
+        df.drop(index=df.index[to_drop], inplace=True)
         df.reset_index(drop=True, inplace=True)
 
         nb_marches = df['_type'].eq('Marché').sum() if '_type' in df.columns else len(df)
@@ -245,27 +253,6 @@ class GlobalProcess:
 
 
     def _add_meta_modifications(self,df_marches,df_concessions,process_dates:bool=True):
-        def _extract_max_id_modification(modifications):
-            # Récupérer les ids et retourner le maximum
-            ids = [item['modification']['id'] for item in modifications if 'modification' in item]
-            return max(ids) if ids else 0
-        
-        def _extract_max_date_modification(modifications):
-            # Récupérer les dates et retourner le maximum
-            dates = [pd.to_datetime(item['modification']['datePublicationDonneesModification'], errors='coerce') for item in modifications if 'modification' in item]
-            return max(dates) if dates else pd.NA
-        
-        def _max_date(row):
-            """Cette fonction revoie la date la plus avancée dans le temps entre les date de modification (tmp__datModification) et la date de publication des données."""
-            pub_date = pd.to_datetime(row['datePublicationDonnees'])
-            mod_date = pd.to_datetime(row['tmp__dateModification'])
-            # Choix de la date maximale, NaN s'il n'y a que NaN
-            m = max(pub_date, mod_date) if not (pd.isna(pub_date) and pd.isna(mod_date)) else pd.to_datetime("2024-01-01")
-            # Si la date est antérieure à 2024 ou est nulle, on la remplace par 2024-01-01
-            if m<pd.to_datetime("2024-01-01") or m is pd.NaT:
-                m = pd.to_datetime("2024-01-01")
-            return m
-        
         def _tri_titulaires(titulaires):
             """Cette fonction trie les titulaires par id afin d'éviter les erreurs de calcul de doublons lorsque l'ordre dans les données en entrée change."""
             return sorted(titulaires, key=lambda x: x['titulaire']['id']) if isinstance(titulaires, list) else titulaires
@@ -276,18 +263,8 @@ class GlobalProcess:
 
         def _prepare_group_by(df):
             """Cette fonction prépare les données pour le groupby sur tmp__annee_mois  en ajoutant les données dans les colonnes tmp__idModification et tmp__dateModification et tmp__annee_mois."""
-            if not df.empty:# df[df['datePublicationDonnees'].isna()]['datePublicationDonnees']
-                df['datePublicationDonnees'] = pd.to_datetime(df['datePublicationDonnees'],format='mixed',errors='coerce')
-                if 'modifications' in df.columns:
-                    df['tmp__idModification'] = df['modifications'].apply(_extract_max_id_modification)
-                    df['tmp__dateModification'] = df['modifications'].apply(_extract_max_date_modification)
-                else:
-                    df['tmp__dateModification'] = pd.NaT
-                df['tmp__dateModification'] = df.apply(_max_date, axis=1)
-                df['tmp__dateModification'] = df['tmp__dateModification'] #.dt.strftime('%Y-%m')
-                df['tmp__annee_mois'] = df['tmp__annee_mois'].where(df['tmp__annee_mois'].notna(), df['tmp__dateModification'].dt.strftime('%Y-%m'))#.strftime('%Y-%m')
-                df['tmp__dateModification'] = df['tmp__dateModification'].astype(str)
-                df['datePublicationDonnees'] = df['datePublicationDonnees'].astype(str) 
+            if not df.empty:
+                UtilsPublicationDate.add_publication_dates(df)
 
         if not df_marches.empty:
             if 'titulaires' in df_marches.columns:
@@ -309,61 +286,108 @@ class GlobalProcess:
             if "tmp__idModification" not in df_concessions.columns:
                 df_concessions['tmp__idModification'] = 0
             
-    def _merge_in_file(self, file_path:str, df_new:pd.DataFrame):#dico:dict) -> dict:
+    def _merge_in_file(self, file_path:str, df_new:pd.DataFrame) -> list:#dico:dict) -> dict:
         """
         La fonction _merge_in_file permet de fusionner un dictionnaires en entrée avec 
-        le dictionnaire contenu dans un fichier
+        le dictionnaire contenu dans un fichier.
+        Les données du fichier sont conservées dans un stockage par segments (cf. ExportStore) : seuls
+        les enregistrements nouveaux ou plus récents sont ajoutés, puis le fichier est reconstruit en flux.
         Args:
             file_name: Nom du fichier contenant le dictionnaire à fusionner
             df_new: dataframe contenant les données à ajouter
+        Returns:
+            les enregistrements dédoublonnés ajoutés au fichier
         """
-        # On vérifie que le fichier existe bien, sinon on le crée
-        if os.path.exists(file_path):
-            dico_file = self.file_load(file_path)
-            if dico_file=={}:
-                df_new = self.dedoublonnage(df_new)
-                dico = {'marches': [{k: v for k, v in m.items() if str(v) != 'nan'}
-                    for m in df_new.to_dict(orient='records')]}
-                self.file_dump(file_path,dico)
-            else:
-                # On transforme le dictionnaires en dataframe pour dédoublonner les nouvelles données
-                df_global = pd.DataFrame.from_dict(dico_file['marches'])
+        df_new = self.dedoublonnage(df_new)
+        records = [{k: v for k, v in m.items() if str(v) != 'nan'}
+            for m in df_new.to_dict(orient='records')]
+        self._merge_records_in_file(file_path,records)
+        return records
+
+
+    def _merge_records_in_file(self, file_path:str, records:list) -> None:
+        """Ajoute des enregistrements dédoublonnés au stockage du fichier file_path puis reconstruit le fichier"""
+        store = ExportStore(os.path.basename(file_path).replace('.json',''),{'Marché': self.feature_doublons_marche},self.feature_doublons_concession)
+        # Première utilisation du stockage : reprise du fichier existant
+        if not store.exists() and os.path.exists(file_path):
+            self._load_in_store(file_path,store)
+        store.merge(records)
+        self._store_dump(file_path,store)
+
+
+    def _load_in_store(self, file_path:str, store:ExportStore) -> None:
+        """Ajoute au stockage les enregistrements d'un fichier d'export produit avant sa mise en place"""
+        dico_file = self.file_load(file_path)
+        if dico_file=={} or len(dico_file['marches'])==0:
+            return
+        # On transforme le dictionnaires en dataframe pour appliquer les mêmes règles qu'aux nouvelles données
+        df_global = pd.DataFrame.from_dict(dico_file['marches'])
 
-                nb_marches_df_global = df_global['_type'].eq('Marché').sum() if '_type' in df_global.columns else len(df_global)
-                nb_concessions_df_global = df_global['_type'].ne('Marché').sum() if '_type' in df_global.columns else len(df_global)
-                logging.info("%s marchés et %s concessions extraites du fichier %s", nb_marches_df_global,nb_concessions_df_global,file_path)
-                
-                # On complete les colonnes  pour les marches ajoutés depuis l'export qui ne sont pas passé par fix
-                keys_to_backup = ['offresRecues','marcheInnovant','attributionAvance','sousTraitanceDeclaree','dureeMois','variationPrix','montant','valeurGlobale']
-                for key in keys_to_backup:
-                    if key in df_global.columns and f'backup__{key}' not in df_global.columns:
-                        df_global[f'backup__{key}'] = df_global[key]
-                        
-                # On applique la règle d'arrondi sur les montant pour lds marchés
-                if "montant" in df_global.columns:
-                    df_global.loc[df_global['_type'] == 'Marché', 'montant'] = df_global.loc[df_global['_type'] == 'Marché', 'montant'].apply(lambda x: int(x) if pd.notna(x) else np.nan)
+        nb_marches_df_global = df_global['_type'].eq('Marché').sum() if '_type' in df_global.columns else len(df_global)
+        nb_concessions_df_global = df_global['_type'].ne('Marché').sum() if '_type' in df_global.columns else len(df_global)
+        logging.info("%s marchés et %s concessions extraites du fichier %s", nb_marches_df_global,nb_concessions_df_global,file_path)
+        
+        # On complete les colonnes  pour les marches ajoutés depuis l'export qui ne sont pas passé par fix
+        keys_to_backup = ['offresRecues','marcheInnovant','attributionAvance','sousTraitanceDeclaree','dureeMois','variationPrix','montant','valeurGlobale']
+        for key in keys_to_backup:
+            if key in df_global.columns and f'backup__{key}' not in df_global.columns:
+                df_global[f'backup__{key}'] = df_global[key]
                 
-                # On ue la règle d'arrondi sur les valeurGlobale pour les concessions
-                if "valeurGlobale" in df_global.columns :
-                    df_global.loc[df_global['_type'] == 'Concession', 'valeurGlobale'] = df_global.loc[df_global['_type'] == 'Concession', 'valeurGlobale'].apply(lambda x: int(x) if pd.notna(x) else np.nan)
+        # On applique la règle d'arrondi sur les montant pour lds marchés
+        if "montant" in df_global.columns:
+            df_global.loc[df_global['_type'] == 'Marché', 'montant'] = df_global.loc[df_global['_type'] == 'Marché', 'montant'].apply(lambda x: int(x) if pd.notna(x) else np.nan)
+        
+        # On ue la règle d'arrondi sur les valeurGlobale pour les concessions
+        if "valeurGlobale" in df_global.columns :
+            df_global.loc[df_global['_type'] == 'Concession', 'valeurGlobale'] = df_global.loc[df_global['_type'] == 'Concession', 'valeurGlobale'].apply(lambda x: int(x) if pd.notna(x) else np.nan)
 
-                self._nan_correction_dico(df_global)
-                
-                # on ajoute les nouvelles données au données extraite du fichier pour pouvoir ensuite faire le dédoublonnage sur tout le fichier
-                df_global = pd.concat([df_global, df_new], ignore_index=True)
+        self._nan_correction_dico(df_global)
 
-                df_global = self.dedoublonnage(df_global)
-                
-                dico_final = {'marches': [{k: v for k, v in m.items() if str(v) != 'nan'}
-                    for m in df_global.to_dict(orient='records')]}
-                
-                self.file_dump(file_path,dico_final)                
-        else:
-            # Le fichier n'existait pas on ajoute le nouveau dictionnaire dedans
-            df_new = self.dedoublonnage(df_new)
-            dico = {'marches': [{k: v for k, v in m.items() if str(v) != 'nan'}
-                for m in df_new.to_dict(orient='records')]}
-            self.file_dump(file_path,dico)
+        store.merge([{k: v for k, v in m.items() if str(v) != 'nan'}
+            for m in df_global.to_dict(orient='records')])
+
+
+    def _store_dump(self, path:str, store:ExportStore, chunk_size:int = 10000) -> None:
+        """
+        Reconstruit en flux le fichier d'export path et sa copie pour data.gouv à partir du stockage,
+        par paquets de chunk_size enregistrements (même contenu que file_dump).
+        """
+        logging.info(f"Saving file {path}")
+        path_data_gouv = path.replace(".json","_data_gouv.json")
+        try:
+            with open(path, 'w', encoding="utf-8") as f, open(path_data_gouv, 'w', encoding="utf-8") as f_data_gouv, \
+                 tempfile.TemporaryFile('w+', encoding="utf-8") as f_concessions:
+                f.write('{\n  "marches": [')
+                f_data_gouv.write('{\n  "marches": {\n    "marche": [')
+                writer = JsonListWriter(f, 2)
+                writer_marches = JsonListWriter(f_data_gouv, 3)
+                writer_concessions = JsonListWriter(f_concessions, 3)
+                f_concessions.write('[')
+                records = store.iter_records()
+                while True:
+                    chunk = list(itertools.islice(records, chunk_size))
+                    if not chunk:
+                        break
+                    for marche in self._dico_restore_nc({'marches': chunk})['marches']:
+                        writer.write(marche)
+                    dico_data_gouv = self._dico_purge({'marches': chunk})['marches']
+                    for marche in dico_data_gouv['marche']:
+                        writer_marches.write(marche)
+                    for concession in dico_data_gouv['contrat-concession']:
+                        writer_concessions.write(concession)
+                writer.close()
+                f.write('\n}')
+                writer_marches.close()
+                writer_concessions.close()
+                # Les concessions sont écrites après les marchés dans la copie data.gouv
+                f_data_gouv.write(',\n    "contrat-concession": ')
+                f_concessions.seek(0)
+                shutil.copyfileobj(f_concessions, f_data_gouv)
+                f_data_gouv.write('\n  }\n}')
+        except Exception as err:
+            logging.error(f"Exception lors de l'ecriture du fichier json {path} - {err}")
+        json_size = os.path.getsize(path)
+        logging.info(f"Taille de {path} : {json_size}")
 
 
     def _make_copy_for_data_gouv(self,suffix):
@@ -380,7 +404,7 @@ class GlobalProcess:
 
             dico = self._dico_purge(dico)
             with open(file_path_copy, 'w', encoding="utf-8") as f:
-                json.dump(dico, f, indent=2, ensure_ascii=False)
+                UtilsJsonWriter.dump(dico, f, pretty=True)
 
 
     @StepMngmt().decorator(Step.EXPORT,None)
@@ -404,7 +428,9 @@ class GlobalProcess:
 
         ## Exportation des données dans des fichiers mensuels 
         current_year_month  = f"{datetime.now().year}-{datetime.now().month:02d}"
-        years = []
+        # Enregistrements ajoutés aux fichiers mensuels, par année : les fichiers annuels sont
+        # complétés avec ces seuls enregistrements, sans second regroupement des données
+        years = {}
         for year_month, group in self.df.groupby('tmp__annee_mois'):
             if year_month <= current_year_month:
                 output_file = f"{self.RESULTS_DATA_GOUV}/decp-{year_month}.json"
@@ -413,26 +439,17 @@ class GlobalProcess:
                 nb_concessions = group[~group['_type'].str.contains("Marché")].shape[0]
                 logging.info(f"Ajout de {nb_marches} marchés et {nb_concessions} concessions au fichier {output_file}")
                 
-                self._merge_in_file(output_file,group)
+                records = self._merge_in_file(output_file,group)
                 
-                suffix_year = year_month[0:4]
-                if not suffix_year in years:
-                    years += [suffix_year]
+                year = years.setdefault(year_month[0:4], {'records': [], 'nb_marches': 0, 'nb_concessions': 0})
+                year['records'].extend(records)
+                year['nb_marches'] += nb_marches
+                year['nb_concessions'] += nb_concessions
 
-        for year in years:
-            output_file_year = f"{self.RESULTS_DATA_GOUV}/decp-{year}.json"
-            df_new = pd.DataFrame()
-            total_marches = 0
-            total_concessions = 0
-            for year_month, group in self.df.groupby('tmp__annee_mois'):
-                if year == year_month[0:4]:
-                    df_new = pd.concat([df_new,group],ignore_index=True)
-                    
-                    total_marches += group[group['_type'].str.contains("Marché")].shape[0]
-                    total_concessions += group[~group['_type'].str.contains("Marché")].shape[0]
-                
-            logging.info(f"Ajout de {total_marches} marchés et {total_concessions} concessions au fichier {output_file_year} pour l'annee {year}")
-            self._merge_in_file(output_file_year,df_new)
+        for suffix_year, year in years.items():
+            output_file_year = f"{self.RESULTS_DATA_GOUV}/decp-{suffix_year}.json"
+            logging.info(f"Ajout de {year['nb_marches']} marchés et {year['nb_concessions']} concessions au fichier {output_file_year} pour l'annee {suffix_year}")
+            self._merge_records_in_file(output_file_year,year['records'])
 
         logging.info("Exportation JSON OK")
 
@@ -607,7 +624,7 @@ class GlobalProcess:
 
         try:
             with open(path, 'w', encoding="utf-8") as f:
-                json.dump(dico, f, indent=2, ensure_ascii=False)
+                UtilsJsonWriter.dump(dico, f, pretty=True)
             
             if not is_for_data_gouv:
                 self.file_dump(path.replace(".json","_data_gouv.json"),dico_ref,True)
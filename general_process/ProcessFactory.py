@@ -2,10 +2,12 @@ from general_process.SourceProcess import ProcessParams
 from specific_process import * 
 # Source non traitée pour l'instant
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from reporting.Report import Report
 from utils.Step import Step
 from utils.StepMngmt import StepMngmt
+from utils.UtilsWorker import UtilsWorker
 
 class ProcessFactory:
 
@@ -57,47 +59,44 @@ class ProcessFactory:
             process = None
 
     def run_processes(self,args):
-        """Création d'une boucle (1 source=1 itération) qui appelle chacun des processus de chaque source."""
-        for process in self.processes:
-            loaded = ''
-            try:
-                logging.info( "---------------------------------------------------------------")
-                logging.info(f"               Traitement de {process.__name__} ")
-                logging.info( "---------------------------------------------------------------")
-                params = ProcessParams(key=None,data_format=self.data_format, report=self.report, rebuild=args.rebuild.strip() if args.rebuild else None, test = args.test)
-                p = process(params)
-                logging.info(self.step.get_status(p.source))
-                if not self.step.bypass(p.source,Step.GET):
-                    p.get()
-                    self.step.snapshot(p.source,Step.GET)
-                if not self.step.bypass(p.source,Step.CLEAN):
-                    p.clean()
-                    self.step.snapshot_dicts(p.source,Step.CLEAN,p.dico_2022_marche,p.dico_2022_concession)
-                else:
-                    p.dico_2022_marche,p.dico_2022_concession = self.step.resume_dicts(p.source,Step.CLEAN,StepMngmt.FORMAT_DICTS)
-                if not self.step.bypass(p.source,Step.CONVERT):
-                    p.convert()
-                    self.step.snapshot_dataframe(p.source,Step.CONVERT,p.df)
-                else:
-                    p.df = self.step.resume(p.source,Step.CONVERT,StepMngmt.FORMAT_DATAFRAME)
-                if not self.step.bypass(p.source,Step.FIX):
-                    p.fix()
-                    self.step.snapshot_dataframe(p.source,Step.FIX,p.df)
-                else:
-                    p.df = self.step.resume(p.source,Step.FIX,StepMngmt.FORMAT_DATAFRAME)
-                p.fix_statistics()
-                logging.info (f"Ajout des données de la source {process.__name__}")
-                self.dataframes.append(p.df) #p.df['tmp__max_date'].apply(lambda x: type(x)).value_counts() #
-                p.df = None
-                logging.info( "---------------------------------------------------------------")
-                logging.info(f"             Fin du traitement {process.__name__}")
-                logging.info( "---------------------------------------------------------------")
-            except Exception as err:
-                loaded = self.step.get_status(p.source)
-                if loaded != '':
-                    logging.error(f"Erreur à l'étape {loaded}  - {err}")
-                else:
-                    logging.error(f"Source introuvable - {err}")
+        """Création d'une boucle (1 source=1 itération) qui appelle chacun des processus de chaque source.
+        Avec l'option -w N (N>1), les sources sont traitées en parallèle dans un pool de N processus.
+        Les dataframes et les statistiques sont rassemblés dans l'ordre de self.processes."""
+        workers = getattr(args,'workers',None) or 1
+        rebuild = args.rebuild.strip() if args.rebuild else None
+        validation_workers = getattr(args,'validation_workers',None) or 1
+        if workers <= 1 or len(self.processes) <= 1:
+            for process in self.processes:
+                df = run_source(process,self.data_format,self.report,rebuild,args.test,validation_workers)
+                if df is not None:
+                    self.dataframes.append(df)
+            return
+
+        workers = min(workers,len(self.processes))
+        logging.info(f"Traitement parallèle de {len(self.processes)} sources avec {workers} processus")
+        results = [None] * len(self.processes)
+        # Les processus sont créés par fork : aucun point de reprise ne doit être en cours d'écriture,
+        # un processus fils hériterait des verrous du thread d'écriture sans pouvoir les libérer
+        self.step.flush()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(UtilsWorker.run,self.report,run_source,process,self.data_format,self.report,rebuild,args.test,validation_workers): index
+                       for index,process in enumerate(self.processes)}
+            for future in as_completed(futures):
+                index = futures[future]
+                process = self.processes[index]
+                try:
+                    results[index] = future.result()
+                except Exception as err:
+                    logging.error(f"Erreur du processus de traitement de la source {process.__name__} - {err}")
+
+        # Rassemblement dans l'ordre des sources pour garder un résultat déterministe
+        for result in results:
+            if result is None:
+                continue
+            df, statistics, messages, status = result
+            UtilsWorker.merge(self.report,statistics,messages,status)
+            if df is not None:
+                self.dataframes.append(df)
 
     def run_process(self,args):
         """Lance un seul processus"""
@@ -123,4 +122,50 @@ class ProcessFactory:
         else:
             p.df = self.step.resume(p.source,Step.FIX,StepMngmt.FORMAT_DATAFRAME)
         self.dataframes.append(p.df)
-        
+
+
+def run_source(process,data_format:str,report:Report,rebuild:str,test:bool,validation_workers:int=1):
+    """Enchaîne les étapes GET, CLEAN, CONVERT et FIX d'une source et retourne son dataframe (None en cas d'erreur)."""
+    step = StepMngmt()
+    p = None
+    try:
+        logging.info( "---------------------------------------------------------------")
+        logging.info(f"               Traitement de {process.__name__} ")
+        logging.info( "---------------------------------------------------------------")
+        params = ProcessParams(key=None,data_format=data_format, report=report, rebuild=rebuild, test = test, validation_workers = validation_workers)
+        p = process(params)
+        logging.info(step.get_status(p.source))
+        if not step.bypass(p.source,Step.GET):
+            p.get()
+            step.snapshot(p.source,Step.GET)
+        if not step.bypass(p.source,Step.CLEAN):
+            p.clean()
+            step.snapshot_dicts(p.source,Step.CLEAN,p.dico_2022_marche,p.dico_2022_concession)
+        else:
+            p.dico_2022_marche,p.dico_2022_concession = step.resume_dicts(p.source,Step.CLEAN,StepMngmt.FORMAT_DICTS)
+        if not step.bypass(p.source,Step.CONVERT):
+            p.convert()
+            step.snapshot_dataframe(p.source,Step.CONVERT,p.df)
+        else:
+            p.df = step.resume(p.source,Step.CONVERT,StepMngmt.FORMAT_DATAFRAME)
+        if not step.bypass(p.source,Step.FIX):
+            p.fix()
+            step.snapshot_dataframe(p.source,Step.FIX,p.df)
+        else:
+            p.df = step.resume(p.source,Step.FIX,StepMngmt.FORMAT_DATAFRAME)
+        p.fix_statistics()
+        logging.info (f"Ajout des données de la source {process.__name__}")
+        df = p.df #p.df['tmp__max_date'].apply(lambda x: type(x)).value_counts() #
+        p.df = None
+        logging.info( "---------------------------------------------------------------")
+        logging.info(f"             Fin du traitement {process.__name__}")
+        logging.info( "---------------------------------------------------------------")
+        return df
+    except Exception as err:
+        loaded = step.get_status(p.source) if p is not None else None
+        if loaded:
+            logging.error(f"Erreur à l'étape {loaded}  - {err}")
+        else:
+            logging.error(f"Source introuvable - {err}")
+        return None
+
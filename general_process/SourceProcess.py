@@ -12,12 +12,23 @@ import re
 import logging
 import shutil
 import traceback
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from jsonschema import validate,Draft7Validator,Draft202012Validator
 from datetime import datetime
 from pypdl import Pypdl
 from urllib.parse import urlparse
 from reporting.Report import Report
 from utils.UtilsFile import UtilsFile
+from utils.UtilsHttp import UtilsHttp
+from utils.UtilsJsonReader import UtilsJsonReader
+from utils.UtilsXml import UtilsXml
+from utils.UtilsSchema import UtilsSchema
+from utils.UtilsPublicationDate import UtilsPublicationDate
+from utils.UtilsFileCache import UtilsFileCache
+from utils.UtilsDedup import UtilsDedup
+from utils.StepMngmt import StepMngmt
 from utils.NodeFormat import NodeFormat
 
 pd.options.mode.chained_assignment = None
@@ -33,6 +44,7 @@ class ProcessParams:
     report: Report
     rebuild: str
     test:bool
+    validation_workers:int = 1
 
 class SourceProcess:
 
@@ -44,6 +56,17 @@ class SourceProcess:
     API_DATA_GOUV = "https://www.data.gouv.fr/api/1"
     API_DATA_GOUV_TEST = "https://demo.data.gouv.fr/api/1"
 
+    # Téléchargements parallèles des ressources d'une source
+    DOWNLOAD_WORKERS = 8        # Nombre de téléchargements simultanés
+    DOWNLOAD_PER_HOST = 4       # Nombre de téléchargements simultanés vers un même hôte
+    DOWNLOAD_ATTEMPTS = 3       # Nombre de tentatives par fichier
+    DOWNLOAD_BACKOFF = 5        # Attente (secondes) avant la 2ème tentative, doublée ensuite
+    DOWNLOAD_OK = 'ok'
+    DOWNLOAD_SKIPPED = 'skipped'
+    DOWNLOAD_FAILED = 'failed'
+    _host_semaphores = {}
+    _host_semaphores_lock = threading.Lock()
+
     def __init__(self, key:str, params:ProcessParams):
         """L'étape __init__ crée les variables associées à la classe SourceProcess : key, source,
         format, df, title, url, cle_api et metadata.
@@ -57,6 +80,8 @@ class SourceProcess:
         self.report = params.report
         self.test = params.test
         self.data_format = params.data_format
+        self.validation_workers = params.validation_workers
+        self.validation_pool = None     # Pool de validation de l'étape CLEAN en cours (cf. UtilsSchema.pool)
         with open("metadata/metadata.json", 'r+') as f:
             self.metadata = json.load(f)
         self.source = self.metadata[self.key]["code"]
@@ -106,7 +131,7 @@ class SourceProcess:
         self.dico_2022_concession = []
 
         # Chargement du schemas json de reference
-        scheme_path = 'schemes/schema_decp_v2.0.4.json'
+        scheme_path = UtilsSchema.SCHEME_PATH
         with open(scheme_path, "r",encoding='utf-8') as json_file:
             self.json_scheme = json.load(json_file)
             json_file.close
@@ -170,8 +195,14 @@ class SourceProcess:
                 url_metadonnees = f"{self.API_DATA_GOUV}/datasets/{self.cle_api[i]}/"
                 if self.test:
                     url_metadonnees = f"{self.API_DATA_GOUV_TEST}/datasets/{self.cle_api[i]}/"
-                wget.download(url_metadonnees,
-                            f"metadata/{self.source}/metadata_{self.key}_{i}.json")
+                # Requête conditionnelle (ETag / Last-Modified) : un 304 restaure les métadonnées du cache
+                try:
+                    UtilsHttp.download(url_metadonnees,
+                                f"metadata/{self.source}/metadata_{self.key}_{i}.json")
+                except Exception as err:
+                    logging.warning(f"Requête conditionnelle impossible pour {url_metadonnees}, téléchargement complet - {err}")
+                    wget.download(url_metadonnees,
+                                f"metadata/{self.source}/metadata_{self.key}_{i}.json")
                 logging.info(f"Chargement des métadonnées depuis {url_metadonnees} OK")
                 #url = f"https://www.data.gouv.fr/api/1/datasets/{self.cle_api[i]}/"
                 #context = ssl.create_default_context(cafile=certifi.where())
@@ -298,26 +329,75 @@ class SourceProcess:
             self._download_without_metadata()
         else:
             # Verification de l'existence d'un eventuel doublon + nettoyage + 
-            # Téléchargement du nouveau fichier
-            dl = Pypdl(allow_reuse=True)
-            for i in range(len(self.url)):
+            # Téléchargement des nouveaux fichiers en parallèle
+            results = [None] * len(self.url)
+            with ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as executor:
+                futures = {executor.submit(self._download_file,i): i for i in range(len(self.url))}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+
+            # Les fichiers en échec ne sont pas transmis à l'étape clean
+            failed = {i for i in range(len(self.url)) if results[i] == self.DOWNLOAD_FAILED}
+            if failed:
+                self.url = [u for i,u in enumerate(self.url) if i not in failed]
+                self.title = [t for i,t in enumerate(self.title) if i not in failed]
+                self.url_date = [d for i,d in enumerate(self.url_date) if i not in failed]
+            logging.info(f"Téléchargement : {results.count(self.DOWNLOAD_OK)} fichier(s) téléchargé(s), "
+                         f"{results.count(self.DOWNLOAD_SKIPPED)} déjà à jour, {len(failed)} en échec")
+        logging.info(f"Téléchargement : {len(self.url)} fichier(s) OK")
+
+
+    def _download_file(self,i:int) -> str:
+        """
+        Télécharge le i-ème fichier de la liste des urls si la version locale est absente ou 
+        plus ancienne que la date de la ressource et que le serveur ne répond pas 304 à une requête 
+        conditionnelle. Le nombre de téléchargements simultanés vers un même hôte est limité et 
+        chaque échec est retenté avec une attente croissante.
+
+        Returns:
+            DOWNLOAD_OK, DOWNLOAD_SKIPPED ou DOWNLOAD_FAILED
+        """
+        file_path = f"sources/{self.source}/{self.title[i]}"
+        with SourceProcess._host_semaphore(urlparse(self.url[i]).netloc):
+            try:
+                exists = os.path.exists(file_path)
+                if exists and UtilsFile.last_modification(file_path) >= pd.to_datetime(self.url_date[i]).tz_localize(None):
+                    return self.DOWNLOAD_SKIPPED
+                # Requête conditionnelle : si le serveur répond 304 le fichier local est conservé
+                not_modified, headers = UtilsHttp.not_modified(self.url[i], exists)
+                if not_modified:
+                    os.utime(file_path)
+                    logging.info(f"Fichier : {self.title[i]} non modifié sur le serveur")
+                    return self.DOWNLOAD_SKIPPED
+                if exists:
+                    os.remove(file_path)
+                    logging.info(f"Fichier : {self.title[i]} existe déjà, nettoyage du doublon ")
+            except Exception as err:
+                logging.error(f"Problème de téléchargement du fichier {self.url[i]} - {err}")
+                return self.DOWNLOAD_FAILED
+
+            for attempt in range(self.DOWNLOAD_ATTEMPTS):
                 try:
-                    load = False
-                    if os.path.exists(f"sources/{self.source}/{self.title[i]}"):
-                        if UtilsFile.last_modification(f"sources/{self.source}/{self.title[i]}") < pd.to_datetime(self.url_date[i]).tz_localize(None):
-                            os.remove(f"sources/{self.source}/{self.title[i]}")
-                            logging.info(f"Fichier : {self.title[i]} existe déjà, nettoyage du doublon ")
-                            load = True
-                    else:
-                        load = True
-                    ##wget.download(self.url[i], f"sources/{self.source}/{self.title[i]}")
-                    #if not os.path.exists(f"sources/{self.source}/{self.title[i]}"):
-                    if load:
-                        dl.start(url=self.url[i],file_path=f"sources/{self.source}/{self.title[i]}",retries=10,display=False)
+                    dl = Pypdl(allow_reuse=False)
+                    dl.start(url=self.url[i],file_path=file_path,retries=10,display=False)
+                    if os.path.exists(file_path):
+                        UtilsHttp.store(self.url[i], headers)
                         logging.info(f"Fichier : {self.title[i]} téléchargé ")
+                        return self.DOWNLOAD_OK
                 except Exception as err:
-                    logging.error(f"Problème de téléchargement du fichier {self.url[i]}")
-        logging.info(f"Téléchargement : {len(self.url)} fichier(s) OK")
+                    logging.warning(f"Tentative {attempt+1}/{self.DOWNLOAD_ATTEMPTS} de téléchargement du fichier {self.url[i]} en échec - {err}")
+                if attempt < self.DOWNLOAD_ATTEMPTS-1:
+                    time.sleep(self.DOWNLOAD_BACKOFF * 2**attempt)
+        logging.error(f"Problème de téléchargement du fichier {self.url[i]}")
+        return self.DOWNLOAD_FAILED
+
+    @staticmethod
+    def _host_semaphore(host:str) -> threading.BoundedSemaphore:
+        """Retourne le sémaphore limitant les téléchargements simultanés vers un hôte"""
+        with SourceProcess._host_semaphores_lock:
+            if host not in SourceProcess._host_semaphores:
+                SourceProcess._host_semaphores[host] = threading.BoundedSemaphore(SourceProcess.DOWNLOAD_PER_HOST)
+            return SourceProcess._host_semaphores[host]
 
 
     def _download_without_metadata(self) -> None:
@@ -384,102 +464,167 @@ class SourceProcess:
         # Force title force url file list
         #self.title = os.listdir("sources\\xmarches")
 
-        for i in range(len(self.title)):
-            dico = None 
-
-            if self.format == 'xml':
-                try:
-                    with open(f"sources/{self.source}/{self.title[i]}", encoding=self.encoding if self.encoding else 'utf-8') as xml_file:
-                        dico = xmltodict.parse(xml_file.read(), dict_constructor=dict, \
-                            force_list=('marche','contrat-concession',
-                                'titulaires','donneesExecution','modifications',
-                                'actesSousTraitance','modificationsActesSousTraitance'))
-                                #'techniques','typesPrix','modalitesExecution',
-                                #'considerationsEnvironnementales','considerationsSociales'))
-                except Exception as err:
-                    logging.error(f"Exception lors du chargement du fichier xml {self.title[i]} - {err}")
+        # Pool de validation partagé par tous les fichiers de la source (option -v). Les processus
+        # sont créés par fork : le point de reprise de l'étape GET doit être écrit avant
+        StepMngmt().flush()
+        with UtilsSchema.pool(self.validation_workers) as self.validation_pool:
+            for i in range(len(self.title)):
+                dico = None 
+                file_path = f"sources/{self.source}/{self.title[i]}"
+                file_date = pd.to_datetime(self.url_date[i])
+
+                # Fichier déjà nettoyé lors d'une exécution précédente (même contenu, même schéma, même code)
+                cache_key = self._file_cache_key(file_path, self.title[i], file_date)
+                if cache_key is not None and self._restore_cached_file(cache_key, self.title[i], file_date):
                     continue
 
-                if dico and 'marches' in dico and 'marche' in dico['marches']:
-                    j = 0
-                    for marche in dico['marches']['marche']:
-                        if self.title[i]=='donnees-essentielles-marches09.12.2022.01-39.xml':
-                            print(j)
-                        if self.convert_nc:
-                            NodeFormat.force_bools_nc(['sousTraitanceDeclaree','marcheInnovant','attributionAvance'],marche)
-                            NodeFormat.force_floats_nc(['tauxAvance','origineUE','origineFrance','montant'],marche)
-                            NodeFormat.force_ints_nc(['offresRecues','dureeMois'],marche)
-                        else:
-                            NodeFormat.force_bools(['sousTraitanceDeclaree','marcheInnovant','attributionAvance'],marche)
-                            NodeFormat.force_floats(['tauxAvance','origineUE','origineFrance','montant'],marche)
-                            NodeFormat.force_ints(['offresRecues','dureeMois'],marche)
-
-                        if 'titulaires' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'titulaires', 'titulaire'):
-                            NodeFormat.normalize_list_node(marche,'titulaires', 'titulaire')
-
-                        if 'concessionnaires' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'concessionnaires', 'concessionnaire'):
-                            NodeFormat.normalize_list_node(marche,'concessionnaires', 'concessionnaire')
-                        
-                        if 'donneesExecution' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'donneesExecution', 'donneesAnnuelles'):
-                            NodeFormat.normalize_list_node(marche,'donneesExecution', 'donneesAnnuelles')
-
-                        if 'modifications' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'modifications', 'modification'):
-                            NodeFormat.normalize_list_node(marche,'modifications', 'modification')
-                        NodeFormat.convert_ints(marche,'modifications', 'modification')
-                        NodeFormat.normalize_list_node_inside(marche,'titulaires','titulaire','modifications', 'modification')
-                        
-
-                        if self.format == "xml":
-                            if 'modificationsActesSousTraitance' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'modificationsActesSousTraitance', 'modificationActesSousTraitance'):
-                                NodeFormat.normalize_list_node(marche,'modificationsActesSousTraitance', 'modificationActesSousTraitance')
-                            NodeFormat.convert_ints(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance')
-                        else:
-                            if 'modificationsActesSousTraitance' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance'):
-                                NodeFormat.normalize_list_node(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance')
-                            NodeFormat.convert_ints(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance')
-
-                        if 'actesSousTraitance' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'actesSousTraitance', 'acteSousTraitance'):
-                            NodeFormat.normalize_list_node(marche,'actesSousTraitance', 'acteSousTraitance')
-                        NodeFormat.convert_ints(marche,'actesSousTraitance', 'acteSousTraitance')
-                        
-                        if 'modalitesExecution' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'modalitesExecution', 'modaliteExecution'):
-                            NodeFormat.normalize_list_value(marche,'modalitesExecution', 'modaliteExecution')
-
-                        if 'techniques' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'techniques', 'technique'):
-                            NodeFormat.normalize_list_value(marche,'techniques', 'technique')
-
-                        if 'typesPrix' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'typesPrix', 'typePrix'):
-                            NodeFormat.normalize_list_value(marche,'typesPrix', 'typePrix')
-                            
-                        if 'considerationsSociales' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'considerationsSociales', 'considerationSociale'):
-                            NodeFormat.normalize_list_value(marche,'considerationsSociales', 'considerationSociale')
-                            
-                        if 'considerationsEnvironnementales' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'considerationsEnvironnementales', 'considerationEnvironnementale'):
-                            NodeFormat.normalize_list_value(marche,'considerationsEnvironnementales', 'considerationEnvironnementale')
-                        j += 1
-
-            elif self.format == 'json':
-                try:
-                    with open(f"sources/{self.source}/{self.title[i]}", encoding=self.encoding) as json_file1:
-                        dico = json.load(json_file1)
-                except Exception as err:
-                    logging.error(f"Exception lors du chargement du fichier json {self.title[i]} : {err}")
-                    continue
+                if self.format == 'xml':
+                    # Lecture incrémentale : un enregistrement à la fois est construit et normalisé
+                    try:
+                        records = {}
+                        for tag, record in UtilsXml.iter_records(file_path, self.encoding if self.encoding else 'utf-8'):
+                            if tag == 'marche':
+                                self._normalize_xml_marche(record)
+                            records.setdefault(tag, []).append(record)
+                        dico = {'marches': records}
+                    except Exception as err:
+                        logging.error(f"Exception lors du chargement du fichier xml {self.title[i]} - {err}")
+                        continue
+
+                elif self.format == 'json':
+                    # Lecture en flux des tableaux marches.marche et marches.contrat-concession
+                    try:
+                        records = {}
+                        for tag, batch in UtilsJsonReader.iter_batches(file_path, encoding=self.encoding):
+                            records.setdefault(tag, []).extend(batch)
+                        # Aucun tableau marches.marche ou marches.contrat-concession lu : le fichier n'est ni validé ni mis en cache
+                        dico = {'marches': records} if records else None
+                    except Exception as err:
+                        logging.error(f"Exception lors du chargement du fichier json {self.title[i]} : {err}")
+                        continue
             
-            if dico and 'marches' in dico:
-                try:
-                    self._validation_format(dico['marches'], self.title[i],pd.to_datetime(self.url_date[i]))    #On obtient 2 fichiers qui sont mis jour à chaque tour de boucle
-                except Exception as err:
-                    logging.error(f"Exception lors de la validation du format des données dans {self.title[i]} : {err}")
-                    tb = traceback.format_exc()
-                    logging.error(tb)
-            else:
-                logging.warning(f"Aucune clé 'marches' trouvée dans {self.title[i]}")
+                if dico and 'marches' in dico:
+                    try:
+                        entry = self._validation_format(dico['marches'], self.title[i],file_date)    #On obtient 2 fichiers qui sont mis jour à chaque tour de boucle
+                        if cache_key is not None and entry is not None:
+                            UtilsFileCache.store(self.source, cache_key, entry)
+                    except Exception as err:
+                        logging.error(f"Exception lors de la validation du format des données dans {self.title[i]} : {err}")
+                        tb = traceback.format_exc()
+                        logging.error(tb)
+                else:
+                    logging.warning(f"Aucune clé 'marches' trouvée dans {self.title[i]}")
                 
+        self.validation_pool = None
         logging.info("Fin du nettoyage des nouveaux fichier")
 
+
+    def _file_cache_key(self, file_path:str, file_name:str, file_date) -> str:
+        """Clé du fichier dans le cache de l'étape CLEAN (cf. UtilsFileCache), None si le fichier est illisible"""
+        params = {'source': self.source, 'file': file_name, 'date': file_date.strftime('%Y-%m-%d %H:%M:%S'),
+                  'format': self.format, 'encoding': self.encoding, 'validate': self.validate,
+                  'convert_nc': self.convert_nc, 'spread_over_time': self.spread_over_time}
+        try:
+            return UtilsFileCache.key(file_path, UtilsSchema.SCHEME_PATH, params)
+        except OSError as err:
+            logging.warning(f"Empreinte du fichier {file_name} impossible - {err}")
+            return None
+
+    def _restore_cached_file(self, cache_key:str, file_name:str, file_date) -> bool:
+        """
+        Reprend le résultat de _validation_format enregistré pour ce fichier : enregistrements valides
+        (avec leur db_id), enregistrements ignorés et compteurs du rapport.
+        Retourne False si le fichier n'est pas en cache ou si le fichier ou ses enregistrements
+        ne sont plus présents en base.
+        """
+        entry = UtilsFileCache.load(self.source, cache_key)
+        if entry is None:
+            return False
+        db = DbDecp()
+        try:
+            id_source = db.find_or_add_source(self.source, 0)
+            id_file = db.find_file(file_name, file_date.strftime('%Y-%m-%d %H:%M:%S'), id_source)
+            if id_file is None:
+                return False
+            # Les enregistrements repris doivent toujours être en base pour ce fichier (purge, remplacement par un fichier plus récent)
+            if not db.has_file_records(id_file, [record['db_id'] for record in entry['marches']], [record['db_id'] for record in entry['concessions']]):
+                logging.info(f"Enregistrements de {file_name} modifiés en base depuis leur mise en cache, le fichier est retraité")
+                return False
+            self.dico_2022_marche.extend(entry['marches'])
+            self.dico_2022_concession.extend(entry['concessions'])
+            for counter,value in entry['report'].items():
+                setattr(self.report, counter, getattr(self.report, counter) + value)
+            self.report.inject_db_connection(db)
+            if len(entry['ignored_marches'])>0:
+                self.report.add_ignored(id_source,id_file,'Clean/Marchés',self.report.E_VALIDATION,'Marché non valide',entry['ignored_marches'])
+            if len(entry['ignored_concessions'])>0:
+                self.report.add_ignored(id_source,id_file,'Clean/Concession',self.report.E_VALIDATION,'Concession non valide',entry['ignored_concessions'])
+            self.report.inject_db_connection(None)
+        finally:
+            db.close()
+        logging.info(f"{len(entry['marches']):5} marchés et {len(entry['concessions']):3} concessions valides dans {file_name} repris du cache")
+        return True
+
    
-    def _validation_format(self, dico:dict, file_name:str, file_date) -> None:
+    def _normalize_xml_marche(self, marche:dict) -> None:
+        """
+        Normalise un marché lu dans un fichier xml : conversion des types et mise
+        au format liste des noeuds multiples (titulaires, modifications...).
+        """
+        if self.convert_nc:
+            NodeFormat.force_bools_nc(['sousTraitanceDeclaree','marcheInnovant','attributionAvance'],marche)
+            NodeFormat.force_floats_nc(['tauxAvance','origineUE','origineFrance','montant'],marche)
+            NodeFormat.force_ints_nc(['offresRecues','dureeMois'],marche)
+        else:
+            NodeFormat.force_bools(['sousTraitanceDeclaree','marcheInnovant','attributionAvance'],marche)
+            NodeFormat.force_floats(['tauxAvance','origineUE','origineFrance','montant'],marche)
+            NodeFormat.force_ints(['offresRecues','dureeMois'],marche)
+
+        if 'titulaires' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'titulaires', 'titulaire'):
+            NodeFormat.normalize_list_node(marche,'titulaires', 'titulaire')
+
+        if 'concessionnaires' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'concessionnaires', 'concessionnaire'):
+            NodeFormat.normalize_list_node(marche,'concessionnaires', 'concessionnaire')
+        
+        if 'donneesExecution' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'donneesExecution', 'donneesAnnuelles'):
+            NodeFormat.normalize_list_node(marche,'donneesExecution', 'donneesAnnuelles')
+
+        if 'modifications' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'modifications', 'modification'):
+            NodeFormat.normalize_list_node(marche,'modifications', 'modification')
+        NodeFormat.convert_ints(marche,'modifications', 'modification')
+        NodeFormat.normalize_list_node_inside(marche,'titulaires','titulaire','modifications', 'modification')
+        
+
+        if self.format == "xml":
+            if 'modificationsActesSousTraitance' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'modificationsActesSousTraitance', 'modificationActesSousTraitance'):
+                NodeFormat.normalize_list_node(marche,'modificationsActesSousTraitance', 'modificationActesSousTraitance')
+            NodeFormat.convert_ints(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance')
+        else:
+            if 'modificationsActesSousTraitance' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance'):
+                NodeFormat.normalize_list_node(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance')
+            NodeFormat.convert_ints(marche,'modificationsActesSousTraitance', 'modificationActeSousTraitance')
+
+        if 'actesSousTraitance' in marche.keys() and not NodeFormat.is_normalized_list_node(marche,'actesSousTraitance', 'acteSousTraitance'):
+            NodeFormat.normalize_list_node(marche,'actesSousTraitance', 'acteSousTraitance')
+        NodeFormat.convert_ints(marche,'actesSousTraitance', 'acteSousTraitance')
+        
+        if 'modalitesExecution' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'modalitesExecution', 'modaliteExecution'):
+            NodeFormat.normalize_list_value(marche,'modalitesExecution', 'modaliteExecution')
+
+        if 'techniques' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'techniques', 'technique'):
+            NodeFormat.normalize_list_value(marche,'techniques', 'technique')
+
+        if 'typesPrix' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'typesPrix', 'typePrix'):
+            NodeFormat.normalize_list_value(marche,'typesPrix', 'typePrix')
+            
+        if 'considerationsSociales' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'considerationsSociales', 'considerationSociale'):
+            NodeFormat.normalize_list_value(marche,'considerationsSociales', 'considerationSociale')
+            
+        if 'considerationsEnvironnementales' in marche.keys() and not NodeFormat.is_normalized_list_value(marche,'considerationsEnvironnementales', 'considerationEnvironnementale'):
+            NodeFormat.normalize_list_value(marche,'considerationsEnvironnementales', 'considerationEnvironnementale')
+
+
+    def _validation_format(self, dico:dict, file_name:str, file_date) -> dict:
         """
         Cette fonction permet de vérifier la structure du dictionnaire fournit en
         entrée. Si le schéma est respecté, les marchés et concessions correctes
@@ -491,6 +636,10 @@ class SourceProcess:
             dico : il s'agit d'un dictionnaire avec 2 clés: 'marchés' et 'contrat-concession'
             file_name : nom du fichier où se trouve le dictionnaire dico
 
+        Returns:
+            le résultat du fichier à conserver dans le cache de l'étape CLEAN (cf. UtilsFileCache),
+            None si un enregistrement n'a pas pu être ajouté en base
+
         """
         def complete_util_info(rec,source,file_name,file_date,year_month,position,error_message,error_path):
             # Adding source and file_name for reporting
@@ -514,9 +663,13 @@ class SourceProcess:
 
         nb_total_marches,nb_total_concessions = self.get_nb_enregistrements(dico);
 
+        # Etat avant traitement du fichier, pour le cache de l'étape CLEAN
+        report_counters = ['nb_in_good_marches','nb_in_bad_marches','nb_in_good_concessions','nb_in_bad_concessions']
+        report_before = {counter: getattr(self.report,counter) for counter in report_counters}
+        start_marche, start_concession = len(self.dico_2022_marche), len(self.dico_2022_concession)
+
         logging.info(f"{nb_total_marches:5} marchés et {nb_total_concessions:3} concessions à valider dans {file_name} (total: {(nb_total_marches+nb_total_concessions):5})")
 
-        draft_validator = Draft7Validator(self.json_scheme)
         n, m = 0, 0
         nb_valid_marches,nb_valid_concessions = 0, 0
         dico_ignored_marche, dico_ignored_concession = [], []
@@ -527,17 +680,18 @@ class SourceProcess:
         db = DbDecp()
         id_source = db.find_or_add_source(self.source, 0)
         id_file = db.find_or_add_file(file_name, file_date_str, id_source, nb_total_marches, nb_total_concessions)
+        # Enregistrements valides à ajouter en base en fin de fichier : (ligne pour la base, enregistrement)
+        db_rows_marche, db_rows_concession = [], []
 
         if 'marche' in dico and isinstance(dico['marche'],list):
+            # Check data for json validity
+            local_sources,checks = self.check_records(dico['marche'],'marche')
+            # Get max date of all records at once
+            max_dates = UtilsPublicationDate.max_dates(dico['marche'],file_date_str_short)
             while n < len(dico['marche']) :
                 if dico['marche'][n] is not None:
-                    local_source = dico['marche'][n]["source"] if 'source' in dico['marche'][n] else None
-                    if 'source' in dico['marche'][n]:
-                        del dico['marche'][n]["source"]
-                    dico_test = {'marches': {'marche': [dico['marche'][n]], 'contrat-concession': []}}
-
-                    # Check data for json validity
-                    valid,error_message,error_path = self.check_json_batch(dico_test,draft_validator)
+                    local_source = local_sources[n]
+                    valid,error_message,error_path = checks[n]
 
                     if local_source=='AIFE_test':
                         valid = False
@@ -550,10 +704,11 @@ class SourceProcess:
                         dico_ignored_marche.append(complete_util_info(dico['marche'][n],self.source,file_name,file_date_str,year_month,n,error_message,error_path))
                     if (not self.validate or valid):
                         # Get max date and year_month prefix for category
-                        max_date = self._get_max_date(dico['marche'][n],file_date_str_short)
+                        max_date = max_dates[n]
                         if self.spread_over_time:
                             year_month_record=max_date[0:7] if max_date>='2024-01-01' and max_date<=file_date_str_short else year_month
-                        dico['marche'][n]['db_id'],dico['marche'][n]['tmp__titulaire'] = self._db_add_marche(db,id_source,id_file,file_date_str,n,dico['marche'][n],max_date)
+                        row,dico['marche'][n]['tmp__titulaire'] = self._db_marche_row(n,dico['marche'][n],max_date)
+                        db_rows_marche.append((row,dico['marche'][n]))
                         dico['marche'][n]['tmp__max_date'] = max_date
                         self.dico_2022_marche.append(complete_util_info(dico['marche'][n],self.source if local_source is None else local_source,file_name,file_date_str,year_month_record,n,error_message,error_path))
                         nb_valid_marches+=1
@@ -566,15 +721,13 @@ class SourceProcess:
         self.report.nb_in_good_marches += nb_valid_marches
 
         if 'contrat-concession' in dico and isinstance(dico['contrat-concession'],list):
+            # Check concession for json validity
+            local_sources,checks = self.check_records(dico['contrat-concession'],'contrat-concession',best=True)
+            max_dates = UtilsPublicationDate.max_dates(dico['contrat-concession'],file_date_str_short)
             while m < len(dico['contrat-concession']) :
                 if dico['contrat-concession'][m] is not None:
-                    local_source = dico['contrat-concession'][m]["source"] if 'source' in dico['contrat-concession'][m] else None
-                    if 'source' in dico['contrat-concession'][m]:
-                        del dico['contrat-concession'][m]["source"]
-                    dico_test = {'marches': {'marche': [], 'contrat-concession': [dico['contrat-concession'][m]]}}
-                    
-                    # Check concession for json validity
-                    valid,error_message,error_path = self.check_json(dico_test)
+                    local_source = local_sources[m]
+                    valid,error_message,error_path = checks[m]
 
                     if local_source=='AIFE_test':
                         valid = False
@@ -587,10 +740,11 @@ class SourceProcess:
                         dico_ignored_concession.append(complete_util_info(dico['contrat-concession'][m],self.source,file_name,file_date_str,year_month,m,error_message,error_path))
                     if (not self.validate or valid):
                         # Get max date and year_month category
-                        max_date = self._get_max_date(dico['contrat-concession'][m],file_date_str_short)
+                        max_date = max_dates[m]
                         if self.spread_over_time:
                             year_month_record=max_date[0:7] if max_date>='2024-01-01' and max_date<=file_date_str_short else year_month
-                        dico['contrat-concession'][m]['db_id'],dico['contrat-concession'][m]['tmp__concessionaire'] = self._db_add_concession(db,id_source,id_file,file_date_str,m,dico['contrat-concession'][m],max_date)
+                        row,dico['contrat-concession'][m]['tmp__concessionaire'] = self._db_concession_row(m,dico['contrat-concession'][m],max_date)
+                        db_rows_concession.append((row,dico['contrat-concession'][m]))
                         dico['contrat-concession'][m]['tmp__max_date'] = max_date
                         self.dico_2022_concession.append(complete_util_info(dico['contrat-concession'][m],self.source if local_source is None else local_source,file_name,file_date_str,year_month_record,m,error_message,error_path))
                         nb_valid_concessions+=1
@@ -602,6 +756,10 @@ class SourceProcess:
         # Mise a jour du nombre de concessions validés
         self.report.nb_in_good_concessions += nb_valid_concessions
 
+        # Ajout en masse des enregistrements valides du fichier
+        self._db_bulk_add(db.bulk_add_marche,db.add_marche,id_source,id_file,file_date_str,db_rows_marche)
+        self._db_bulk_add(db.bulk_add_concession,db.add_concession,id_source,id_file,file_date_str,db_rows_concession)
+
         db.update_file(id_file, nb_valid_marches,nb_valid_concessions)
 
         self.report.inject_db_connection(db)
@@ -615,70 +773,61 @@ class SourceProcess:
         
         logging.info(f"{nb_valid_marches:5} marchés et {nb_valid_concessions:3} concessions valides dans {file_name} (total: {(nb_valid_marches+nb_valid_concessions):5}), (ignorés: {len(dico_ignored_marche)} et {len(dico_ignored_concession)})")
 
-    def _db_add_marche(self, db:DbDecp,id_source:int,id_file:int,file_date,n:int,marche,max_date) -> tuple[int,str]:
-        if marche is not None:
-            id = str(marche['id'])
-            #print(id)
-            acheteur_id = str(marche['acheteur']['id'])
-            if 'titulaires' in marche:
-                sorted_ids = sorted(str(item['titulaire']['id']) for item in marche['titulaires'])
-                titulaire = sorted_ids[0][0:64] if isinstance(sorted_ids,list) else None
-                titulaires = ','.join(sorted_ids)
-            else:
-                titulaire = "0"
-                titulaires = "0"
-            date_notification = marche['dateNotification']
-            montant = int(float(marche['montant']))
-            objet = marche['objet']
-            
-            return db.add_marche(id_source,id_file,file_date,n,id,acheteur_id,titulaire,titulaires,date_notification,montant,objet,max_date,marche),titulaire
-                
-    def _db_add_concession(self, db:DbDecp,id_source:int,id_file:int,file_date,n:int,concession,max_date) -> tuple[int,str]:
-        if concession is not None:
-            id = str(concession['id'])
-            #print(id)
-            autorite_concedante_id = str(concession['autoriteConcedante']['id'])
-            if 'concessionnaires' in concession:
-                sorted_ids = sorted(str(item['concessionnaire']['id']) for item in concession['concessionnaires'])
-                concessionnaire = sorted_ids[0][0:64] if isinstance(sorted_ids,list) else None
-                concessionnaires = ','.join(sorted_ids)
-            else:
-                concessionnaire = "0"
-                concessionnaires = "0"
-            date_debut_execution = concession['dateDebutExecution']
-            valeur_globale = float(concession['valeurGlobale'])
-            objet = concession['objet']
-
-            return db.add_concession(id_source,id_file,file_date,n,id,autorite_concedante_id,concessionnaire,concessionnaires,date_debut_execution,valeur_globale,objet,max_date,concession),concessionnaire
-
-    def _get_max_date(self,marche,default_date_str):
-        max_date_record = None
-        if 'datePublicationDonnees' in marche:
-            max_date_record = marche['datePublicationDonnees']
-        if 'modifications' in marche:
-            for m in marche['modifications']:
-                if not m is None and 'modification' in m:
-                    m = m['modification']
-                    if 'datePublicationDonneesModification' in m and m['datePublicationDonneesModification']>max_date_record:
-                        max_date_record = m['datePublicationDonneesModification']
-        if 'actesSousTraitance' in marche and isinstance(marche['actesSousTraitance'],list):
-            for m in marche['actesSousTraitance']:
-                if not m is None and 'acteSousTraitance' in m:
-                    m = m['acteSousTraitance']
-                    if 'datePublicationDonnees' in m and m['datePublicationDonnees']>max_date_record:
-                        max_date_record = m['datePublicationDonnees']
-        try:
-            tmp_date = pd.to_datetime(max_date_record)
-            """
-            if tmp_date<self.min_date or tmp_date>self.max_date:
-                #max_date_record=self.min_date
-                return default_date
-            if tmp_date < self.start_date:
-                tmp_date = self.start_date
-            """
-        except Exception as err:
-            max_date_record = default_date_str
-        return max_date_record
+        marches, concessions = self.dico_2022_marche[start_marche:], self.dico_2022_concession[start_concession:]
+        if any(record.get('db_id') is None for record in marches + concessions):
+            return None
+        return {'marches': marches,
+                'concessions': concessions,
+                'ignored_marches': dico_ignored_marche,
+                'ignored_concessions': dico_ignored_concession,
+                'report': {counter: getattr(self.report,counter) - report_before[counter] for counter in report_counters}}
+
+    def _db_bulk_add(self, bulk_add, add, id_source:int, id_file:int, file_date, db_rows:list) -> None:
+        """
+        Ajoute en base les enregistrements valides d'un fichier en une seule opération et renseigne 
+        leur db_id. En cas d'échec de l'ajout en masse, les enregistrements sont ajoutés un par un.
+        """
+        if len(db_rows) == 0:
+            return
+        ids = bulk_add(id_source,id_file,file_date,[row for row,record in db_rows])
+        if ids is None:
+            logging.warning("Échec de l'ajout en masse, ajout des enregistrements un par un")
+            ids = [add(id_source,id_file,file_date,*row[:-1],json.loads(row[-1])) for row,record in db_rows]
+        for (row,record),db_id in zip(db_rows,ids):
+            record['db_id'] = db_id
+
+    def _db_marche_row(self, n:int, marche, max_date) -> tuple[tuple,str]:
+        """Retourne la ligne à ajouter en base pour un marché (cf. DbDecp.bulk_add_marche) et son titulaire de référence"""
+        id = str(marche['id'])
+        acheteur_id = str(marche['acheteur']['id'])
+        if 'titulaires' in marche:
+            sorted_ids = sorted(str(item['titulaire']['id']) for item in marche['titulaires'])
+            titulaire = sorted_ids[0][0:64] if isinstance(sorted_ids,list) else None
+            titulaires = ','.join(sorted_ids)
+        else:
+            titulaire = "0"
+            titulaires = "0"
+        date_notification = marche['dateNotification']
+        montant = int(float(marche['montant']))
+        objet = marche['objet']
+        # Le json est sérialisé avant l'ajout des informations techniques (db_id, tmp__, report__)
+        return (n,id,acheteur_id,titulaire,titulaires,date_notification,montant,objet,max_date,json.dumps(marche)),titulaire
+
+    def _db_concession_row(self, n:int, concession, max_date) -> tuple[tuple,str]:
+        """Retourne la ligne à ajouter en base pour une concession (cf. DbDecp.bulk_add_concession) et son concessionnaire de référence"""
+        id = str(concession['id'])
+        autorite_concedante_id = str(concession['autoriteConcedante']['id'])
+        if 'concessionnaires' in concession:
+            sorted_ids = sorted(str(item['concessionnaire']['id']) for item in concession['concessionnaires'])
+            concessionnaire = sorted_ids[0][0:64] if isinstance(sorted_ids,list) else None
+            concessionnaires = ','.join(sorted_ids)
+        else:
+            concessionnaire = "0"
+            concessionnaires = "0"
+        date_debut_execution = concession['dateDebutExecution']
+        valeur_globale = float(concession['valeurGlobale'])
+        objet = concession['objet']
+        return (n,id,autorite_concedante_id,concessionnaire,concessionnaires,date_debut_execution,valeur_globale,objet,max_date,json.dumps(concession)),concessionnaire
 
     def _add_column_type(self, df: pd.DataFrame, default_type_name:str = None) -> None :
         """
@@ -757,27 +906,6 @@ class SourceProcess:
             return False, err.message, err.json_path
         return True, None, None
 
-    def _validate_json_batch(self, json_data:dict,draft_validator:Draft7Validator) -> tuple[bool,str,str]:
-        """
-        Fonction vérifiant si le fichier jsn "json_data" respecte
-        le schéma spécifié dans le  schéma en paramètre "json_scheme". 
-
-        Args: 
-
-            json_data: dictionnaire qui va être vérifié par le validateur
-            draft_validator: Instance du validator initialisee avec le schéma à respecter
-
-        """
-        try:
-            # Draft7Validator.check_schema(jsonScheme)
-            # Draft202012Validator.check_schema(jsonScheme)
-            draft_validator.validate(instance=json_data)
-        except jsonschema.exceptions.ValidationError as err: 
-            #logging.error(f"Erreur de validation json - {err.message}")
-            return False, err.message, err.json_path
-        return True, None, None
-
-
     def check_json(self,json_data) -> tuple[bool,str,str]:
         """
         Fonction qui prend en paramètre une donnée json
@@ -790,18 +918,39 @@ class SourceProcess:
         """
         return self._validate_json(json_data,self.json_scheme)
     
-    def check_json_batch(self,json_data,draft_validator:Draft7Validator) -> tuple[bool,str,str]:
+    def check_record(self,record:dict,record_type:str,best:bool=False) -> tuple[bool,str,str]:
         """
-        Fonction qui prend en paramètre une donnée json
-        et vérifiant, grâce à un schéma, que la donnée est valide.
+        Fonction vérifiant qu'un marché ou une concession respecte le schéma de référence,
+        avec le validateur compilé une seule fois par processus (cf. UtilsSchema).
 
         Args:
 
-            json_data : donnée json en entrée
+            record : marché ou concession en entrée
+            record_type : 'marche' ou 'contrat-concession'
+            best : retourne l'erreur la plus pertinente (comme check_json) plutôt que la première
 
         """
-        return self._validate_json_batch(json_data,draft_validator)
-    
+        return UtilsSchema.validate_record(record,record_type,best)
+
+    def check_records(self,records:list,record_type:str,best:bool=False) -> tuple[list,list]:
+        """
+        Fonction validant tous les marchés ou concessions d'un fichier, en parallèle dans le
+        pool de validation de l'étape CLEAN (self.validation_workers processus, option -v). La clé 'source' de chaque enregistrement
+        est retirée avant validation.
+
+        Args:
+
+            records : liste des marchés ou concessions en entrée
+            record_type : 'marche' ou 'contrat-concession'
+            best : retourne l'erreur la plus pertinente plutôt que la première
+
+        Returns:
+            (liste des sources retirées, liste des tuples (valide, message d'erreur, chemin de l'erreur)),
+            dans l'ordre de records
+        """
+        local_sources = [record.pop('source',None) if record is not None else None for record in records]
+        return local_sources,UtilsSchema.validate_records(records,record_type,best,self.validation_pool)
+
 
     def convert_boolean_DEPRECATED(self,col_name:str) -> None:
         """
@@ -927,32 +1076,24 @@ class SourceProcess:
 
         ## Suppression des doublons
 
-        # Conversion des valeurs pour uniformiser les comparaisons
-        df_str = self.df.astype(str)
-        
-        # For statistics purpose only
+        # Clé hachée de chaque enregistrement (les valeurs sont comparées sous forme de texte, colonne par colonne)
         excluded_columns = ['report__file','ref__file_date','report__nbtotal','report__error','report__position','db_id','tmp__max_date','tmp__annee_mois','backup__montant']
-        df_marche = df_str[df_str['_type'].str.contains("Marché")]
-        if len(df_marche[df_marche.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])>0:
-            nb = len(df_marche[df_marche.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])
-            self.report.add('Fix/Marchés',self.report.D_DUPLICATE,'Doublon stricts dans la source',df_marche[df_marche.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])
-            self.report.nb_duplicated_marches += len(df_marche[df_marche.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])
-            logging.info(f"{nb} marchés en doublon")
-
-        df_concession = df_str[~df_str['_type'].str.contains("Marché")]
-        if len(df_concession[df_concession.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])>0:
-            nb = len(df_concession[df_concession.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])
-            self.report.add('Fix/Concessions',self.report.D_DUPLICATE,'Doublon stricts dans la source',df_concession[df_concession.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])
-            self.report.nb_duplicated_concessions += len(df_concession[df_concession.duplicated(subset=df_marche.columns.difference(excluded_columns), keep="last")])
-            logging.info(f"{nb} concessions en doublon")
-        
         if not self.df.empty:
-            df_sorted = df_str.sort_values('tmp__max_date')
-            index_to_keep = df_sorted.drop_duplicates(
-                subset=df_marche.columns.difference(excluded_columns),
-                keep='last'
-                ).index.tolist()
-            #index_to_keep = df_str.drop_duplicates(subset=df_marche.columns.difference(['report__file','report__nbtotal','report__error','report__position','tmp__annee_mois']), keep="last").index.tolist()
+            self.df = self.df.reset_index(drop=True)
+            is_marche = self.df['_type'].astype(str).str.contains("Marché").values
+            keys = UtilsDedup.hash_keys(self.df, self.df.columns.difference(excluded_columns))
+            index_to_keep, nb_duplicated = UtilsDedup.keep_last(keys, is_marche, self.df['tmp__max_date'].astype(str))
+            to_drop = np.ones(len(self.df), dtype=bool)
+            to_drop[index_to_keep] = False
+
+            # For statistics purpose only
+            for marche,step,counter,label in ((True,'Fix/Marchés','nb_duplicated_marches','marchés'),(False,'Fix/Concessions','nb_duplicated_concessions','concessions')):
+                nb = nb_duplicated.get(marche, 0)
+                if nb>0:
+                    self.report.add(step,self.report.D_DUPLICATE,'Doublon stricts dans la source',self.df[to_drop & (is_marche==marche)].astype(str))
+                    setattr(self.report, counter, getattr(self.report, counter) + nb)
+                    logging.info(f"{nb} {label} en doublon")
+
             self.df = self.df.iloc[index_to_keep]
             self.df = self.df.reset_index(drop=True)
 
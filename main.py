@@ -7,6 +7,7 @@ from datetime import date,datetime
 from utils.StepMngmt import StepMngmt
 from utils.Step import Step
 import augmente.data_management
+import augmente.manifest
 import augmente.nettoyage
 import augmente.utils
 import os
@@ -67,22 +68,39 @@ def main_augmente(session_id:str,data_format:str = '2022'):
     end_year, end_month = today.year, today.month
 
     # Sauvegarde des marchés et concessions uniques regroupées par année et mois de date de 
+    months = []
     year, month = start_year, start_month
     while (year, month) <= (end_year, end_month):
-        ref_date = f"{year}-{month:02d}"
-        augmente.nettoyage.main(session_id,ref_date,data_format)
+        months.append(f"{year}-{month:02d}")
+        if month == 12:
+            year += 1
+            month = 1
+        else:
+            month += 1
+
+    # Seuls les mois dont le fichier json a changé depuis le dernier traitement sont retraités
+    manifest = augmente.manifest.load()
+    keys = {ref_date: augmente.manifest.input_key(ref_date,data_format) for ref_date in months}
+    unchanged = [ref_date for ref_date in months if augmente.manifest.is_up_to_date(manifest,ref_date,keys[ref_date])]
+    if unchanged:
+        logger.info(f"Mois inchangés, csv précédents conservés : {', '.join(unchanged)}")
+    months = [ref_date for ref_date in months if ref_date not in unchanged]
 
+    def export_month(ref_date:str):
         # Partie désactivé logger.info("Enrichissement des données")
         # enrichissement2.main()
         # logger.info("csv enrichi dans le dossier data")
         if not args.test and not args.local:
             augmente.utils.export_all_csv(ref_date,data_format,args.local)
+        augmente.manifest.record(manifest,ref_date,keys[ref_date],augmente.nettoyage.csv_files(ref_date,data_format))
 
-        if month == 12:
-            year += 1
-            month = 1
-        else:
-            month += 1
+    month_workers = min(getattr(args,'month_workers',None) or 1, len(months))
+    if month_workers <= 1:
+        for ref_date in months:
+            augmente.nettoyage.main(session_id,ref_date,data_format)
+            export_month(ref_date)
+    else:
+        augmente.nettoyage.main_months(session_id,months,data_format,month_workers,export_month)
 
 if __name__ == "__main__":
     """Lorsqu'on appelle la fonction main (courante), on définit le niveau de logging et le format d'affichage."""
@@ -123,6 +141,9 @@ if __name__ == "__main__":
     logging.info("(-r) Option reprise à la dernière étape exécutée " + ("desactivée" if args.reset else "activée"))
     logging.info("(-b) Option reconstruction globale " + ("activée pour " if args.rebuild else "désactivée") + (args.rebuild if args.rebuild else ""))
     logging.info("(-P) Option process spécifique " + ("activée pour " if args.process else "désactivée") + (args.process if args.process else ""))
+    logging.info(f"(-w) Nombre de processus pour le traitement des sources : {args.workers}")
+    logging.info(f"(-v) Nombre de processus pour la validation des enregistrements : {args.validation_workers}")
+    logging.info(f"(-M) Nombre de processus pour le traitement des mois de decp-augmente : {args.month_workers}")
 
     # On ne reprend pas l'exécution à la dernière étape du précédent lancement de l'application, on supprime le cache d'exécution
     if args.reset:
@@ -1,7 +1,7 @@
 from datetime import datetime
 import pandas as pd
-import json
 import os
+from utils.UtilsJsonWriter import UtilsJsonWriter
 
 from database.Db import Db
 
@@ -201,7 +201,7 @@ class Report:
             'sources': self.messages
             }
         with open(f"results/{currentday}-errors.json", 'w+', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=4)
+            UtilsJsonWriter.dump(json_data, f, pretty=True, indent=4)
 
     # Save in memory current statistics and reinit statistics 
     def fix_statistics (self,source):
@@ -220,6 +220,13 @@ class Report:
         })
         self.init()
     
+    # Merge statistics and messages produced by another process (parallel processing of sources)
+    def merge(self,statistics:list,messages:dict):
+        self.statistics.extend(statistics)
+        for source,codes in messages.items():
+            for code_erreur,records in codes.items():
+                self.messages.setdefault(source,{}).setdefault(code_erreur,[]).extend(records)
+
     # Save statistics to a file 
     def save_statistics(self):
         title = 'Nombre de marchés et de concessions en entrées de rama par sources'
@@ -230,4 +237,4 @@ class Report:
             'sources': self.statistics
             }
         with open(f"results/{currentday}-statistics.json", 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=4)
+            UtilsJsonWriter.dump(json_data, f, pretty=True, indent=4)
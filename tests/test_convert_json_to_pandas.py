@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+from augmente.convert_json_to_pandas import prise_en_compte_modifications
+
+# df.at change le type d'une colonne existante avec un FutureWarning de pandas
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+
+def reference_prise_en_compte_modifications(df: pd.DataFrame, col_to_normalize: str = 'modifications',
+                                            col_suffix: str='Modification',sub_element: str='modification'):
+    """Implémentation précédente (écriture cellule par cellule avec df.at), référence du comportement attendu"""
+    to_normalize = df[col_to_normalize]
+    df["boolean"+col_suffix] = 0
+    for i in range(len(to_normalize)):
+        json_modification = to_normalize[i]
+        if type(json_modification)==dict:
+            json_modification = [json_modification]
+        if type(json_modification) == list:
+            if json_modification != []:
+                if len(json_modification[0])>1:
+                    for col in json_modification[0].keys():
+                        col_init = col
+                        if col_suffix not in col:
+                            col += col_suffix
+                        if col not in df.columns:
+                            df[col] = ""
+                        if (col == "objetModification") and (json_modification[0][col_init] != None) and (isinstance(json_modification[0][col_init], str)):
+                            df.at[i,col]= json_modification[0][col_init].replace("\n", "\\n").replace("\r", "\\r")
+                        else:
+                            df.at[i,col] = json_modification[0][col_init]
+                        df.at[i,"boolean"+col_suffix] = 1
+                else:
+                    if sub_element in json_modification[0] and isinstance(json_modification[0][sub_element],dict):
+                        for col in json_modification[0][sub_element].keys():
+                            col_init = col
+                            if col_suffix not in col:
+                                col += col_suffix
+                            if col not in df.columns:
+                                df[col] = ""
+                            if (col == "objetModification") and (json_modification[0][sub_element][col_init] != None) and (isinstance(json_modification[0][sub_element][col_init], str)):
+                                 df.at[i,col] = json_modification[0][sub_element][col_init].replace("\n", "\\n").replace("\r", "\\r")
+                            else:
+                                 df.at[i,col] = json_modification[0][sub_element][col_init]
+                            df.loc[i,"boolean"+col_suffix] = 1
+
+
+def cells(df:pd.DataFrame) -> dict:
+    """Contenu comparable du dataframe : types des colonnes et représentation de chaque valeur (None, NaN et '' distingués)"""
+    return {column: (str(df[column].dtype), [repr(value) for value in df[column]]) for column in df.columns}
+
+
+def assert_same_as_reference(df:pd.DataFrame, *args):
+    expected = df.copy(deep=True)
+    reference_prise_en_compte_modifications(expected, *args)
+    result = df.copy(deep=True)
+
+    assert prise_en_compte_modifications(result, *args) is None
+
+    assert list(result.columns) == list(expected.columns)
+    assert list(result.index) == list(expected.index)
+    assert cells(result) == cells(expected)
+    return result
+
+
+def test_first_modification_is_split_into_columns():
+    df = pd.DataFrame({'id': ['a', 'b', 'c', 'd'], 'modifications': [
+        [{'id': 1, 'montant': 10, 'titulaires': [{'titulaire': {'id': '1'}}]}, {'id': 2, 'montant': 20}],
+        [],
+        np.nan,
+        {'id': 3, 'dureeMois': 12},
+    ]})
+
+    result = assert_same_as_reference(df)
+
+    assert result['booleanModification'].tolist() == [1, 0, 0, 1]
+    assert result['idModification'].tolist() == [1, '', '', 3]
+
+
+def test_objet_modification_escaping():
+    df = pd.DataFrame({'id': ['a', 'b', 'c', 'd'], 'modifications': [
+        [{'id': 1, 'objet': 'ligne 1\nligne 2\r\n'}],
+        [{'id': 2, 'objet': None}],
+        [{'id': 3, 'objet': 12}],
+        [{'id': 4, 'montant': 1}],
+    ]})
+
+    result = assert_same_as_reference(df)
+
+    assert result['objetModification'].tolist() == ['ligne 1\\nligne 2\\r\\n', None, 12, '']
+
+
+def test_sub_element():
+    df = pd.DataFrame({'id': ['a', 'b', 'c', 'd'], 'acteSousTraitance': [
+        [{'acteSousTraitance': {'id': 1, 'montant': 100, 'objet': 'a\nb'}}],
+        [{'autre': {'id': 2}}],
+        [{'acteSousTraitance': 'texte'}],
+        [{'acteSousTraitance': {}}],
+    ]})
+
+    result = assert_same_as_reference(df, 'acteSousTraitance', 'ActeSousTraitance', 'acteSousTraitance')
+
+    assert result['booleanActeSousTraitance'].tolist() == [1, 0, 0, 0]
+
+
+@pytest.mark.parametrize('values', [[1, 2, 3], [1.0, np.nan, 3.0], ['x', 'y', 'z'], [True, False, True]], ids=['int', 'float', 'object', 'bool'])
+@pytest.mark.parametrize('value', [7, 1.5, 'texte', None, np.nan, True, [1]], ids=repr)
+def test_existing_column_dtype(values, value):
+    df = pd.DataFrame({'montantModification': values, 'modifications': [
+        [{'id': 1, 'montantModification': value}], None, [{'id': 2, 'montant': value}]
+    ]})
+
+    assert_same_as_reference(df)
@@ -0,0 +1,86 @@
+import locale
+import pytest
+
+pytest.importorskip('psycopg2')
+try:
+    from database.DbDecp import DbDecp
+except locale.Error:
+    # DbDecp impose la locale fr_FR.UTF-8 à l'import
+    pytest.skip("locale fr_FR.UTF-8 non disponible", allow_module_level=True)
+
+FILE_DATE = '2025-03-01 10:00:00'
+
+
+def row(ord:int, key:int, length:int = 14, max_date:str = '2025-02-01', found:bool = False, found_max_date:str = None, found_length:int = None, list_length:int = None) -> tuple:
+    """
+    Ligne lue par _bulk_add : (ord, clé, longueur comparée, max_date, présent en base, max_date en base,
+    longueur de la liste en base, longueur de la liste)
+    """
+    return (ord, key, length, max_date, found, found_max_date, found_length, length if list_length is None else list_length)
+
+
+def test_new_record_is_kept():
+    assert DbDecp.bulk_add_statuts([row(0, 1)], FILE_DATE) == {0: ('retenu', False)}
+
+
+def test_existing_record_is_replaced():
+    statuts = DbDecp.bulk_add_statuts([row(0, 1, found=True, found_max_date='2025-01-15', found_length=14)], FILE_DATE)
+
+    assert statuts == {0: ('retenu', True)}
+
+
+def test_existing_record_without_date_is_replaced():
+    statuts = DbDecp.bulk_add_statuts([row(0, 1, found=True, found_max_date=None, found_length=14)], FILE_DATE)
+
+    assert statuts == {0: ('retenu', True)}
+
+
+def test_more_recent_existing_record_makes_a_doublon():
+    statuts = DbDecp.bulk_add_statuts([row(0, 1, found=True, found_max_date='2025-04-01', found_length=14)], FILE_DATE)
+
+    assert statuts == {0: ('doublon', False)}
+
+
+def test_shorter_existing_list_makes_a_doublon():
+    statuts = DbDecp.bulk_add_statuts([row(0, 1, length=29, found=True, found_max_date='2025-01-15', found_length=14)], FILE_DATE)
+
+    assert statuts == {0: ('doublon', False)}
+
+
+def test_same_key_in_file_last_record_replaces_first():
+    statuts = DbDecp.bulk_add_statuts([row(0, 1), row(1, 1)], FILE_DATE)
+
+    assert statuts == {0: ('remplace', False), 1: ('retenu', False)}
+
+
+def test_same_key_in_file_keeps_the_replacement_of_the_existing_record():
+    rows = [row(0, 1, found=True, found_max_date='2025-01-15', found_length=14),
+            row(1, 1, found=True, found_max_date='2025-01-15', found_length=14)]
+
+    statuts = DbDecp.bulk_add_statuts(rows, FILE_DATE)
+
+    # Le premier enregistrement remplace celui de la base avant d'être lui-même remplacé
+    assert statuts == {0: ('remplace', True), 1: ('retenu', False)}
+
+
+def test_same_key_in_file_with_longer_list_makes_a_doublon():
+    statuts = DbDecp.bulk_add_statuts([row(0, 1, length=14), row(1, 1, length=29)], FILE_DATE)
+
+    assert statuts == {0: ('retenu', False), 1: ('doublon', False)}
+
+
+def test_same_key_in_file_compares_with_stored_list_length():
+    # Concessions : la longueur de concessionnaire est comparée à celle de concessionnaires de l'enregistrement retenu
+    rows = [row(0, 1, length=14, list_length=16), row(1, 1, length=15, list_length=17), row(2, 1, length=18, list_length=20)]
+
+    statuts = DbDecp.bulk_add_statuts(rows, FILE_DATE)
+
+    assert statuts == {0: ('remplace', False), 1: ('retenu', False), 2: ('doublon', False)}
+
+
+def test_keys_are_independent():
+    rows = [row(0, 1), row(1, 2, found=True, found_max_date='2025-04-01', found_length=14), row(2, 1), row(3, 3)]
+
+    statuts = DbDecp.bulk_add_statuts(rows, FILE_DATE)
+
+    assert statuts == {0: ('remplace', False), 1: ('doublon', False), 2: ('retenu', False), 3: ('retenu', False)}
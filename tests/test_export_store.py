@@ -0,0 +1,95 @@
+import os
+import numpy as np
+import pytest
+from utils.ExportStore import ExportStore
+
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(ExportStore, 'BASE_PATH', str(tmp_path) + '/')
+    return tmp_path
+
+
+def new_store() -> ExportStore:
+    return ExportStore('decp-2025-01', {'concession': ['id', 'autoriteConcedante']}, ['id', 'acheteur'])
+
+
+def marche(id, max_date:str = '2025-01-10', acheteur:str = 'A', **fields) -> dict:
+    return {'_type': 'Marché', 'id': id, 'acheteur': acheteur, 'tmp__max_date': max_date, **fields}
+
+
+def segment_files(store_path) -> list:
+    return sorted(f for f in os.listdir(store_path / 'decp-2025-01') if f.startswith('segment-'))
+
+
+def test_index_is_reloaded(store_path):
+    store = new_store()
+    assert not store.exists()
+
+    assert store.merge([marche(1), marche(2), marche(3)]) == (3, 0, 0)
+
+    reloaded = new_store()
+    assert reloaded.exists()
+    assert len(reloaded) == 3
+    assert [record['id'] for record in reloaded.iter_records()] == [1, 2, 3]
+
+
+def test_merge_replaces_more_recent_and_ignores_older(store_path):
+    new_store().merge([marche(1), marche(2)])
+
+    store = new_store()
+    assert store.merge([marche(1, '2025-01-20', montant=2), marche(2, '2025-01-01', montant=2), marche(3)]) == (1, 1, 1)
+
+    records = {record['id']: record for record in new_store().iter_records()}
+    assert sorted(records) == [1, 2, 3]
+    assert records[1]['montant'] == 2
+    assert 'montant' not in records[2]
+
+
+def test_merge_keeps_last_duplicate_of_batch(store_path):
+    store = new_store()
+
+    assert store.merge([marche(1, montant=1), marche(1, montant=2)]) == (1, 0, 1)
+    assert [record['montant'] for record in store.iter_records()] == [2]
+
+
+def test_record_key_ignores_numeric_types(store_path):
+    store = new_store()
+
+    assert store.record_key(marche(1)) == store.record_key(marche(1.0)) == store.record_key(marche(np.int64(1)))
+    assert store.record_key(marche(1)) != store.record_key(marche(1.5))
+    assert store.record_key(marche(1)) != store.record_key({**marche(1), '_type': 'concession'})
+
+    store.merge([marche(1)])
+    assert store.merge([marche(np.float64(1.0), '2025-01-20')]) == (0, 1, 0)
+    assert len(store) == 1
+
+
+def test_fully_replaced_segment_is_dropped(store_path):
+    store = new_store()
+    store.merge([marche(1), marche(2)])
+
+    store.merge([marche(1, '2025-01-20'), marche(2, '2025-01-20'), marche(3), marche(4)])
+
+    assert segment_files(store_path) == ['segment-00001.pkl']
+    reloaded = new_store()
+    assert reloaded.segments == [1]
+    assert reloaded.nb_stored == 4
+    assert [record['id'] for record in reloaded.iter_records()] == [1, 2, 3, 4]
+
+
+def test_segments_are_compacted(store_path):
+    store = new_store()
+    store.merge([marche(1), marche(2), marche(3), marche(4)])
+    store.merge([marche(1, '2025-01-20'), marche(2, '2025-01-20'), marche(3, '2025-01-20')])
+    assert segment_files(store_path) == ['segment-00000.pkl', 'segment-00001.pkl']
+
+    # 4 enregistrements valides sur 10 stockés : compactage en un seul segment
+    store.merge([marche(1, '2025-01-30'), marche(2, '2025-01-30'), marche(3, '2025-01-30')])
+
+    assert segment_files(store_path) == ['segment-00003.pkl']
+    reloaded = new_store()
+    assert reloaded.segments == [3]
+    assert reloaded.nb_stored == 4
+    records = {record['id']: record['tmp__max_date'] for record in reloaded.iter_records()}
+    assert records == {1: '2025-01-30', 2: '2025-01-30', 3: '2025-01-30', 4: '2025-01-10'}
@@ -0,0 +1,214 @@
+import locale
+import numpy as np
+import pandas as pd
+import pytest
+import random
+
+try:
+    from augmente.nettoyage import keep_more_recent
+except (locale.Error, FileNotFoundError) as err:
+    # nettoyage impose la locale fr_FR.UTF-8 (DbDecp) et lit confs/config_data.json à l'import
+    pytest.skip(f"augmente.nettoyage non importable : {err}", allow_module_level=True)
+
+# Ecriture cellule par cellule de l'implémentation de référence
+pytestmark = pytest.mark.filterwarnings('ignore::FutureWarning')
+
+
+def reference_keep_more_recent(df:pd.DataFrame,field_name:str,suffix:str)-> pd.DataFrame:
+    """Implémentation précédente (iterrows et écriture cellule par cellule), référence du comportement attendu"""
+    def comparer_dico(dico_un: dict, dico_deux:dict)->dict:
+        if dico_un is None:
+            return dico_deux
+        elif dico_deux is None:
+            return dico_un
+        date_une = dico_un.get("datePublicationDonnees", None) or dico_un.get("datePublicationDonneesModification", None)
+        date_deux = dico_deux.get("datePublicationDonnees", None) or dico_deux.get("datePublicationDonneesModification", None)
+        if date_une is None or (date_une <= date_deux):
+            return dico_deux
+        if date_deux is None or(date_une > date_deux):
+            return dico_un
+
+    if field_name in df.columns:
+        listes_non_vides = df[df[field_name].apply(lambda x: isinstance(x, list) and len(x) > 0)]
+        listes_vides = df[~df[field_name].apply(lambda x: isinstance(x, list) and len(x) > 0)]
+        if not 'id'+suffix in listes_non_vides:
+            listes_non_vides['id'+suffix] = ""
+        else:
+            listes_non_vides['id'+suffix] = listes_non_vides['id'+suffix].astype(int,errors='ignore').astype(str)
+        if not 'dureeMois'+suffix in listes_non_vides:
+            listes_non_vides['dureeMois'+suffix] = ""
+        else:
+            listes_non_vides['dureeMois'+suffix] = listes_non_vides['dureeMois'+suffix].astype(int,errors='ignore').astype(str)
+        if not 'datePublicationDonnees'+suffix in listes_non_vides:
+            listes_non_vides['datePublicationDonnees'+suffix] = ""
+        for index, ligne in listes_non_vides.iterrows():
+            dico_plus_recent = {}
+            for element in ligne[field_name]:
+                if isinstance(element,dict) and len(element.keys())==1:
+                    cle = list(element.keys())[0]
+                    dico_deux = element[cle]
+                    dico_plus_recent = comparer_dico(dico_plus_recent,dico_deux)
+                elif isinstance(element,dict):
+                    dico_plus_recent = comparer_dico(dico_plus_recent,element)
+            listes_non_vides.at[index, field_name] = [dico_plus_recent] if dico_plus_recent else []
+            listes_non_vides = reference_complete_columns_from_list(listes_non_vides,field_name,index,dico_plus_recent)
+        df = pd.concat([listes_non_vides, listes_vides], ignore_index=True)
+    return df
+
+
+def reference_complete_columns_from_list(df:pd.DataFrame,field_name:str, ligne:int, dico: dict) -> pd.DataFrame:
+    if field_name=='actesSousTraitance':
+        df.loc[ligne, 'idActeSousTraitance'] = dico.get('id', None)
+        df.loc[ligne, 'dureeMoisActeSousTraitance'] = dico.get('dureeMois', None)
+        df.loc[ligne, 'dateNotificationActeSousTraitance'] = dico.get('dateNotification', None)
+        df.loc[ligne, 'montantActeSousTraitance'] = dico.get('montant', None)
+        df.loc[ligne, 'variationPrixActeSousTraitance'] = dico.get('variationPrix', None)
+        df.loc[ligne, 'datePublicationDonneesActeSousTraitance'] = dico.get('datePublicationDonnees', None)
+        df.loc[ligne, 'idSousTraitant'] = dico.get('sousTraitant', {}).get('id', None)
+        df.loc[ligne, 'typeIdentifiantSousTraitant'] = dico.get('sousTraitant', {}).get('typeIdentifiant', None)
+    if field_name=='modifications':
+        df.loc[ligne, 'idModification'] = dico.get('id', None)
+        df.loc[ligne, 'dureeMoisModification'] = dico.get('dureeMoisActeSousTraitance', None)
+        df.loc[ligne, 'montantModification'] = dico.get('montant', None)
+        df.loc[ligne, 'idTitulaireModification'] = dico.get('titulaires', [{}])[0].get('id', None)
+        df.loc[ligne, 'typeIdentifiantTitulaireModification'] = dico.get('titulaires', [{}])[0].get('typeIdentifiant', None)
+        df.loc[ligne, 'dateNotificationModificationModification'] = dico.get('dateNotificationModification', None)
+        df.loc[ligne, 'datePublicationDonneesModificationModification'] = dico.get('datePublicationDonneesModification', None)
+    if field_name=='modificationsActesSousTraitance':
+        df.loc[ligne, 'idModificationActeSousTraitance'] = dico.get('id', None)
+        df.loc[ligne, 'dureeMoisModificationActeSousTraitance'] = dico.get('dureeMois', None)
+        df.loc[ligne, 'dateNotificationModificationSousTraitanceModificationActeSousTraitance'] = dico.get('dateNotificationModificationSousTraitance', None)
+        df.loc[ligne, 'montantModificationActeSousTraitance'] = dico.get('montant', None)
+        df.loc[ligne, 'datePublicationDonneesModificationActeSousTraitance'] = dico.get('datePublicationDonnees', None)
+    return df
+
+
+def cells(df:pd.DataFrame) -> dict:
+    """Contenu comparable du dataframe : types des colonnes et représentation de chaque valeur (None, NaN et '' distingués)"""
+    return {column: (str(df[column].dtype), [repr(value) for value in df[column]]) for column in df.columns}
+
+
+def assert_same_as_reference(df:pd.DataFrame, field_name:str, suffix:str) -> pd.DataFrame:
+    expected = reference_keep_more_recent(df.copy(deep=True), field_name, suffix)
+
+    result = keep_more_recent(df.copy(deep=True), field_name, suffix)
+
+    assert list(result.columns) == list(expected.columns)
+    assert list(result.index) == list(expected.index)
+    assert cells(result) == cells(expected)
+    return result
+
+
+def test_last_element_wins_on_date_ties():
+    df = pd.DataFrame({'id': ['a', 'b'], 'modifications': [
+        [{'id': 1, 'datePublicationDonneesModification': '2024-01-01'},
+         {'id': 2, 'datePublicationDonneesModification': '2024-01-01'},
+         {'id': 3, 'datePublicationDonneesModification': '2023-12-31'}],
+        [{'id': 4, 'datePublicationDonnees': '2024-03-01'},
+         {'id': 5, 'datePublicationDonneesModification': '2024-03-01', 'montant': 5}],
+    ]})
+
+    result = assert_same_as_reference(df, 'modifications', 'Modification')
+
+    assert result['idModification'].tolist() == [2, 5]
+    assert result['modifications'].tolist() == [[df['modifications'][0][1]], [df['modifications'][1][1]]]
+
+
+def test_undated_elements():
+    # Eléments non datés uniquement : le dernier l'emporte
+    df = pd.DataFrame({'id': ['a'], 'modifications': [[{'id': 1, 'montant': 3}, {'id': 2, 'montant': 1}]]})
+    assert assert_same_as_reference(df, 'modifications', 'Modification')['idModification'].tolist() == [2]
+
+    # Elément non daté placé avant un élément daté
+    df = pd.DataFrame({'id': ['a'], 'modifications': [[{'id': 1, 'montant': 3}, {'id': 2, 'datePublicationDonneesModification': '2024-01-01'}]]})
+    assert assert_same_as_reference(df, 'modifications', 'Modification')['idModification'].tolist() == [2]
+
+
+def test_undated_element_after_dated_element():
+    # L'implémentation précédente levait une TypeError (comparaison d'une date avec None) : l'élément daté est conservé
+    df = pd.DataFrame({'id': ['a'], 'modifications': [[
+        {'id': 1, 'montant': 3},
+        {'id': 2, 'datePublicationDonneesModification': '2024-01-01'},
+        {'id': 3, 'montant': 1},
+    ]]})
+    with pytest.raises(TypeError):
+        reference_keep_more_recent(df.copy(deep=True), 'modifications', 'Modification')
+
+    result = keep_more_recent(df.copy(deep=True), 'modifications', 'Modification')
+
+    assert result['idModification'].tolist() == [2]
+    assert result['modifications'].tolist() == [[df['modifications'][0][1]]]
+
+
+def test_sub_element_and_nested_fields():
+    df = pd.DataFrame({'id': ['a', 'b', 'c'], 'actesSousTraitance': [
+        [{'acteSousTraitance': {'id': 1, 'dureeMois': 3, 'datePublicationDonnees': '2024-01-01', 'montant': 100,
+                                'variationPrix': 'F', 'sousTraitant': {'id': '123', 'typeIdentifiant': 'SIRET'}}},
+         {'acteSousTraitance': {'id': 2, 'datePublicationDonnees': '2023-01-01', 'montant': 50}}],
+        [{'id': 5, 'montant': 1, 'datePublicationDonnees': None}, {'id': 6, 'montant': 2}],
+        [{'id': 7, 'montant': 2.5, 'datePublicationDonnees': '2024-05-01'}],
+    ]})
+
+    result = assert_same_as_reference(df, 'actesSousTraitance', 'ActeSousTraitance')
+
+    assert result['idSousTraitant'].tolist() == ['123', None, None]
+
+
+def test_modification_titulaires():
+    df = pd.DataFrame({'id': ['a', 'b'], 'modifications': [
+        [{'modification': {'id': 1, 'montant': 10, 'datePublicationDonneesModification': '2024-01-01',
+                           'titulaires': [{'id': 't1', 'typeIdentifiant': 'SIRET'}]}}],
+        [{'id': 2, 'montant': 5.5, 'dureeMoisActeSousTraitance': 4, 'datePublicationDonneesModification': '2024-02-01'}],
+    ]})
+
+    result = assert_same_as_reference(df, 'modifications', 'Modification')
+
+    assert result['idTitulaireModification'].tolist() == ['t1', None]
+
+
+def test_existing_columns_dtype():
+    df = pd.DataFrame({'id': ['a', 'b', 'c'],
+                       'idModification': [1, 2, 3],
+                       'dureeMoisModification': [3.0, np.nan, 1.0],
+                       'montantModification': [1, 2, 3],
+                       'idTitulaireModification': ['x', 'y', 'z'],
+                       'modifications': [
+                           [{'id': 1, 'montant': 10, 'datePublicationDonneesModification': '2024-01-01'}],
+                           [{'id': 2, 'montant': 2.5, 'dureeMoisActeSousTraitance': 4, 'datePublicationDonneesModification': '2024-01-02'}],
+                           [],
+                       ]})
+
+    assert_same_as_reference(df, 'modifications', 'Modification')
+
+
+def test_empty_lists_are_moved_last():
+    df = pd.DataFrame({'id': ['a', 'b', 'c', 'd'], 'modifications': [
+        [], [{'id': 1, 'montant': 3, 'datePublicationDonneesModification': '2024-01-01'}], np.nan, [{'id': 2, 'montant': 4}],
+    ]}, index=[5, 7, 9, 11])
+
+    result = assert_same_as_reference(df, 'modifications', 'Modification')
+
+    assert result['id'].tolist() == ['b', 'd', 'a', 'c']
+
+
+def test_no_list():
+    df = pd.DataFrame({'id': ['a', 'b'], 'modifications': [[], np.nan]})
+
+    assert_same_as_reference(df, 'modifications', 'Modification')
+    assert_same_as_reference(df, 'actesSousTraitance', 'ActeSousTraitance')
+
+
+@pytest.mark.parametrize('existante', [None, 'int64', 'float64', 'object', 'bool'])
+def test_column_types_like_cell_writes(existante):
+    generateur = random.Random(2024)
+    valeurs = [None, 5, 2.5, 2.0, np.nan, 'x', True]
+    for _ in range(300):
+        taille = generateur.randint(1, 5)
+        modifications = [[{'id': position, 'montant': generateur.choice(valeurs), 'titulaires': [{'id': generateur.choice(valeurs)}]}]
+                         if generateur.random() < 0.8 else [] for position in range(taille)]
+        df = pd.DataFrame({'id': list(range(taille)), 'modifications': modifications})
+        if existante is not None:
+            for colonne in ('montantModification', 'idTitulaireModification'):
+                df[colonne] = pd.Series([True] * taille if existante == 'bool' else [1] * taille, dtype=existante)
+
+        assert_same_as_reference(df, 'modifications', 'Modification')
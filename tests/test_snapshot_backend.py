@@ -0,0 +1,59 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from utils.SnapshotBackend import SnapshotBackend, ParquetBackend, PickleBackend
+
+
+def cells(series:pd.Series) -> list:
+    """Valeurs comparables de la colonne, NaN et None distingués"""
+    return [('nan',) if isinstance(value, float) and math.isnan(value) else (type(value).__name__, value) for value in series]
+
+
+@pytest.fixture(params=[ParquetBackend, PickleBackend])
+def backend(request):
+    return request.param()
+
+
+def round_trip(backend:SnapshotBackend, df:pd.DataFrame, tmp_path) -> pd.DataFrame:
+    path = tmp_path / f"snapshot{backend.DATAFRAME_EXTENSION}"
+    path.write_bytes(backend.dump_dataframe(df))
+    return backend.read_dataframe(str(path))
+
+
+def test_dataframe_round_trip_keeps_missing_values(backend, tmp_path):
+    df = pd.DataFrame({
+        'id': ['1', np.nan, '3'],
+        'objet': ['a', None, 'c'],
+        'nature': ['a', None, np.nan],
+        'vide': pd.Series([np.nan] * 3, dtype=object),
+        'aucun': pd.Series([None] * 3, dtype=object),
+        'titulaires': [[{'id': '1'}], None, np.nan],
+        'montant': [1.5, np.nan, 3.0],
+        'dureeMois': [1, 2, 3],
+    }, index=[10, 20, 30])
+
+    result = round_trip(backend, df, tmp_path)
+
+    assert list(result.columns) == list(df.columns)
+    assert list(result.index) == list(df.index)
+    for column in df.columns:
+        assert result[column].dtype == df[column].dtype, column
+        assert cells(result[column]) == cells(df[column]), column
+
+
+def test_nan_filter_matches_uninterrupted_run(tmp_path):
+    # GlobalProcess écarte les champs vides avec str(v) != 'nan'
+    df = pd.DataFrame({'id': ['1', '2'], 'objet': ['a', np.nan]})
+
+    result = round_trip(ParquetBackend(), df, tmp_path)
+
+    assert [str(v) for v in result['objet']] == ['a', 'nan']
+
+
+def test_dicts_round_trip(backend, tmp_path):
+    dicts = [{'id': '1', 'titulaires': [{'id': '2'}], 'montant': 1.5}, {'id': '3'}]
+    path = tmp_path / f"snapshot{backend.DICTS_EXTENSION}"
+    path.write_bytes(backend.dump_dicts(dicts))
+
+    assert backend.read_dicts(str(path)) == dicts
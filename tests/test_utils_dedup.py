@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+from utils.UtilsDedup import UtilsDedup
+
+
+def test_hash_keys_equal_values_have_equal_keys():
+    df = pd.DataFrame({'id': ['A1', 'A2', 'A1'], 'acheteur': [{'id': '1'}, {'id': '1'}, {'id': '1'}], 'montant': [10.0, 10.0, 10.0]})
+
+    keys = UtilsDedup.hash_keys(df, ['id', 'acheteur', 'montant'])
+
+    assert keys.dtype == np.uint64
+    assert keys[0] == keys[2]
+    assert keys[0] != keys[1]
+
+
+def test_hash_keys_depends_on_column_order():
+    df = pd.DataFrame({'a': ['x', 'y'], 'b': ['y', 'x']})
+
+    keys = UtilsDedup.hash_keys(df, ['a', 'b'])
+
+    assert keys[0] != keys[1]
+
+
+def test_keep_last_keeps_last_duplicate():
+    keys = np.array([1, 2, 1, 3, 2], dtype=np.uint64)
+
+    positions, counts = UtilsDedup.keep_last(keys)
+
+    assert positions.tolist() == [2, 3, 4]
+    assert counts == {False: 2}
+
+
+def test_keep_last_follows_order_with_stable_sort():
+    keys = np.array([1, 1, 1, 2], dtype=np.uint64)
+    order = pd.Series(['2024-03-01', '2024-01-01', '2024-03-01', '2024-02-01'])
+
+    positions, counts = UtilsDedup.keep_last(keys, order=order)
+
+    # A date égale, l'enregistrement placé le plus loin dans le fichier est conservé
+    assert positions.tolist() == [3, 2]
+    assert counts == {False: 2}
+
+
+def test_keep_last_duplicates_only_within_a_group():
+    keys = np.array([1, 1, 1, 2], dtype=np.uint64)
+    groups = np.array(['marche', 'concession', 'marche', 'marche'])
+
+    positions, counts = UtilsDedup.keep_last(keys, groups=groups)
+
+    assert positions.tolist() == [1, 2, 3]
+    assert counts == {'marche': 1}
+
+
+def test_keep_last_without_duplicates():
+    positions, counts = UtilsDedup.keep_last(np.array([3, 2, 1], dtype=np.uint64))
+
+    assert positions.tolist() == [0, 1, 2]
+    assert counts == {}
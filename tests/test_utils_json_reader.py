@@ -0,0 +1,84 @@
+import json
+import pytest
+from utils.UtilsJsonReader import UtilsJsonReader, _JsonStreamScanner
+
+DOCUMENT = {
+    'autre': {'marches': {'marche': [{'id': 'ignoré'}]}},
+    'marches': {
+        'marche': [{'id': f"M{i}", 'montant': 1000.5 + i, 'objet': 'Réfection « toiture »\n',
+                    'titulaires': [{'titulaire': {'id': str(i), 'typeIdentifiant': 'SIRET'}}],
+                    'modifications': [], 'actif': i % 2 == 0, 'note': None} for i in range(25)],
+        'info': {'marche': [{'id': 'ignoré'}]},
+        'contrat-concession': [{'id': f"C{i}", 'valeurGlobale': i} for i in range(7)]
+    }
+}
+
+
+@pytest.fixture(params=['utf-8', 'utf-16-le'])
+def encoding(request, monkeypatch):
+    """
+    Encodage des fichiers du test : utf-8 est lu par ijson, les autres encodages par le lecteur
+    par blocs (blocs de petite taille pour tester leurs limites)
+    """
+    monkeypatch.setattr(_JsonStreamScanner, 'CHUNK_SIZE', 16)
+    return request.param
+
+
+def write_json(tmp_path, document, encoding, name='decp.json', bom=False, indent=None) -> str:
+    path = tmp_path / name
+    path.write_bytes((('\ufeff' if bom else '') + json.dumps(document, ensure_ascii=False, indent=indent)).encode(encoding))
+    return str(path)
+
+
+def expected_records(document) -> list:
+    return [('marche', record) for record in document['marches']['marche']] + \
+           [('contrat-concession', record) for record in document['marches']['contrat-concession']]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_iter_records(tmp_path, encoding, indent):
+    path = write_json(tmp_path, DOCUMENT, encoding, indent=indent)
+
+    assert list(UtilsJsonReader.iter_records(path, encoding)) == expected_records(DOCUMENT)
+
+
+def test_iter_records_bom(tmp_path, encoding):
+    path = write_json(tmp_path, DOCUMENT, encoding, bom=True)
+
+    assert list(UtilsJsonReader.iter_records(path, encoding)) == expected_records(DOCUMENT)
+
+
+def test_iter_records_selected_tags(tmp_path, encoding):
+    path = write_json(tmp_path, DOCUMENT, encoding)
+
+    records = list(UtilsJsonReader.iter_records(path, encoding, record_tags=('contrat-concession',)))
+
+    assert records == [('contrat-concession', record) for record in DOCUMENT['marches']['contrat-concession']]
+
+
+def test_iter_records_missing_or_empty_nodes(tmp_path, encoding):
+    path = write_json(tmp_path, {'marches': {'marche': []}}, encoding)
+    assert list(UtilsJsonReader.iter_records(path, encoding)) == []
+
+    path = write_json(tmp_path, {'autre': 1}, encoding, name='autre.json')
+    assert list(UtilsJsonReader.iter_records(path, encoding)) == []
+
+
+def test_iter_batches(tmp_path, encoding):
+    path = write_json(tmp_path, DOCUMENT, encoding)
+
+    batches = list(UtilsJsonReader.iter_batches(path, batch_size=10, encoding=encoding))
+
+    assert [(tag, len(batch)) for tag, batch in batches] == [('marche', 10), ('marche', 10), ('marche', 5), ('contrat-concession', 7)]
+    assert [(tag, record) for tag, batch in batches for record in batch] == expected_records(DOCUMENT)
+
+
+def test_iter_records_reads_file_once(tmp_path, encoding, monkeypatch):
+    path = write_json(tmp_path, DOCUMENT, encoding)
+    opened = []
+    real_open = open
+    monkeypatch.setattr('builtins.open', lambda *args, **kwargs: opened.append(args[0]) or real_open(*args, **kwargs))
+
+    list(UtilsJsonReader.iter_records(path, encoding))
+
+    assert opened == [path]
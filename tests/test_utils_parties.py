@@ -0,0 +1,202 @@
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from utils.UtilsParties import UtilsParties
+
+FIELDS = {'2019': ['denominationSociale', 'id', 'typeIdentifiant'], '2022': ['id', 'typeIdentifiant']}
+
+
+def reference_titulaires(row: list,data_format:str):
+    """Implémentation précédente (pd.Series par ligne), référence du comportement attendu"""
+    new_columns = {}
+    new_cols_names = ['denominationSociale', 'id', 'typeIdentifiant']
+    if data_format=='2022':
+        new_cols_names = ['id', 'typeIdentifiant']
+
+    # create new columns all with nan value
+    for value in range(1, 4):
+        for col_name in new_cols_names:
+            new_col_name = f'titulaire_{col_name}_{value}'
+            new_columns[new_col_name] = np.nan
+
+    if isinstance(row, list):
+        row = row[:3]  # Keep only the first three concession
+    else:
+        # if row is not a list, then it is empty and for obscure reason script thinks it's a float so returning nan
+        return pd.Series(new_columns)
+
+    # fill new columns with values from concessionnaires column if exist
+    for value, concession in enumerate(row, start=1):
+        # replace value in new_columns by corresponding value in concession
+        for col_name in new_cols_names:
+            col_to_fill = f'titulaire_{col_name}_{value}'
+            # col_name is key in concession dict, col_to_fill is key in new_columns dict. get key value in col_name and put it in col_to_fill
+            if concession:
+                new_columns[col_to_fill] = concession.get('titulaire').get(col_name, np.nan)
+
+    return pd.Series(new_columns)
+
+
+def reference_concessionnaires(row: list,data_format:str):
+    """Implémentation précédente (pd.Series par ligne), référence du comportement attendu"""
+    new_columns = {}
+    new_cols_names = ['denominationSociale', 'id', 'typeIdentifiant']
+    if data_format=='2022':
+        new_cols_names = ['id', 'typeIdentifiant']
+
+    # create new columns all with nan value
+    for value in range(1, 4):
+        for col_name in new_cols_names:
+            new_col_name = f'concessionnaire_{col_name}_{value}'
+            new_columns[new_col_name] = pd.NA
+
+    if isinstance(row, list):
+        # how is the list of concessionnaires
+        # if contain a dict where key is exactly : concessionnaire, then the list we want is the value of this dict key
+        if 'concessionnaire' in row[0].keys():
+            row = [item['concessionnaire'] for item in row]
+        row = row[:3]  # Keep only the first three concession
+    else:
+        # if row is not a list, then it is empty and for obscure reason script thinks it's a float so returning nan
+        return pd.Series(new_columns)
+
+    # le traitement ici à lieux car comme on dit : "Garbage in, garbage out" mais on est gentil on corrige leurs formats -_-
+    # check if row is a list of list of dict, if so, keep only the first list
+    if isinstance(row[0], list):
+        row = row[0]
+
+    # fill new columns with values from concessionnaires column if exist
+    for value, concession in enumerate(row, start=1):
+        # replace value in new_columns by corresponding value in concession
+        for col_name in new_cols_names:
+            col_to_fill = f'concessionnaire_{col_name}_{value}'
+            # col_name is key in concession dict, col_to_fill is key in new_columns dict. get key value in col_name and put it in col_to_fill
+            if concession:
+                new_columns[col_to_fill] = concession.get(col_name, np.nan)
+
+    return pd.Series(new_columns)
+
+
+def titulaires(values:pd.Series, data_format:str) -> pd.DataFrame:
+    """Appel fait par dedoublonnage_marche"""
+    return UtilsParties.explode(values, 'titulaire', FIELDS[data_format], 3, normalize=UtilsParties.normalize_titulaires)
+
+
+def concessionnaires(values:pd.Series, data_format:str) -> pd.DataFrame:
+    """Appel fait par dedoublonnage_concession"""
+    return UtilsParties.explode(values, 'concessionnaire', FIELDS[data_format], 3,
+                                normalize=UtilsParties.normalize_concessionnaires, missing=pd.NA)
+
+
+def cells(df:pd.DataFrame) -> dict:
+    """Contenu comparable du dataframe : types des colonnes et représentation de chaque valeur (nan et <NA> distingués)"""
+    return {column: (str(df[column].dtype), [repr(value) for value in df[column]]) for column in df.columns}
+
+
+def assert_same(result:pd.DataFrame, expected:pd.DataFrame):
+    assert list(result.columns) == list(expected.columns)
+    assert list(result.index) == list(expected.index)
+    assert cells(result) == cells(expected)
+
+
+def random_party(generateur:random.Random) -> dict:
+    party = {}
+    for field, valeurs in (('denominationSociale', ['A', 'B', None]), ('id', ['1', 2, 3.5, None]), ('typeIdentifiant', ['SIRET', True, 4, None])):
+        if generateur.random() < 0.8:
+            party[field] = generateur.choice(valeurs)
+    return party
+
+
+@pytest.mark.parametrize('data_format', ['2019', '2022'])
+def test_titulaires_like_reference(data_format):
+    generateur = random.Random(2024)
+    for _ in range(300):
+        rows = []
+        for _ in range(generateur.randint(1, 6)):
+            if generateur.random() < 0.15:
+                rows.append(np.nan)
+            else:
+                rows.append([{'titulaire': random_party(generateur)} if generateur.random() < 0.9 else {}
+                             for _ in range(generateur.randint(0, 5))])
+        values = pd.Series(rows, index=[10 * position for position in range(len(rows))])
+
+        assert_same(titulaires(values, data_format), values.apply(reference_titulaires, data_format=data_format))
+
+
+@pytest.mark.parametrize('data_format', ['2019', '2022'])
+def test_concessionnaires_like_reference(data_format):
+    generateur = random.Random(2024)
+    for _ in range(300):
+        rows = []
+        for _ in range(generateur.randint(1, 6)):
+            if generateur.random() < 0.15:
+                rows.append(np.nan)
+                continue
+            wrapped = generateur.random() < 0.5
+            parties = [random_party(generateur) if generateur.random() < 0.9 else {} for _ in range(generateur.randint(1, 5))]
+            rows.append([{'concessionnaire': party} for party in parties] if wrapped else parties)
+        values = pd.Series(rows)
+
+        assert_same(concessionnaires(values, data_format), values.apply(reference_concessionnaires, data_format=data_format))
+
+
+def test_column_order():
+    values = pd.Series([[{'titulaire': {'id': '1', 'typeIdentifiant': 'SIRET', 'denominationSociale': 'A'}}]])
+
+    assert list(titulaires(values, '2019').columns) == [f'titulaire_{field}_{rank}' for rank in (1, 2, 3) for field in FIELDS['2019']]
+    assert list(concessionnaires(values, '2022').columns) == [f'concessionnaire_{field}_{rank}' for rank in (1, 2, 3) for field in FIELDS['2022']]
+
+
+def test_missing_values():
+    values = pd.Series([[{'titulaire': {'id': 1}}], np.nan])
+
+    result = titulaires(values, '2022')
+
+    assert result['titulaire_id_1'].dtype == np.float64 and result.loc[0, 'titulaire_id_1'] == 1.0
+    assert np.isnan(result.loc[0, 'titulaire_typeIdentifiant_1']) and np.isnan(result.loc[1, 'titulaire_id_2'])
+
+    result = concessionnaires(pd.Series([[{'id': 'a'}], np.nan]), '2022')
+
+    # Rang sans partie : pd.NA ; clé absente d'une partie : nan
+    assert result.loc[0, 'concessionnaire_id_1'] == 'a'
+    assert np.isnan(result.loc[0, 'concessionnaire_typeIdentifiant_1'])
+    assert result.loc[0, 'concessionnaire_id_2'] is pd.NA and result.loc[1, 'concessionnaire_id_1'] is pd.NA
+
+
+def test_empty_list():
+    values = pd.Series([[], [{'id': 'a'}]])
+
+    # L'implémentation précédente levait une IndexError sur une liste de concessionnaires vide
+    with pytest.raises(IndexError):
+        values.apply(reference_concessionnaires, data_format='2022')
+
+    result = concessionnaires(values, '2022')
+
+    assert result.loc[0].isna().all()
+    assert result.loc[1, 'concessionnaire_id_1'] == 'a'
+    assert_same(titulaires(pd.Series([[], np.nan]), '2019'), pd.Series([[], np.nan]).apply(reference_titulaires, data_format='2019'))
+
+
+def test_list_of_lists_concessionnaires():
+    values = pd.Series([[[{'id': 'a'}, {'id': 'b'}, {'id': 'c'}, {'id': 'd'}], [{'id': 'e'}]], [[{'id': 'f'}]]])
+
+    # L'implémentation précédente levait une AttributeError (row[0].keys() sur une liste)
+    with pytest.raises(AttributeError):
+        values.apply(reference_concessionnaires, data_format='2022')
+
+    result = concessionnaires(values, '2022')
+
+    # Seule la première liste est lue, et seuls ses trois premiers concessionnaires
+    assert [result.loc[0, f'concessionnaire_id_{rank}'] for rank in (1, 2, 3)] == ['a', 'b', 'c']
+    assert result.loc[1, 'concessionnaire_id_1'] == 'f' and result.loc[1, 'concessionnaire_id_2'] is pd.NA
+    assert 'concessionnaire_id_4' not in result.columns
+
+
+def test_list_values_are_not_broadcast():
+    values = pd.Series([[{'id': ['a', 'b']}, {'id': ['c', 'd']}], [{'id': ['e', 'f']}]])
+
+    result = UtilsParties.explode(values, 'partie', ['id'], 2)
+
+    assert result['partie_id_1'].tolist() == [['a', 'b'], ['e', 'f']]
+    assert result.loc[0, 'partie_id_2'] == ['c', 'd'] and np.isnan(result.loc[1, 'partie_id_2'])
@@ -0,0 +1,71 @@
+import locale
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from utils.UtilsSiret import UtilsSiret
+
+try:
+    from augmente.nettoyage import check_insee_field
+except (locale.Error, FileNotFoundError) as err:
+    # nettoyage impose la locale fr_FR.UTF-8 (DbDecp) et lit confs/config_data.json à l'import
+    pytest.skip(f"augmente.nettoyage non importable : {err}", allow_module_level=True)
+
+VALID = '73282932000074'
+FULL_WIDTH = str.maketrans('0123456789', '０１２３４５６７８９')
+
+
+def luhn_complete(digits:str) -> str:
+    """Ajoute à digits le chiffre de contrôle de Luhn"""
+    for check in '0123456789':
+        number = digits + check
+        total = sum(int(d) if i % 2 == len(number) % 2 else sum(divmod(int(d) * 2, 10)) for i, d in enumerate(number))
+        if total % 10 == 0:
+            return number
+
+
+def assert_same_as_check_insee_field(values:list):
+    expected = [check_insee_field(value) for value in values]
+
+    result = UtilsSiret.is_valid(pd.Series(values, dtype=object))
+
+    assert result.dtype == bool
+    assert result.tolist() == expected
+    assert list(result.index) == list(range(len(values)))
+
+
+def test_edge_cases():
+    assert_same_as_check_insee_field([
+        VALID, VALID[:-1] + '5', np.nan, None, '', ' ', 'nan',
+        '732 829 320 00074', '732.829.320.00074', ' 73282932000074 ', '73282932000074\t',
+        VALID.translate(FULL_WIDTH), VALID[:7] + VALID[7:].translate(FULL_WIDTH), 'INX 73282932000074',
+        VALID[:-1], VALID + '0', '0' * 14, '0' * 13, 'A3282932000074', '7328293200007A', '+3282932000074',
+        73282932000074, 73282932000074.0,
+    ])
+
+
+def test_random_numbers():
+    rng = random.Random(2024)
+    values = []
+    for _ in range(5000):
+        number = luhn_complete(''.join(rng.choice('0123456789') for _ in range(rng.choice([12, 13, 13, 13, 14]))))
+        kind = rng.randrange(5)
+        if kind == 1:
+            number = number[:3] + ' ' + number[3:]
+        elif kind == 2:
+            number = number[:9] + '.' + number[9:]
+        elif kind == 3:
+            position = rng.randrange(len(number))
+            number = number[:position] + rng.choice('0123456789') + number[position + 1:]
+        elif kind == 4:
+            number = number.translate(FULL_WIDTH)
+        values.append(number)
+
+    assert_same_as_check_insee_field(values)
+
+
+def test_repeated_values_use_the_cache():
+    values = [VALID, 'x', VALID] * 3
+
+    assert UtilsSiret.is_valid(pd.Series(values)).tolist() == [True, False, True] * 3
+    assert UtilsSiret.is_valid(pd.Series(values)).tolist() == [True, False, True] * 3
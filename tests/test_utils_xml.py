@@ -0,0 +1,65 @@
+import xmltodict
+from utils.UtilsXml import UtilsXml
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<marches>
+    <!-- commentaire ignoré -->
+    <marche>
+        <id>2024-001</id>
+        <acheteur><id>21670482500019</id></acheteur>
+        <objet>Travaux de voirie &amp; réseaux</objet>
+        <titulaires>
+            <titulaire><typeIdentifiant>SIRET</typeIdentifiant><id>11111111111111</id></titulaire>
+        </titulaires>
+        <titulaires>
+            <titulaire><typeIdentifiant>SIRET</typeIdentifiant><id>22222222222222</id></titulaire>
+        </titulaires>
+        <modifications>
+            <modification><id>1</id><montant>1000.5</montant></modification>
+        </modifications>
+        <montant devise="EUR">15000</montant>
+        <dureeMois></dureeMois>
+    </marche>
+    <contrat-concession>
+        <id>C-01</id>
+        <concessionnaires><concessionnaire><id>33333333333333</id></concessionnaire></concessionnaires>
+    </contrat-concession>
+    <marche>
+        <id>2024-002</id>
+    </marche>
+</marches>
+"""
+
+
+def write_xml(tmp_path) -> str:
+    path = tmp_path / "decp.xml"
+    path.write_text(XML, encoding="utf-8")
+    return str(path)
+
+
+def test_iter_records_matches_xmltodict(tmp_path):
+    path = write_xml(tmp_path)
+    expected = xmltodict.parse(XML, dict_constructor=dict, force_list=UtilsXml.FORCE_LIST)['marches']
+
+    records = list(UtilsXml.iter_records(path))
+
+    assert [tag for tag, record in records] == ['marche', 'contrat-concession', 'marche']
+    assert [record for tag, record in records if tag == 'marche'] == expected['marche']
+    assert [record for tag, record in records if tag == 'contrat-concession'] == expected['contrat-concession']
+
+
+def test_iter_records_filters_tags(tmp_path):
+    path = write_xml(tmp_path)
+
+    records = list(UtilsXml.iter_records(path, record_tags=('contrat-concession',)))
+
+    assert [(tag, record['id']) for tag, record in records] == [('contrat-concession', 'C-01')]
+
+
+def test_iter_records_forced_encoding(tmp_path):
+    path = tmp_path / "decp-latin1.xml"
+    path.write_bytes(XML.replace('encoding="UTF-8"', 'encoding="ISO-8859-1"').encode('latin-1'))
+
+    records = list(UtilsXml.iter_records(str(path), 'ISO-8859-1'))
+
+    assert records[0][1]['objet'] == 'Travaux de voirie & réseaux'
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import math
+import numbers
+import os
+import pickle
+
+class ExportStore:
+    """
+    Stockage des données d'un fichier d'export (decp-YYYY-MM.json, decp-YYYY.json) sous forme de
+    segments dédoublonnés et indexés par la clé de dédoublonnage des enregistrements.
+    Chaque exécution ajoute un segment contenant uniquement les enregistrements nouveaux ou plus récents
+    (tmp__max_date supérieure ou égale) que ceux déjà stockés ; les enregistrements remplacés restent
+    dans leur segment mais ne sont plus référencés par l'index. Le fichier json publié est reconstruit
+    en parcourant les segments, sans recharger ni réécrire l'historique complet en mémoire.
+    """
+
+    BASE_PATH = 'results/store/'
+    INDEX_FILE = 'index.pkl'
+    COMPACT_RATIO = 0.5     # Compactage des segments si plus de la moitié des enregistrements stockés sont remplacés
+
+    def __init__(self, name:str, key_fields:dict, default_fields:list):
+        """
+        Args:
+            name: nom du fichier d'export (decp-2025-01 par exemple)
+            key_fields: champs de la clé de dédoublonnage par valeur de _type
+            default_fields: champs de la clé pour les autres valeurs de _type
+        """
+        self.name = name
+        self.path = f"{ExportStore.BASE_PATH}{name}/"
+        self.key_fields = key_fields
+        self.default_fields = default_fields
+        self.index = {}         # clé -> (segment, position, tmp__max_date)
+        self.segments = []      # numéros des segments, dans l'ordre d'ajout
+        self.nb_stored = 0      # nombre d'enregistrements stockés, remplacés compris
+        if os.path.exists(self.path + ExportStore.INDEX_FILE):
+            with open(self.path + ExportStore.INDEX_FILE, 'rb') as f:
+                self.index, self.segments, self.nb_stored = pickle.load(f)
+
+    def exists(self) -> bool:
+        return len(self.segments) > 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def record_key(self, record:dict) -> str:
+        """Empreinte des champs de dédoublonnage de l'enregistrement, indépendante des types pandas (1 et 1.0, np.int64...)"""
+        def normalize(value):
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, numbers.Integral):
+                return int(value)
+            if isinstance(value, numbers.Real):
+                value = float(value)
+                if math.isnan(value):
+                    return None
+                return int(value) if value.is_integer() else value
+            return value
+        record_type = record.get('_type')
+        fields = self.key_fields.get(record_type, self.default_fields)
+        content = json.dumps([record_type] + [normalize(record.get(field)) for field in fields], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+    def merge(self, records:list) -> tuple[int,int,int]:
+        """
+        Ajoute les enregistrements dans un nouveau segment : un enregistrement remplace celui de même clé
+        déjà stocké si sa date tmp__max_date est supérieure ou égale, il est ignoré sinon.
+
+        Returns:
+            (nombre d'enregistrements ajoutés, remplacés, ignorés)
+        """
+        added, replaced, ignored = 0, 0, 0
+        segment_id = self.segments[-1] + 1 if self.segments else 0
+        segment = []
+        positions = {}
+        for record in records:
+            key = self.record_key(record)
+            max_date = str(record.get('tmp__max_date'))
+            if key in positions:
+                # Doublon dans les données ajoutées : le dernier est conservé
+                if max_date >= segment[positions[key]][1]:
+                    segment[positions[key]] = (key, max_date, record)
+                ignored += 1
+                continue
+            if key in self.index:
+                if max_date < self.index[key][2]:
+                    ignored += 1
+                    continue
+                replaced += 1
+            else:
+                added += 1
+            positions[key] = len(segment)
+            segment.append((key, max_date, record))
+
+        if segment:
+            os.makedirs(self.path, exist_ok=True)
+            self._write(self._segment_path(segment_id), segment)
+            for position, (key, max_date, record) in enumerate(segment):
+                self.index[key] = (segment_id, position, max_date)
+            self.segments.append(segment_id)
+            self.nb_stored += len(segment)
+            if len(self.segments) > 1 and len(self.index) < self.nb_stored * ExportStore.COMPACT_RATIO:
+                self._compact()
+            else:
+                self._drop_empty_segments()
+        logging.info(f"{self.name} : {added} enregistrements ajoutés, {replaced} remplacés, {ignored} ignorés (total {len(self.index)})")
+        return added, replaced, ignored
+
+    def iter_records(self):
+        """Parcourt les enregistrements valides (non remplacés), segment par segment"""
+        for segment_id in self.segments:
+            for position, (key, max_date, record) in enumerate(self._read(self._segment_path(segment_id))):
+                location = self.index.get(key)
+                if location is not None and location[0] == segment_id and location[1] == position:
+                    yield record
+
+    def _drop_empty_segments(self) -> None:
+        """Supprime les segments dont tous les enregistrements ont été remplacés"""
+        live = {location[0] for location in self.index.values()}
+        empty_segments = [segment_id for segment_id in self.segments if segment_id not in live]
+        for segment_id in empty_segments:
+            self.segments.remove(segment_id)
+            self.nb_stored -= len(self._read(self._segment_path(segment_id)))
+        # Les fichiers ne sont supprimés qu'une fois l'index enregistré
+        self._write(self.path + ExportStore.INDEX_FILE, (self.index, self.segments, self.nb_stored))
+        for segment_id in empty_segments:
+            os.remove(self._segment_path(segment_id))
+
+    def _compact(self) -> None:
+        """Réécrit les enregistrements valides dans un seul segment"""
+        segment_id = self.segments[-1] + 1
+        segment = []
+        for record in self.iter_records():
+            key = self.record_key(record)
+            segment.append((key, self.index[key][2], record))
+        self._write(self._segment_path(segment_id), segment)
+        old_segments = self.segments
+        self.segments = [segment_id]
+        self.index = {key: (segment_id, position, max_date) for position, (key, max_date, record) in enumerate(segment)}
+        self.nb_stored = len(segment)
+        self._write(self.path + ExportStore.INDEX_FILE, (self.index, self.segments, self.nb_stored))
+        for old_segment in old_segments:
+            os.remove(self._segment_path(old_segment))
+        logging.info(f"{self.name} : compactage en un segment de {len(segment)} enregistrements")
+
+    def _segment_path(self, segment_id:int) -> str:
+        return f"{self.path}segment-{segment_id:05d}.pkl"
+
+    @staticmethod
+    def _write(path:str, data) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path:str):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
@@ -0,0 +1,149 @@
+import json
+import logging
+import math
+import pickle
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.UtilsJsonWriter import UtilsJsonWriter
+
+class SnapshotBackend(ABC):
+    """
+    Format d'écriture des points de reprise (snapshots) de StepMngmt.
+    Une sous-classe définit la sérialisation (en octets) et la lecture des dataframes et des
+    listes de dictionnaires (dico_2022_marche, dico_2022_concession). La sérialisation est faite
+    par l'appelant, avant que l'étape suivante ne modifie les données : seule l'écriture du
+    fichier est faite en tâche de fond.
+    """
+
+    NAME = None
+    DATAFRAME_EXTENSION = None
+    DICTS_EXTENSION = None
+
+    @abstractmethod
+    def dump_dataframe(self, df:pd.DataFrame) -> bytes:
+        pass
+
+    @abstractmethod
+    def read_dataframe(self, path:str) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def dump_dicts(self, dicts) -> bytes:
+        pass
+
+    @abstractmethod
+    def read_dicts(self, path:str):
+        pass
+
+    @staticmethod
+    def get(name:str) -> 'SnapshotBackend':
+        """Retourne le format demandé ('parquet' ou 'pickle')"""
+        if name == ParquetBackend.NAME:
+            return ParquetBackend()
+        if name != PickleBackend.NAME:
+            logging.warning(f"Format de point de reprise {name} inconnu, les points de reprise sont écrits au format pickle")
+        return PickleBackend()
+
+
+class PickleBackend(SnapshotBackend):
+    """Format historique : pickle pour les dataframes, json compact pour les listes de dictionnaires"""
+
+    NAME = 'pickle'
+    DATAFRAME_EXTENSION = '.pkl'
+    DICTS_EXTENSION = '.pkl'
+
+    def dump_dataframe(self, df:pd.DataFrame) -> bytes:
+        return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read_dataframe(self, path:str) -> pd.DataFrame:
+        return pd.read_pickle(path)
+
+    def dump_dicts(self, dicts) -> bytes:
+        return UtilsJsonWriter.dumps(dicts).encode('utf-8')
+
+    def read_dicts(self, path:str):
+        with open(path, encoding="utf-8") as json_file:
+            return json.load(json_file)
+
+
+class ParquetBackend(SnapshotBackend):
+    """
+    Dataframes au format Parquet compressé (zstd). Les colonnes objet qui ne contiennent pas
+    uniquement des chaînes (titulaires, modifications, valeurs de types mélangés...) sont encodées
+    valeur par valeur en json, ou en pickle si une valeur n'est pas sérialisable en json : le schéma
+    Parquet reste le même quel que soit le contenu. Les colonnes de chaînes sont stockées telles quelles :
+    Parquet ne distinguant pas NaN de None, la valeur manquante d'origine est notée dans les métadonnées
+    (ou la colonne est encodée valeur par valeur si elle contient les deux). Les listes de dictionnaires
+    sont écrites en pickle.
+    """
+
+    NAME = 'parquet'
+    DATAFRAME_EXTENSION = '.parquet'
+    DICTS_EXTENSION = '.bin'
+    COMPRESSION = 'zstd'
+    METADATA_KEY = b'decp_encoded_columns'
+
+    def dump_dataframe(self, df:pd.DataFrame) -> bytes:
+        encoded = {}
+        columns = {}
+        for column in df.columns:
+            if df[column].dtype != object:
+                continue
+            if pd.api.types.infer_dtype(df[column], skipna=True) in ('string','empty'):
+                missing = self._missing_value(df[column])
+                if missing == 'none':
+                    continue
+                if missing == 'nan':
+                    encoded[column] = 'nan'
+                    continue
+            try:
+                columns[column] = [json.dumps(value, ensure_ascii=False) for value in df[column].values]
+                encoded[column] = 'json'
+            except (TypeError, ValueError):
+                columns[column] = [pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for value in df[column].values]
+                encoded[column] = 'pickle'
+        if columns:
+            df = df.copy(deep=False)
+            for column, values in columns.items():
+                df[column] = values
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        metadata = dict(table.schema.metadata or {})
+        metadata[self.METADATA_KEY] = json.dumps(encoded).encode('utf-8')
+        buffer = pa.BufferOutputStream()
+        pq.write_table(table.replace_schema_metadata(metadata), buffer, compression=self.COMPRESSION)
+        return buffer.getvalue().to_pybytes()
+
+    def read_dataframe(self, path:str) -> pd.DataFrame:
+        table = pq.read_table(path)
+        encoded = json.loads((table.schema.metadata or {}).get(self.METADATA_KEY, b'{}'))
+        df = table.to_pandas()
+        for column, encoding in encoded.items():
+            if encoding == 'nan':
+                values = df[column].to_numpy(dtype=object, copy=True)
+                values[pd.isna(values)] = np.nan
+                df[column] = pd.Series(values, index=df.index, dtype=object)
+                continue
+            decode = json.loads if encoding == 'json' else pickle.loads
+            df[column] = pd.Series([decode(value) for value in df[column].values], index=df.index, dtype=object)
+        return df
+
+    @staticmethod
+    def _missing_value(values:pd.Series) -> str|None:
+        """Valeur manquante d'une colonne de chaînes : 'none' (None ou aucune), 'nan' (NaN), None si elle en contient plusieurs sortes"""
+        missing = values[values.isna()].values
+        if all(value is None for value in missing):
+            return 'none'
+        if all(isinstance(value, float) and math.isnan(value) for value in missing):
+            return 'nan'
+        return None
+
+    def dump_dicts(self, dicts) -> bytes:
+        return pickle.dumps(dicts, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read_dicts(self, path:str):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
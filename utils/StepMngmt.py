@@ -2,7 +2,11 @@ import json
 import os
 import pandas as pd
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from utils.Step import Step
+from utils.SnapshotBackend import SnapshotBackend, PickleBackend
 import logging
 
 class StepMngmt:
@@ -17,9 +21,20 @@ class StepMngmt:
     SOURCE_ALL = 'ALL'
     SOURCE = 'SOURCE'
 
+    # Format des points de reprise ('parquet' ou 'pickle'), surchargeable par la variable d'environnement DECP.SNAPSHOT_FORMAT
+    SNAPSHOT_FORMAT = 'parquet'
+
+    # Ecriture des points de reprise en tâche de fond pendant que l'étape suivante s'exécute
+    ASYNC_SNAPSHOTS = True
+
     init_status = {}
     current_status = {}
 
+    _writer = None          # Thread unique d'écriture : les points de reprise et statuts sont écrits dans l'ordre
+    _writer_pid = None
+    _pending = []
+    _status_lock = threading.Lock()
+
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -31,6 +46,9 @@ class StepMngmt:
     def load_data(self):
         if not os.path.exists(StepMngmt.BASE_PATH):
             os.makedirs(StepMngmt.BASE_PATH)
+        self.backend = SnapshotBackend.get(os.getenv('DECP.SNAPSHOT_FORMAT', StepMngmt.SNAPSHOT_FORMAT))
+        # Lecture des points de reprise écrits par les versions précédentes
+        self.legacy_backend = PickleBackend()
 
         try:
             with open(self.STATUS_FILEPATH, 'r') as json_file:
@@ -81,54 +99,109 @@ class StepMngmt:
 
 
     def snapshot(self,source:str,step:Step):
-        self._update_status(source,step)
+        self._submit(source,step,[])
 
 
     def snapshot_dataframe(self,source:str,step:Step,df:pd.DataFrame):
-        path = self._get_snapshot_path(source,step,self.FORMAT_DATAFRAME)
-        df.to_pickle(path)
-        self._update_status(source,step)
+        path = self._get_snapshot_path(source,step,self.FORMAT_DATAFRAME,self.backend.DATAFRAME_EXTENSION)
+        self._submit(source,step,[self._serialize(path,self.backend.dump_dataframe,df)])
 
 
     def snapshot_dict(self,source:str,step:Step,dc:dict):
-        path = self._get_snapshot_path(source,step,self.FORMAT_DICT)
-        with open(path, 'w', encoding="utf-8") as f:
-            json.dump(dc, f, indent=2, ensure_ascii=False)
-        self._update_status(source,step)
+        path = self._get_snapshot_path(source,step,self.FORMAT_DICTS,self.backend.DICTS_EXTENSION)
+        self._submit(source,step,[self._serialize(path,self.backend.dump_dicts,dc)])
 
 
     def snapshot_dicts(self,source:str,step:Step,dc_marche:dict,dc_concession:dict):
-        path = self._get_snapshot_path(source,step,self.FORMAT_DICTS+'_marche')
-        with open(path, 'w', encoding="utf-8") as f:
-            json.dump(dc_marche, f, indent=2, ensure_ascii=False)
-        path = self._get_snapshot_path(source,step,self.FORMAT_DICTS+'_concession')
-        with open(path, 'w', encoding="utf-8") as f:
-            json.dump(dc_concession, f, indent=2, ensure_ascii=False)
-        self._update_status(source,step)
+        path_marche = self._get_snapshot_path(source,step,self.FORMAT_DICTS+'_marche',self.backend.DICTS_EXTENSION)
+        path_concession = self._get_snapshot_path(source,step,self.FORMAT_DICTS+'_concession',self.backend.DICTS_EXTENSION)
+        self._submit(source,step,[self._serialize(path_marche,self.backend.dump_dicts,dc_marche),
+                                  self._serialize(path_concession,self.backend.dump_dicts,dc_concession)])
+
+
+    def flush(self) -> None:
+        """Attend la fin de l'écriture des points de reprise en cours, lève la première erreur d'écriture"""
+        if self._writer_pid != os.getpid():
+            return
+        error = None
+        while self._pending:
+            try:
+                self._pending.pop(0).result()
+            except Exception as err:
+                error = error or err
+        if error is not None:
+            raise error
+
+
+    def _submit(self,source:str,step:Step,writes:list) -> None:
+        if not self.ASYNC_SNAPSHOTS:
+            self._write_snapshot(source,step,writes)
+            return
+        if StepMngmt._writer is None or StepMngmt._writer_pid != os.getpid():
+            # Processus fils (traitement parallèle des sources) : le thread d'écriture du parent n'existe pas ici
+            StepMngmt._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+            StepMngmt._writer_pid = os.getpid()
+            StepMngmt._pending = []
+        self._pending.append(StepMngmt._writer.submit(self._write_snapshot,source,step,writes))
+
+
+    def _serialize(self,path:str,dump,data) -> tuple:
+        # Sérialisation dans le thread appelant : les données (et les dictionnaires qu'elles contiennent)
+        # peuvent être modifiées par l'étape suivante pendant l'écriture en tâche de fond
+        start = time.perf_counter()
+        content = dump(data)
+        return path, content, time.perf_counter() - start
+
+
+    def _write_snapshot(self,source:str,step:Step,writes:list) -> None:
+        # Le statut n'est enregistré qu'une fois les fichiers écrits et synchronisés sur disque :
+        # en cas d'arrêt, la reprise repart du dernier point de reprise complet
+        try:
+            for path,content,serialize_duration in writes:
+                self._timed_write(path,content,serialize_duration)
+            self._update_status(source,step)
+        except Exception as err:
+            logging.error(f"Erreur d'écriture du point de reprise {source}/{step.name} - {err}")
+            raise
 
 
     def resume(self,source:str,step:Step,format:str) -> pd.DataFrame|dict:
-        path = self._get_snapshot_path(source,step,format)
-        if os.path.exists(path):
-            if format == self.FORMAT_DATAFRAME:
-                return pd.read_pickle(path)
-            else:
-                with open(path, encoding="utf-8") as json_file:
-                    return json.load(json_file)
-        return None
+        self.flush()
+        if format == self.FORMAT_DATAFRAME:
+            return self._timed_read(source,step,format,'DATAFRAME_EXTENSION','read_dataframe')
+        return self._timed_read(source,step,format,'DICTS_EXTENSION','read_dicts')
 
     def resume_dicts(self,source:str,step:Step,format:str) -> tuple[dict,dict]:
-        path = self._get_snapshot_path(source,step,format+'_marche')
-        if os.path.exists(path):
-            with open(path, encoding="utf-8") as json_file:
-                dico_marche = json.load(json_file)
-        path = self._get_snapshot_path(source,step,format+'_concession')
-        if os.path.exists(path):
-            with open(path, encoding="utf-8") as json_file:
-                dico_concession = json.load(json_file)
+        self.flush()
+        dico_marche = self._timed_read(source,step,format+'_marche','DICTS_EXTENSION','read_dicts')
+        dico_concession = self._timed_read(source,step,format+'_concession','DICTS_EXTENSION','read_dicts')
         return dico_marche, dico_concession
 
 
+    def _timed_write(self,path:str,content:bytes,serialize_duration:float) -> None:
+        start = time.perf_counter()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        duration = serialize_duration + time.perf_counter() - start
+        size = len(content)
+        logging.info(f"Point de reprise {path} écrit ({self.backend.NAME}) : {size/1048576:.1f} Mo en {duration:.2f} s")
+
+    def _timed_read(self,source:str,step:Step,format:str,extension:str,read:str):
+        # Le point de reprise peut avoir été écrit au format historique (pickle)
+        for backend in (self.backend,self.legacy_backend):
+            path = self._get_snapshot_path(source,step,format,getattr(backend,extension))
+            if os.path.exists(path):
+                start = time.perf_counter()
+                data = getattr(backend,read)(path)
+                logging.info(f"Reprise depuis {path} ({backend.NAME}) en {time.perf_counter() - start:.2f} s")
+                return data
+        return None
+
+
     def bypass(self,source:str,step:Step) -> pd.DataFrame|dict:
         init_status = self._check_init_status(source)
         if init_status == Step.NONE:                # Previous launchnot found, need to process operation
@@ -156,6 +229,7 @@ class StepMngmt:
 
 
     def reset(self):
+        self.flush()
         self.current_status = {}
         self.init_status = {}
         with open(self.STATUS_FILEPATH, 'w') as json_file:
@@ -165,8 +239,8 @@ class StepMngmt:
     def get_status(self, source:str):
         return self.current_status[source] if source in self.current_status else None
 
-    def _get_snapshot_path(self,source:str,step:Step,format:str) -> str:
-        return self.BASE_PATH + source + '_'+ step.name + '_' + format + '.pkl'
+    def _get_snapshot_path(self,source:str,step:Step,format:str,extension:str='.pkl') -> str:
+        return self.BASE_PATH + source + '_'+ step.name + '_' + format + extension
 
 
     def _check_init_status(self,source:str):
@@ -176,12 +250,34 @@ class StepMngmt:
             return Step.NONE
 
 
-    def _update_status(self,source:str,step:Step):
+    def merge_status(self,status:dict):
+        """Intègre les statuts d'étapes produits par un autre processus (traitement parallèle des sources)"""
+        if status:
+            with self._status_lock:
+                self.current_status.update(status)
+                self._write_status(status.keys())
 
-        self.current_status[source] = step.value
 
-        with open(self.STATUS_FILEPATH, 'w') as json_file:
-            json.dump(self.current_status, json_file)
+    def _update_status(self,source:str,step:Step):
+        with self._status_lock:
+            self.current_status[source] = step.value
+            self._write_status([source])
+
+    def _write_status(self,sources):
+        # Plusieurs processus peuvent écrire le statut en parallèle : on conserve les sources
+        # enregistrées par les autres, on ne met à jour que les sources modifiées ici et on remplace
+        # le fichier de manière atomique
+        try:
+            with open(self.STATUS_FILEPATH, 'r') as json_file:
+                status = json.load(json_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            status = {}
+        for source in sources:
+            status[source] = self.current_status[source]
+        tmp_path = f"{self.STATUS_FILEPATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as json_file:
+            json.dump(status, json_file)
+        os.replace(tmp_path, self.STATUS_FILEPATH)
 
     def _empty_directory(self,path):
         # Vérifie si le répertoire existe
@@ -0,0 +1,116 @@
+import logging
+import os
+import pickle
+import threading
+import pandas as pd
+
+class UtilsCpv:
+    """
+    Nomenclature CPV 2008 (data/cpv_2008_fr.xls) indexée en mémoire.
+    Le fichier xls n'est lu qu'une fois : les index (codes, racine -> clé, codes pour lesquels
+    origineUE et origineFrance sont obligatoires) sont conservés dans un cache pickle (CACHE_PATH,
+    hors du dossier data), invalidé quand le fichier xls change, et chargés une seule fois par processus.
+    Les recherches portent sur une colonne entière (isin / map sur un dictionnaire) au lieu
+    d'un parcours de la nomenclature par marché.
+    """
+
+    XLS_PATH = os.path.join("data", "cpv_2008_fr.xls")
+    CACHE_PATH = os.path.join("old_metadata", "cpv_cache", "cpv_2008_fr.pkl")
+    CACHE_VERSION = 2
+
+    # Intervalles (racine.clé) des codes CPV pour lesquels origineUE et origineFrance sont obligatoires
+    ORIGIN_MANDATORY_RANGES = [
+        (15100000.9, 15982200.7),
+        (34100000.8, 34144910.0),
+        (34510000.5, 34522700.9),
+        (34600000.3, 34622500.8),
+        (34710000.7, 34722200.6),
+        (33100000.1, 33198200.6),
+        (33600000.6, 33698300.2),
+        (18100000.0, 18453000.9),
+        (18800000.7, 18843000.0)
+    ]
+
+    _index = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def index() -> dict:
+        """Index de la nomenclature : 'codes' (ensemble des codes), 'roots' (racine -> clé), 'origin_mandatory'"""
+        with UtilsCpv._lock:
+            signature = UtilsCpv._signature()
+            if UtilsCpv._index is None or UtilsCpv._index['signature'] != signature:
+                UtilsCpv._index = UtilsCpv._load_cache(signature)
+                if UtilsCpv._index is None:
+                    UtilsCpv._index = UtilsCpv._build(signature)
+                    UtilsCpv._store_cache(UtilsCpv._index)
+            return UtilsCpv._index
+
+    @staticmethod
+    def is_code(values:pd.Series) -> pd.Series:
+        """Vrai pour les codes complets (racine-clé) existant dans la nomenclature"""
+        return values.isin(UtilsCpv.index()['codes'])
+
+    @staticmethod
+    def is_root(values:pd.Series) -> pd.Series:
+        """Vrai pour les racines (8 chiffres) existant dans la nomenclature"""
+        return values.isin(UtilsCpv.index()['roots'].keys())
+
+    @staticmethod
+    def keys(roots:pd.Series, prefix:str = '') -> pd.Series:
+        """Clé de chaque racine précédée de prefix, chaîne vide si la racine n'existe pas"""
+        return (prefix + roots.map(UtilsCpv.index()['roots'])).fillna('')
+
+    @staticmethod
+    def generic_codes(values:pd.Series) -> pd.Series:
+        """Code le plus générique de la division (deux premiers caractères), racine seule si ce code n'existe pas"""
+        roots = values.str[:2] + '000000'
+        return roots + UtilsCpv.keys(roots, '-')
+
+    @staticmethod
+    def is_origin_mandatory(values:pd.Series) -> pd.Series:
+        """Vrai pour les codes CPV pour lesquels origineUE et origineFrance sont obligatoires"""
+        return values.isin(UtilsCpv.index()['origin_mandatory'])
+
+    @staticmethod
+    def _signature() -> tuple:
+        stat = os.stat(UtilsCpv.XLS_PATH)
+        return (UtilsCpv.CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def _build(signature:tuple) -> dict:
+        logging.info(f"Lecture de la nomenclature CPV {UtilsCpv.XLS_PATH}")
+        codes = pd.read_excel(UtilsCpv.XLS_PATH, engine="xlrd")['CODE'].dropna().astype(str).tolist()
+        roots = {}
+        for code in codes:
+            # La clé d'une racine est celle de sa première occurrence dans la nomenclature
+            roots.setdefault(code[:8], code[-1])
+        # Conversion numérique des codes comme dans mark_mixed_field : Series.replace ne remplace que
+        # les valeurs entières, les codes racine-clé ne sont donc pas convertis
+        with pd.option_context("future.no_silent_downcasting", True):
+            values = pd.to_numeric(pd.Series(codes, dtype=object).replace("-", ".").infer_objects(copy=False), errors='coerce')
+        mask = pd.Series(False, index=values.index)
+        for start, end in UtilsCpv.ORIGIN_MANDATORY_RANGES:
+            mask |= (values >= start) & (values <= end)
+        origin_mandatory = set(pd.Series(codes, dtype=object)[mask])
+        return {'signature': signature, 'codes': frozenset(codes), 'roots': roots, 'origin_mandatory': frozenset(origin_mandatory)}
+
+    @staticmethod
+    def _load_cache(signature:tuple) -> dict:
+        if not os.path.exists(UtilsCpv.CACHE_PATH):
+            return None
+        try:
+            with open(UtilsCpv.CACHE_PATH, 'rb') as f:
+                index = pickle.load(f)
+            return index if index.get('signature') == signature else None
+        except Exception as err:
+            logging.warning(f"Cache CPV {UtilsCpv.CACHE_PATH} illisible - {err}")
+            return None
+
+    @staticmethod
+    def _store_cache(index:dict) -> None:
+        os.makedirs(os.path.dirname(UtilsCpv.CACHE_PATH), exist_ok=True)
+        tmp_path = f"{UtilsCpv.CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, UtilsCpv.CACHE_PATH)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+class UtilsDedup:
+    """
+    Dédoublonnage des marchés et concessions sur une clé hachée.
+    Une empreinte 64 bits est calculée une seule fois par enregistrement à partir des colonnes
+    de la clé (colonne par colonne, les valeurs objet étant comparées sur leur représentation
+    texte comme avec astype(str)), puis les doublons sont résolus en un seul passage sur ce
+    tableau d'entiers, sans copie texte du dataframe complet.
+    """
+
+    PRIME = np.uint64(1099511628211)
+
+    @staticmethod
+    def hash_keys(df:pd.DataFrame, columns:list) -> np.ndarray:
+        """Retourne l'empreinte (uint64) des colonnes columns pour chaque ligne de df"""
+        keys = np.zeros(len(df), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for column in columns:
+                values = df[column]
+                if values.dtype == object or values.dtype == bool or isinstance(values.dtype, pd.CategoricalDtype):
+                    values = values.astype(str)
+                keys = keys * UtilsDedup.PRIME ^ pd.util.hash_pandas_object(values, index=False).values
+        return keys
+
+    @staticmethod
+    def keep_last(keys:np.ndarray, groups=None, order:pd.Series = None) -> tuple[np.ndarray,dict]:
+        """
+        Conserve le dernier enregistrement de chaque clé (dans l'ordre de order si renseigné, tri stable).
+
+        Args:
+            keys: empreintes des enregistrements (cf. hash_keys)
+            groups: type de chaque enregistrement, les doublons ne sont recherchés qu'au sein d'un même type
+            order: valeurs de tri des enregistrements (tmp__max_date par exemple)
+
+        Returns:
+            (positions des enregistrements conservés, dans l'ordre de tri, nombre de doublons supprimés par type)
+        """
+        positions = np.arange(len(keys))
+        if order is not None:
+            positions = pd.Series(np.asarray(order)).sort_values(kind='mergesort').index.values
+        groups = np.zeros(len(keys), dtype=bool) if groups is None else np.asarray(groups)
+        sorted_groups = groups[positions]
+        duplicated = pd.DataFrame({'group': sorted_groups, 'key': keys[positions]}).duplicated(keep='last').values
+        labels, counts = np.unique(sorted_groups[duplicated], return_counts=True)
+        return positions[~duplicated], dict(zip(labels.tolist(), counts.tolist()))
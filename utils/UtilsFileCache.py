@@ -0,0 +1,68 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+class UtilsFileCache:
+    """
+    Cache du résultat de l'étape CLEAN par fichier source.
+    La clé d'une entrée est l'empreinte du contenu du fichier, du schéma json de référence,
+    de la version du code de nettoyage (CODE_VERSION) et des paramètres de la source : un
+    fichier déjà nettoyé et validé lors d'une exécution précédente (reconstruction -b par exemple)
+    n'est ni relu, ni validé, ni ajouté de nouveau en base.
+    CODE_VERSION doit être incrémentée à chaque évolution de la lecture, de la normalisation
+    ou de la validation des fichiers.
+    """
+
+    CACHE_PATH = 'old_metadata/file_cache/'
+    CODE_VERSION = '1'
+    BLOCK_SIZE = 1 << 20
+
+    _scheme_hashes = {}
+
+    @staticmethod
+    def file_hash(path:str) -> str:
+        """Empreinte sha256 du contenu d'un fichier"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(UtilsFileCache.BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(path:str, scheme_path:str, params:dict) -> str:
+        """Clé de cache du fichier path"""
+        if scheme_path not in UtilsFileCache._scheme_hashes:
+            UtilsFileCache._scheme_hashes[scheme_path] = UtilsFileCache.file_hash(scheme_path)
+        content = {'file': UtilsFileCache.file_hash(path),
+                   'scheme': UtilsFileCache._scheme_hashes[scheme_path],
+                   'code': UtilsFileCache.CODE_VERSION,
+                   'params': params}
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _entry_path(source:str, key:str) -> str:
+        return f"{UtilsFileCache.CACHE_PATH}{source}/{key}.pkl"
+
+    @staticmethod
+    def load(source:str, key:str) -> dict:
+        """Retourne l'entrée de cache, None si elle n'existe pas ou n'est pas lisible"""
+        path = UtilsFileCache._entry_path(source, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as err:
+            logging.warning(f"Entrée de cache {path} illisible - {err}")
+            return None
+
+    @staticmethod
+    def store(source:str, key:str, entry:dict) -> None:
+        path = UtilsFileCache._entry_path(source, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
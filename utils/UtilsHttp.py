@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import requests
+
+class UtilsHttp:
+    """
+    Cache HTTP local basé sur les en-têtes ETag / Last-Modified.
+    Pour chaque url on conserve les validateurs renvoyés par le serveur (et
+    éventuellement le contenu) afin d'envoyer des requêtes conditionnelles : une
+    réponse 304 évite de télécharger de nouveau la ressource.
+    Une entrée de cache est stockée par url (pas d'index partagé) pour que plusieurs
+    processus puissent utiliser le cache en même temps.
+    """
+
+    CACHE_PATH = 'old_metadata/http_cache/'
+    TIMEOUT = 60
+
+    @staticmethod
+    def _entry_path(url:str) -> str:
+        return UtilsHttp.CACHE_PATH + hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _load_entry(url:str) -> dict:
+        try:
+            with open(UtilsHttp._entry_path(url) + '.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _conditional_headers(entry:dict) -> dict:
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    @staticmethod
+    def store(url:str, headers, body_path:str = None) -> None:
+        """Enregistre les validateurs d'une réponse et, si body_path est renseigné, une copie du contenu"""
+        entry = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+        if not entry['etag'] and not entry['last_modified']:
+            return
+        os.makedirs(UtilsHttp.CACHE_PATH, exist_ok=True)
+        path = UtilsHttp._entry_path(url)
+        if body_path is not None:
+            shutil.copy(body_path, path + '.body')
+            entry['body'] = True
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path + '.json')
+
+    @staticmethod
+    def download(url:str, file_path:str) -> bool:
+        """
+        Télécharge url dans file_path avec une requête conditionnelle. Si le serveur répond 304,
+        le contenu est restauré depuis le cache sans téléchargement.
+
+        Returns:
+            True si la ressource n'a pas été modifiée depuis le dernier téléchargement
+        """
+        entry = UtilsHttp._load_entry(url)
+        body_path = UtilsHttp._entry_path(url) + '.body'
+        headers = UtilsHttp._conditional_headers(entry) if entry.get('body') and os.path.exists(body_path) else {}
+        response = requests.get(url, headers=headers, timeout=UtilsHttp.TIMEOUT)
+        if response.status_code == 304:
+            shutil.copy(body_path, file_path)
+            logging.info(f"Ressource {url} non modifiée (304), utilisation du cache")
+            return True
+        response.raise_for_status()
+        with open(file_path, 'wb') as f:
+            f.write(response.content)
+        UtilsHttp.store(url, response.headers, file_path)
+        return False
+
+    @staticmethod
+    def not_modified(url:str, conditional:bool = True) -> tuple[bool, dict]:
+        """
+        Interroge le serveur (requête HEAD, conditionnelle si conditional est vrai) pour savoir si la 
+        ressource a changé depuis le dernier téléchargement enregistré.
+
+        Returns:
+            (True si réponse 304, en-têtes de la réponse à enregistrer après téléchargement)
+        """
+        headers = UtilsHttp._conditional_headers(UtilsHttp._load_entry(url)) if conditional else {}
+        try:
+            response = requests.head(url, headers=headers, timeout=UtilsHttp.TIMEOUT, allow_redirects=True)
+        except requests.RequestException as err:
+            logging.warning(f"Requête conditionnelle impossible pour {url} - {err}")
+            return False, {}
+        return bool(headers) and response.status_code == 304, response.headers
@@ -0,0 +1,183 @@
+import codecs
+import json
+import logging
+import re
+import ijson
+
+class UtilsJsonReader:
+    """
+    Lecture en flux des fichiers json DECP : les enregistrements des tableaux
+    marches.marche[*] et marches.contrat-concession[*] sont décodés un par un,
+    sans charger le document entier en mémoire.
+    Les fichiers utf-8 sont lus avec ijson, les autres encodages (qu'ijson ne sait pas
+    décoder) par un lecteur par blocs basé sur json.JSONDecoder.raw_decode. Dans les deux cas
+    le fichier n'est lu qu'une fois, quel que soit le nombre de tags demandés.
+    """
+
+    RECORD_TAGS = ('marche','contrat-concession')
+    BATCH_SIZE = 20000
+
+    @staticmethod
+    def iter_records(path:str, encoding:str = 'utf-8', record_tags:tuple = RECORD_TAGS):
+        """
+        Retourne au fil de l'eau des tuples (tag, enregistrement) pour chaque élément
+        des tableaux marches.<tag> avec tag dans record_tags.
+        """
+        if encoding is None or encoding.lower().replace('_','-') in ('utf-8','utf8','utf-8-sig'):
+            with open(path, 'rb') as f:
+                # Marque d'ordre des octets (BOM) utf-8 éventuelle, refusée par ijson
+                if f.read(3) != codecs.BOM_UTF8:
+                    f.seek(0)
+                yield from UtilsJsonReader._iter_ijson(f, record_tags)
+        else:
+            with open(path, 'r', encoding=encoding if encoding else 'utf-8') as f:
+                yield from _JsonStreamScanner(f).iter_records(record_tags)
+
+    @staticmethod
+    def _iter_ijson(file, record_tags:tuple):
+        """Parcours unique des évènements ijson, aiguillés vers le tag dont le préfixe correspond"""
+        prefixes = {f"marches.{tag}.item": tag for tag in record_tags}
+        events = ijson.parse(file, use_float=True)
+        for prefix, event, value in events:
+            tag = prefixes.get(prefix)
+            if tag is None:
+                continue
+            if event not in ('start_map', 'start_array'):
+                yield tag, value
+                continue
+            # Construction de l'enregistrement jusqu'à la fin de l'objet (ou de la liste) ouvert
+            builder = ijson.common.ObjectBuilder()
+            depth = 0
+            while True:
+                builder.event(event, value)
+                if event in ('start_map', 'start_array'):
+                    depth += 1
+                elif event in ('end_map', 'end_array'):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                prefix, event, value = next(events)
+            yield tag, builder.value
+
+    @staticmethod
+    def iter_batches(path:str, batch_size:int = BATCH_SIZE, encoding:str = 'utf-8', record_tags:tuple = RECORD_TAGS):
+        """
+        Regroupe les enregistrements lus par iter_records en listes d'au plus batch_size
+        éléments d'un même tag. Retourne des tuples (tag, liste d'enregistrements).
+        """
+        batch, batch_tag = [], None
+        for tag, record in UtilsJsonReader.iter_records(path, encoding, record_tags):
+            if batch and (tag != batch_tag or len(batch) >= batch_size):
+                yield batch_tag, batch
+                batch = []
+            batch_tag = tag
+            batch.append(record)
+        if batch:
+            yield batch_tag, batch
+
+
+class _JsonStreamScanner:
+    """Lecteur par blocs d'un document {"marches": {"<tag>": [...], ...}}"""
+
+    CHUNK_SIZE = 1 << 20
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, file, chunk_size:int = CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size:int = None) -> bool:
+        if self.eof:
+            return False
+        data = self.file.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            self.pos = self.WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char:str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Caractère '{char}' attendu, '{found}' trouvé")
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # Un nombre en fin de bloc peut être tronqué : on complète le bloc avant de conclure
+                if end < len(self.buf) or not self._fill():
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                # Valeur incomplète : lecture d'un bloc au moins aussi grand que la partie déjà lue
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+
+    def _iter_array(self, tag:str):
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield tag, self._value()
+            if self._peek() == ',':
+                self.pos += 1
+            else:
+                self._expect(']')
+                return
+
+    def _iter_object(self, handler):
+        """Parcourt les clés d'un objet, handler(key) traite la valeur associée"""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            yield from handler(key)
+            if self._peek() == ',':
+                self.pos += 1
+            else:
+                self._expect('}')
+                return
+
+    def iter_records(self, record_tags:tuple):
+        def skip(key):
+            self._value()
+            return
+            yield
+
+        def marches_handler(key):
+            if key in record_tags and self._peek() == '[':
+                self.pos += 1
+                yield from self._iter_array(key)
+            else:
+                if key in record_tags:
+                    logging.warning(f"Une liste est attendue pour le noeud marches.{key}")
+                yield from skip(key)
+
+        def root_handler(key):
+            if key == 'marches' and self._peek() == '{':
+                yield from self._iter_object(marches_handler)
+            else:
+                yield from skip(key)
+
+        if self._peek() == '\ufeff':
+            self.pos += 1
+        yield from self._iter_object(root_handler)
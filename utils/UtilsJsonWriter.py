@@ -0,0 +1,62 @@
+import json
+import logging
+import orjson
+
+class UtilsJsonWriter:
+    """
+    Ecriture des fichiers json DECP.
+    Deux mises en forme sont proposées : compacte (pretty=False) pour les fichiers internes
+    (points de reprise, extractions de la base) et indentée (pretty=True) pour les fichiers lus
+    par un humain ou publiés, identique à json.dump(..., indent=indent, ensure_ascii=False).
+    La sérialisation est faite par orjson, sauf pour une indentation autre que 2 qu'elle ne propose
+    pas. Un objet qu'orjson ne sait pas sérialiser est confié au module json standard.
+    """
+
+    @staticmethod
+    def dumps(obj, pretty:bool = False, indent:int = 2) -> str:
+        """Retourne le texte json de obj (caractères non ascii conservés), indenté de indent espaces si pretty"""
+        try:
+            if not pretty or indent == 2:
+                option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                if pretty:
+                    option |= orjson.OPT_INDENT_2
+                return orjson.dumps(obj, option=option).decode('utf-8')
+        except (TypeError, ValueError, OverflowError) as err:
+            logging.debug(f"Sérialisation orjson impossible, utilisation du module json - {err}")
+        if pretty:
+            return json.dumps(obj, indent=indent, ensure_ascii=False)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def dump(obj, file, pretty:bool = False, indent:int = 2) -> None:
+        """Ecrit le texte json de obj dans le fichier file, ouvert en mode texte"""
+        file.write(UtilsJsonWriter.dumps(obj, pretty, indent))
+
+
+class JsonListWriter:
+    """
+    Ecriture en flux d'une liste json, enregistrement par enregistrement.
+    En mise en forme indentée, le résultat est le même que json.dump(..., indent=2) pour une liste
+    située à la profondeur depth du document ; le crochet ouvrant est écrit par l'appelant.
+    """
+
+    def __init__(self, file, depth:int = 1, pretty:bool = True):
+        self.file = file
+        self.pretty = pretty
+        self.indent = ' ' * (2 * depth)
+        self.count = 0
+
+    def write(self, item) -> None:
+        text = UtilsJsonWriter.dumps(item, self.pretty)
+        if self.pretty:
+            text = (',\n' if self.count else '\n') + self.indent + text.replace('\n', '\n' + self.indent)
+        elif self.count:
+            text = ',' + text
+        self.file.write(text)
+        self.count += 1
+
+    def close(self) -> None:
+        if self.pretty and self.count:
+            self.file.write('\n' + self.indent[2:] + ']')
+        else:
+            self.file.write(']')
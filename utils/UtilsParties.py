@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+class UtilsParties:
+    """
+    Eclatement en colonnes des listes de parties d'un contrat (titulaires, concessionnaires...).
+    Les listes de toutes les lignes sont parcourues une seule fois pour produire des tableaux à plat
+    (ligne, rang, partie) ; chaque colonne <prefix>_<champ>_<rang> est ensuite remplie par indexation
+    positionnelle d'un tableau (lignes x rangs), sans construire de pd.Series par ligne.
+    Les valeurs d'une ligne sont converties comme l'aurait fait le pd.Series de la ligne : une ligne
+    qui ne contient que des nombres et des None (mais pas uniquement des None) passe en float.
+    """
+
+    # Nature des valeurs, pour la conversion des lignes : 0 None, 1 entier, 2 float, 3 autre
+    KINDS = {type(None): 0, int: 1, float: 2}
+
+    @staticmethod
+    def normalize_titulaires(row:list) -> list:
+        """
+        Liste des titulaires d'une ligne : les éléments {'titulaire': {...}} sont remplacés par leur contenu
+        (None si la clé titulaire est absente)
+        """
+        return [item.get('titulaire') if isinstance(item, dict) else item for item in row]
+
+    @staticmethod
+    def normalize_concessionnaires(row:list) -> list:
+        """
+        Liste des concessionnaires d'une ligne : les éléments {'concessionnaire': {...}} sont remplacés
+        par leur contenu et une liste de listes est ramenée à sa première liste
+        """
+        # le traitement ici à lieux car comme on dit : "Garbage in, garbage out" mais on est gentil on corrige leurs formats -_-
+        if row and isinstance(row[0], dict) and 'concessionnaire' in row[0].keys():
+            row = [item['concessionnaire'] for item in row]
+        if row and isinstance(row[0], list):
+            row = row[0]
+        return row
+
+    @staticmethod
+    def explode(values:pd.Series, prefix:str, fields:list, slots:int = 3, normalize = None, missing = np.nan) -> pd.DataFrame:
+        """
+        Retourne un dataframe (même index que values) avec les colonnes <prefix>_<champ>_<rang> pour
+        les rangs 1 à slots et les champs fields, dans l'ordre rang puis champ.
+
+        Args:
+            values: listes de parties (une valeur qui n'est pas une liste, ou une partie qui n'est pas
+                un dictionnaire, ne produit aucune partie)
+            prefix: préfixe des colonnes produites
+            fields: clés des parties à extraire
+            slots: nombre de parties conservées par ligne (les premières)
+            normalize: fonction appliquée à chaque liste avant la sélection des premières parties
+            missing: valeur des rangs sans partie
+        """
+        rows, ranks, parties = [], [], []
+        for i, items in enumerate(values.values):
+            if not isinstance(items, list):
+                continue
+            if normalize is not None:
+                items = normalize(items)
+            for rank, party in enumerate(items[:slots]):
+                # Une partie vide laisse le rang non renseigné
+                if party and isinstance(party, dict):
+                    rows.append(i)
+                    ranks.append(rank)
+                    parties.append(party)
+
+        rows = np.asarray(rows, dtype=np.intp)
+        ranks = np.asarray(ranks, dtype=np.intp)
+        columns, kinds = {}, []
+        for field in fields:
+            grid = np.full((len(values), slots), missing, dtype=object)
+            grid_kinds = np.full((len(values), slots), UtilsParties.KINDS.get(type(missing), 3), dtype=np.int8)
+            # Remplissage élément par élément : des valeurs qui sont des listes de même longueur
+            # seraient sinon diffusées en un tableau à deux dimensions
+            flat = np.empty(len(parties), dtype=object)
+            flat_kinds = np.empty(len(parties), dtype=np.int8)
+            for position, party in enumerate(parties):
+                flat[position] = value = party.get(field, np.nan)
+                flat_kinds[position] = UtilsParties.KINDS.get(type(value), 3)
+            grid[rows, ranks] = flat
+            grid_kinds[rows, ranks] = flat_kinds
+            columns[field] = grid
+            kinds.append(grid_kinds)
+
+        # Lignes converties en float : que des nombres et des None, dont au moins un None ou un float
+        kinds = np.concatenate(kinds, axis=1)
+        to_float = (kinds != 3).all(axis=1) & (kinds != 0).any(axis=1) & (kinds != 1).any(axis=1)
+        if to_float.any():
+            for field in fields:
+                columns[field][to_float] = columns[field][to_float].astype(float)
+
+        result = {}
+        for rank in range(slots):
+            for field in fields:
+                result[f'{prefix}_{field}_{rank + 1}'] = columns[field][:, rank]
+        return pd.DataFrame(result, index=values.index).infer_objects()
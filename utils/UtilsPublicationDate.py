@@ -0,0 +1,107 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+class UtilsPublicationDate:
+    """
+    Index des dates de publication des marchés et concessions.
+    Les dates candidates (datePublicationDonnees, dates de publication des modifications et des
+    actes de sous-traitance) sont extraites en une passe dans des tableaux à plat, puis
+    comparées et converties en un seul appel vectorisé au lieu d'un pd.to_datetime par valeur.
+    """
+
+    MIN_DATE = pd.Timestamp("2024-01-01")
+    TIMEZONE = r'(Z|[+-]\d{2}:\d{2})$'
+
+    @staticmethod
+    def to_datetime(values) -> pd.Series:
+        """Conversion vectorisée en datetime (NaT si non convertible), le fuseau horaire éventuel est ignoré"""
+        values = pd.Series(values, dtype=object)
+        text = values.map(lambda x: x if isinstance(x, str) else x.isoformat() if isinstance(x, datetime.date) and not pd.isna(x) else np.nan)
+        text = text.str.replace(UtilsPublicationDate.TIMEZONE, '', regex=True)
+        return pd.to_datetime(text, format='mixed', errors='coerce')
+
+    @staticmethod
+    def max_dates(records:list, default_date_str:str) -> list:
+        """
+        Retourne, pour chaque enregistrement, la plus grande date (comparaison de chaînes) parmi
+        datePublicationDonnees, modifications[].modification.datePublicationDonneesModification et
+        actesSousTraitance[].acteSousTraitance.datePublicationDonnees.
+        Si cette date n'est pas une date valide, default_date_str est retournée.
+        """
+        positions, dates = [], []
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                continue
+            positions.append(i)
+            dates.append(record.get('datePublicationDonnees'))
+            for node, key, date_key in (('modifications', 'modification', 'datePublicationDonneesModification'),
+                                        ('actesSousTraitance', 'acteSousTraitance', 'datePublicationDonnees')):
+                items = record.get(node)
+                if not isinstance(items, list):
+                    continue
+                for item in items:
+                    if isinstance(item, dict) and isinstance(item.get(key), dict) and date_key in item[key]:
+                        positions.append(i)
+                        dates.append(item[key][date_key])
+
+        result = [default_date_str] * len(records)
+        if not positions:
+            return result
+        candidates = pd.Series(dates, index=positions, dtype=object)
+        candidates = candidates[candidates.map(lambda x: isinstance(x, str))]
+        maxima = candidates.groupby(level=0).max()
+        parsed = UtilsPublicationDate.to_datetime(maxima.values)
+        for i, date, valid in zip(maxima.index, maxima.values, parsed.notna().values):
+            if valid:
+                result[i] = date
+        return result
+
+    @staticmethod
+    def modification_maxima(modifications:pd.Series) -> tuple[pd.Series,pd.Series]:
+        """
+        Retourne, pour chaque ligne, le plus grand id de modification (0 si aucune) et la plus grande
+        date de publication des modifications (NaT si aucune date valide).
+        """
+        positions, ids, dates = [], [], []
+        for i, items in enumerate(modifications.values):
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if isinstance(item, dict) and isinstance(item.get('modification'), dict):
+                    positions.append(i)
+                    ids.append(item['modification'].get('id'))
+                    dates.append(item['modification'].get('datePublicationDonneesModification'))
+
+        max_ids = np.zeros(len(modifications), dtype=object)
+        max_dates = pd.Series(pd.NaT, index=range(len(modifications)), dtype='datetime64[ns]')
+        if positions:
+            flat = pd.DataFrame({'id': pd.Series(ids, dtype=object), 'date': UtilsPublicationDate.to_datetime(dates)}, index=positions)
+            grouped = flat.groupby(level=0)
+            ids_max = grouped['id'].max()
+            max_ids[ids_max.index.values] = ids_max.fillna(0).values
+            dates_max = grouped['date'].max()
+            max_dates.iloc[dates_max.index.values] = dates_max.values
+        return pd.Series(max_ids, index=modifications.index), pd.Series(max_dates.values, index=modifications.index)
+
+    @staticmethod
+    def add_publication_dates(df:pd.DataFrame) -> None:
+        """
+        Complète le dataframe avec les colonnes tmp__idModification, tmp__dateModification (la plus
+        grande date entre la publication des données et celle des modifications, au plus tôt MIN_DATE)
+        et tmp__annee_mois (si non renseignée).
+        """
+        df['datePublicationDonnees'] = UtilsPublicationDate.to_datetime(df['datePublicationDonnees'].values).values
+        if 'modifications' in df.columns:
+            df['tmp__idModification'], modification_dates = UtilsPublicationDate.modification_maxima(df['modifications'])
+        else:
+            modification_dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        dates = pd.concat([df['datePublicationDonnees'], modification_dates], axis=1).max(axis=1)
+        dates = dates.fillna(UtilsPublicationDate.MIN_DATE).clip(lower=UtilsPublicationDate.MIN_DATE)
+        df['tmp__dateModification'] = dates
+        if 'tmp__annee_mois' in df.columns:
+            df['tmp__annee_mois'] = df['tmp__annee_mois'].where(df['tmp__annee_mois'].notna(), dates.dt.strftime('%Y-%m'))
+        else:
+            df['tmp__annee_mois'] = dates.dt.strftime('%Y-%m')
+        df['tmp__dateModification'] = df['tmp__dateModification'].astype(str)
+        df['datePublicationDonnees'] = df['datePublicationDonnees'].astype(str)
@@ -0,0 +1,114 @@
+import contextlib
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import best_match
+
+class UtilsSchema:
+    """
+    Validation des enregistrements DECP (marche, contrat-concession) selon le schéma json de référence.
+    Le schéma est chargé et vérifié une seule fois par processus, puis découpé en un validateur par
+    type d'enregistrement : chaque enregistrement est validé directement, sans l'envelopper dans un
+    document {'marches': {...}} complet. Les chemins d'erreur restent ceux de la validation du document
+    complet ($.marches.<type>[0]...).
+    """
+
+    SCHEME_PATH = 'schemes/schema_decp_v2.0.4.json'
+    RECORD_TYPES = ('marche','contrat-concession')
+    CHUNK_SIZE = 2000       # Nombre d'enregistrements validés par tâche en mode multi-processus
+
+    _validators = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_validator(record_type:str, scheme_path:str = SCHEME_PATH) -> Draft7Validator:
+        """Retourne le validateur (mis en cache) des enregistrements de type record_type"""
+        key = (scheme_path, record_type)
+        validator = UtilsSchema._validators.get(key)
+        if validator is None:
+            with UtilsSchema._lock:
+                if key not in UtilsSchema._validators:
+                    UtilsSchema._compile(scheme_path)
+                validator = UtilsSchema._validators[key]
+        return validator
+
+    @staticmethod
+    def _compile(scheme_path:str) -> None:
+        with open(scheme_path, "r", encoding='utf-8') as json_file:
+            scheme = json.load(json_file)
+        Draft7Validator.check_schema(scheme)
+        items = scheme['properties']['marches']['properties']
+        for record_type in UtilsSchema.RECORD_TYPES:
+            # Sous-schéma équivalent à marches.<type>.items, les références #/definitions/... restant
+            # résolues dans le document : en draft 7, $ref remplace les autres mots-clés du schéma
+            sub_scheme = {'$schema': scheme['$schema'], '$ref': items[record_type]['items']['$ref'], 'definitions': scheme['definitions']}
+            UtilsSchema._validators[(scheme_path, record_type)] = Draft7Validator(sub_scheme)
+
+    @staticmethod
+    def validate_record(record:dict, record_type:str, best:bool = False, scheme_path:str = SCHEME_PATH) -> tuple[bool,str,str]:
+        """
+        Valide un enregistrement de type record_type.
+
+        Args:
+
+            record: marché ou concession à valider
+            record_type: 'marche' ou 'contrat-concession'
+            best: si vrai, l'erreur retournée est la plus pertinente (comme jsonschema.validate),
+                sinon la première rencontrée (comme Draft7Validator.validate)
+
+        Returns:
+            (valide, message d'erreur, chemin de l'erreur)
+        """
+        validator = UtilsSchema.get_validator(record_type, scheme_path)
+        if best:
+            error = best_match(validator.iter_errors(record))
+        else:
+            error = next(iter(validator.iter_errors(record)), None)
+        if error is None:
+            return True, None, None
+        return False, error.message, f"$.marches.{record_type}[0]" + error.json_path[1:]
+
+    @staticmethod
+    @contextlib.contextmanager
+    def pool(workers:int, scheme_path:str = SCHEME_PATH):
+        """
+        Pool de workers processus de validation, à partager entre les appels à validate_records
+        (fichiers et types d'enregistrements) d'une même étape. Chaque processus compile les
+        validateurs à son démarrage. Retourne None si workers <= 1 (validation dans le processus courant).
+        """
+        if workers <= 1:
+            yield None
+            return
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scheme_path,)) as executor:
+            yield executor
+
+    @staticmethod
+    def validate_records(records:list, record_type:str, best:bool = False, executor:ProcessPoolExecutor = None, chunk_size:int = CHUNK_SIZE, scheme_path:str = SCHEME_PATH) -> list:
+        """
+        Valide une liste d'enregistrements de type record_type, en parallèle par paquets de chunk_size
+        enregistrements dans executor (cf. pool) s'il est fourni.
+
+        Returns:
+            liste, dans l'ordre de records, des tuples (valide, message d'erreur, chemin de l'erreur)
+            (None pour un enregistrement None)
+        """
+        if executor is None or len(records) <= chunk_size:
+            return _validate_chunk(records, record_type, best, scheme_path)
+        chunks = [records[i:i+chunk_size] for i in range(0, len(records), chunk_size)]
+        results = []
+        # map restitue les résultats dans l'ordre des paquets
+        for chunk_results in executor.map(_validate_chunk, chunks, [record_type]*len(chunks), [best]*len(chunks), [scheme_path]*len(chunks)):
+            results.extend(chunk_results)
+        return results
+
+
+def _init_worker(scheme_path:str) -> None:
+    """Initialisation d'un processus de validation : compilation des validateurs de chaque type"""
+    for record_type in UtilsSchema.RECORD_TYPES:
+        UtilsSchema.get_validator(record_type, scheme_path)
+
+
+def _validate_chunk(records:list, record_type:str, best:bool, scheme_path:str) -> list:
+    """Point d'entrée d'un processus de validation : le validateur est compilé une fois par processus"""
+    return [UtilsSchema.validate_record(record, record_type, best, scheme_path) if record is not None else None for record in records]
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from stdnum.util import clean
+
+class UtilsSiret:
+    """
+    Contrôle vectorisé des numéros SIRET (14 chiffres, clé de Luhn), équivalent à
+    stdnum.luhn.validate appliqué après suppression des espaces et des points.
+    Les numéros uniques d'une colonne sont convertis en une matrice de chiffres (uint8)
+    dont la clé de Luhn est calculée colonne par colonne. Le résultat de chaque numéro
+    est mémorisé pour la durée du processus : les mêmes acheteurs et titulaires
+    reviennent d'un mois à l'autre.
+    """
+
+    LENGTH = 14
+    # Chiffres doublés par l'algorithme de Luhn : un sur deux en partant de l'avant-dernier
+    DOUBLED = np.arange(LENGTH) % 2 == LENGTH % 2
+
+    _cache = {}
+
+    @staticmethod
+    def is_valid(values:pd.Series) -> pd.Series:
+        """Vrai pour les valeurs (converties en texte) qui sont des numéros SIRET valides"""
+        text = values.astype(str)
+        unknown = [value for value in pd.unique(text.values) if value not in UtilsSiret._cache]
+        if unknown:
+            UtilsSiret._cache.update(zip(unknown, UtilsSiret._validate(unknown).tolist()))
+        return text.map(UtilsSiret._cache).astype(bool)
+
+    @staticmethod
+    def _validate(values:list) -> np.ndarray:
+        """Contrôle d'une liste de textes, retourne un tableau de booléens"""
+        cleaned = pd.Series(values, dtype=object)
+        is_ascii = cleaned.map(str.isascii)
+        cleaned[is_ascii] = cleaned[is_ascii].str.replace(r'[ .]', '', regex=True).str.strip()
+        # Caractères non ascii : normalisation des caractères proches des chiffres par stdnum
+        cleaned[~is_ascii] = [clean(value, ' .').strip() for value in cleaned[~is_ascii]]
+        candidates = (cleaned.str.len() == UtilsSiret.LENGTH) & cleaned.map(str.isascii)
+
+        result = np.zeros(len(values), dtype=bool)
+        if candidates.any():
+            digits = np.frombuffer(''.join(cleaned[candidates]).encode('ascii'), dtype=np.uint8)
+            digits = digits.reshape(-1, UtilsSiret.LENGTH).astype(np.int16) - ord('0')
+            numeric = ((digits >= 0) & (digits <= 9)).all(axis=1)
+            doubled = digits[:, UtilsSiret.DOUBLED] * 2
+            total = digits[:, ~UtilsSiret.DOUBLED].sum(axis=1) + (doubled - 9 * (doubled > 9)).sum(axis=1)
+            result[candidates.values] = numeric & (total % 10 == 0)
+        return result
@@ -0,0 +1,36 @@
+from reporting.Report import Report
+from utils.StepMngmt import StepMngmt
+
+class UtilsWorker:
+    """
+    Exécution d'un traitement dans un processus d'un pool (sources de decp-rama, mois de decp-augmente).
+    Les statistiques, messages et statuts d'étape produits dans le processus sont renvoyés au
+    processus principal qui les fusionne avec merge, dans un ordre déterministe.
+    """
+
+    @staticmethod
+    def run(report:Report, func, *args):
+        """
+        Point d'entrée d'un processus du pool : appelle func(*args) et retourne
+        (résultat, statistiques, messages, statuts d'étape modifiés).
+        report est le rapport utilisé par func, remis à zéro avant l'appel (None si func
+        n'utilise pas de compteurs cumulés).
+        """
+        # Les membres de classe du Report sont hérités du processus parent, on repart de zéro
+        Report.statistics = []
+        Report.messages = {}
+        if report is not None:
+            report.init()
+        step = StepMngmt()
+        before = dict(step.current_status)
+        result = func(*args)
+        # Les statuts ne sont à jour qu'une fois les points de reprise écrits
+        step.flush()
+        status = {source: value for source,value in step.current_status.items() if before.get(source) != value}
+        return result, Report.statistics, Report.messages, status
+
+    @staticmethod
+    def merge(report:Report, statistics:list, messages:dict, status:dict) -> None:
+        """Intègre dans le processus principal les statistiques, messages et statuts d'un processus du pool"""
+        report.merge(statistics,messages)
+        StepMngmt().merge_status(status)
@@ -0,0 +1,72 @@
+from lxml import etree
+
+class UtilsXml:
+    """
+    Lecture incrémentale des fichiers xml DECP. Les enregistrements (marche,
+    contrat-concession) fils de la racine <marches> sont convertis un par un en
+    dictionnaires au même format que xmltodict.parse(..., dict_constructor=dict,
+    force_list=...), puis libérés de l'arbre : la mémoire consommée ne dépend
+    pas de la taille du fichier.
+    """
+
+    RECORD_TAGS = ('marche','contrat-concession')
+    FORCE_LIST = ('marche','contrat-concession',
+                  'titulaires','donneesExecution','modifications',
+                  'actesSousTraitance','modificationsActesSousTraitance')
+
+    @staticmethod
+    def iter_records(path:str, encoding:str = None, record_tags:tuple = RECORD_TAGS, force_list:tuple = FORCE_LIST):
+        """
+        Parcourt le fichier xml et retourne au fil de l'eau des tuples (tag, dictionnaire)
+        pour chaque enregistrement dont le tag est dans record_tags.
+
+        Args:
+            path: chemin du fichier xml
+            encoding: encodage forcé du fichier (sinon celui déclaré dans le fichier)
+            record_tags: tags des enregistrements, fils directs de la racine
+            force_list: tags dont la valeur est toujours une liste (cf. xmltodict)
+        """
+        depth = 0
+        context = etree.iterparse(path, events=('start','end'), encoding=encoding, huge_tree=True, remove_comments=True)
+        for event, elem in context:
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            tag = UtilsXml._name(elem)
+            if tag in record_tags:
+                yield tag, UtilsXml._to_dict(elem, force_list)
+            # Libération de l'enregistrement traité et des précédents
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        del context
+
+    @staticmethod
+    def _name(elem) -> str:
+        qname = etree.QName(elem)
+        return f"{elem.prefix}:{qname.localname}" if elem.prefix else qname.localname
+
+    @staticmethod
+    def _to_dict(elem, force_list:tuple):
+        text = elem.text.strip() if elem.text is not None and elem.text.strip() else None
+        children = [child for child in elem if isinstance(child.tag, str)]
+        if not children and not elem.attrib:
+            return text
+        result = {'@'+etree.QName(name).localname: value for name, value in elem.attrib.items()}
+        for child in children:
+            key = UtilsXml._name(child)
+            value = UtilsXml._to_dict(child, force_list)
+            if key in result:
+                if not isinstance(result[key], list):
+                    result[key] = [result[key]]
+                result[key].append(value)
+            elif key in force_list:
+                result[key] = [value]
+            else:
+                result[key] = value
+        if text is not None:
+            result['#text'] = text
+        return result